@@ -0,0 +1,288 @@
+# Agenda das UBS: horários de atendimento por unidade e horários livres.
+# Cada UBS tem abertura, fechamento, duração da consulta e dias de atendimento
+# (tabela ubs_horario; sem linha, valem os padrões abaixo). As consultas já
+# marcadas ficam num índice em memória (início de cada consulta, ordenado por
+# UBS) consultado com bisect; o índice é recarregado quando a versão da agenda
+# (consulta_versao) muda: a tabela consulta a incrementa por triggers, como em
+# ubs_versao, e definir_horario na mesma transação que altera ubs_horario, então
+# todos os processos recarregam os horários.
+# A marcação é feita com BEGIN IMMEDIATE e o conflito é conferido no banco,
+# então dois médicos não conseguem marcar o mesmo horário.
+# Uso: python agenda_ubs.py <id_ubs> <abertura HH:MM> <fechamento HH:MM> [--duracao MIN] [--dias 12345]
+import argparse
+import heapq
+import re
+import threading
+from bisect import bisect_right, insort
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+import consultas
+from conexao import conectar
+
+ABERTURA = "08:00"
+FECHAMENTO = "17:00"
+DURACAO_CONSULTA = 30  # minutos
+DIAS_ATENDIMENTO = "12345"  # dias da semana ISO (1 = segunda)
+HORIZONTE_DIAS = 30  # até onde procurar horários livres
+DB_PATH = "clinica.db"
+STATUS_CANCELADA = "Cancelada"
+MAX_UBS_BUSCA = 10
+
+Horario = namedtuple("Horario", "abertura fechamento duracao dias")
+HORARIO_PADRAO = Horario(ABERTURA, FECHAMENTO, DURACAO_CONSULTA, DIAS_ATENDIMENTO)
+_EPOCA = datetime(2000, 1, 1)
+
+
+class HorarioIndisponivel(Exception):
+    pass
+
+
+def criar_esquema(conn):
+    # Sem commit: roda dentro da transação da migração
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ubs_horario (
+            id_ubs INTEGER PRIMARY KEY REFERENCES ubs(id),
+            abertura TEXT NOT NULL,
+            fechamento TEXT NOT NULL,
+            duracao INTEGER NOT NULL,
+            dias TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS consulta_versao (versao INTEGER NOT NULL)")
+    conn.execute("INSERT INTO consulta_versao (versao) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM consulta_versao)")
+    for evento in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS consulta_versao_{evento.lower()} AFTER {evento} ON consulta
+            BEGIN UPDATE consulta_versao SET versao = versao + 1; END
+        """)
+    # Conferência de conflito: consultas de uma UBS numa faixa de horário
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_consulta_ubs_data ON consulta (id_ubs, data_hora)")
+
+
+def definir_horario(conn, id_ubs, abertura=ABERTURA, fechamento=FECHAMENTO,
+                    duracao=DURACAO_CONSULTA, dias=DIAS_ATENDIMENTO):
+    # A versão da agenda sobe na mesma transação: os outros processos recarregam
+    # os horários na próxima consulta à agenda
+    for hhmm in (abertura, fechamento):
+        if not re.fullmatch(r"([01]\d|2[0-3]):[0-5]\d", hhmm):
+            raise ValueError(f"Horário inválido: {hhmm} (use HH:MM).")
+    if not dias or not set(dias) <= set("1234567"):
+        raise ValueError(f"Dias inválidos: {dias} (dias da semana ISO, 1 = segunda).")
+    if int(duracao) <= 0 or _minutos(abertura) + int(duracao) > _minutos(fechamento):
+        raise ValueError("O horário de fechamento deve ser depois da abertura mais uma consulta.")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("""
+            INSERT INTO ubs_horario (id_ubs, abertura, fechamento, duracao, dias) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (id_ubs) DO UPDATE SET
+                abertura = excluded.abertura, fechamento = excluded.fechamento,
+                duracao = excluded.duracao, dias = excluded.dias
+        """, (id_ubs, abertura, fechamento, int(duracao), dias))
+        conn.execute("UPDATE consulta_versao SET versao = versao + 1")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _minutos(hhmm):
+    return int(hhmm[:2]) * 60 + int(hhmm[3:5])
+
+
+def _para_minuto(momento):
+    return int((momento - _EPOCA).total_seconds() // 60)
+
+
+def _de_minuto(minuto):
+    return _EPOCA + timedelta(minutes=minuto)
+
+
+def formatar(momento):
+    return momento.strftime("%Y-%m-%d %H:%M:00")
+
+
+class AgendaUBS:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versao = None
+        self._inicios = {}  # id_ubs -> [minuto de início], ordenado
+        self._horarios = {}  # id_ubs -> Horario (só as que fogem do padrão)
+
+    def atualizar(self, conn):
+        versao = conn.execute("SELECT versao FROM consulta_versao").fetchone()[0]
+        with self._lock:
+            if versao == self._versao:
+                return self
+        horarios = {
+            r["id_ubs"]: Horario(r["abertura"], r["fechamento"], r["duracao"], r["dias"])
+            for r in conn.execute("SELECT * FROM ubs_horario")
+        }
+        inicios = {}
+        # Só o que ainda pode conflitar (a partir de ontem), pelo índice de data_hora
+        ontem = (date.today() - timedelta(days=1)).isoformat()
+        for id_ubs, data_hora in conn.execute(
+            "SELECT id_ubs, data_hora FROM consulta WHERE data_hora >= ? AND status IS NOT ?",
+            (ontem, STATUS_CANCELADA)
+        ):
+            try:
+                inicio = datetime.fromisoformat(str(data_hora))
+            except ValueError:
+                continue
+            inicios.setdefault(id_ubs, []).append(_para_minuto(inicio))
+        for lista in inicios.values():
+            lista.sort()
+        with self._lock:
+            self._inicios, self._horarios, self._versao = inicios, horarios, versao
+        return self
+
+    def horario(self, id_ubs):
+        return self._horarios.get(id_ubs, HORARIO_PADRAO)
+
+    def _livre(self, inicios, minuto, duracao):
+        # Todas as consultas da UBS têm a mesma duração: há conflito se
+        # alguma começa no intervalo aberto (minuto - duracao, minuto + duracao)
+        i = bisect_right(inicios, minuto - duracao)
+        return i == len(inicios) or inicios[i] >= minuto + duracao
+
+    def na_grade(self, id_ubs, momento):
+        # O início cai num horário da grade do dia (abertura + k * duração)
+        h = self.horario(id_ubs)
+        minuto = momento.hour * 60 + momento.minute
+        return (momento.second == 0 and momento.microsecond == 0
+                and (minuto - _minutos(h.abertura)) % h.duracao == 0)
+
+    def livre(self, id_ubs, momento):
+        return self._livre(self._inicios.get(id_ubs, ()), _para_minuto(momento), self.horario(id_ubs).duracao)
+
+    def atende(self, id_ubs, momento):
+        h = self.horario(id_ubs)
+        minuto = momento.hour * 60 + momento.minute
+        return (str(momento.isoweekday()) in h.dias
+                and _minutos(h.abertura) <= minuto
+                and minuto + h.duracao <= _minutos(h.fechamento))
+
+    def livres_no_dia(self, id_ubs, dia, a_partir=None):
+        # Horários livres da grade do dia (datetime), opcionalmente a partir de um instante
+        h = self.horario(id_ubs)
+        if str(dia.isoweekday()) not in h.dias:
+            return []
+        inicios = self._inicios.get(id_ubs, ())
+        base = _para_minuto(datetime.combine(dia, datetime.min.time()))
+        minimo = _para_minuto(a_partir) if a_partir else None
+        livres = []
+        for m in range(_minutos(h.abertura), _minutos(h.fechamento) - h.duracao + 1, h.duracao):
+            minuto = base + m
+            if minimo is not None and minuto < minimo:
+                continue
+            if self._livre(inicios, minuto, h.duracao):
+                livres.append(_de_minuto(minuto))
+        return livres
+
+    def marcadas_no_dia(self, id_ubs, dia):
+        inicios = self._inicios.get(id_ubs, ())
+        base = _para_minuto(datetime.combine(dia, datetime.min.time()))
+        return bisect_right(inicios, base + 24 * 60 - 1) - bisect_right(inicios, base - 1)
+
+    def proximos_livres(self, id_ubs, n, a_partir=None, horizonte=HORIZONTE_DIAS):
+        a_partir = a_partir or datetime.now()
+        resultado = []
+        for d in range(horizonte):
+            dia = a_partir.date() + timedelta(days=d)
+            resultado.extend(self.livres_no_dia(id_ubs, dia, a_partir))
+            if len(resultado) >= n:
+                break
+        return resultado[:n]
+
+    def registrar(self, id_ubs, momento, versao):
+        # Acrescenta uma marcação feita por este processo sem recarregar tudo
+        with self._lock:
+            if self._versao is not None and versao == self._versao + 1:
+                insort(self._inicios.setdefault(id_ubs, []), _para_minuto(momento))
+                self._versao = versao
+
+
+_agenda = AgendaUBS()
+
+
+def obter_agenda(conn):
+    return _agenda.atualizar(conn)
+
+
+
+def proximos_horarios(conn, unidades, n=5, max_ubs=MAX_UBS_BUSCA, a_partir=None):
+    # unidades: [(registro da UBS, distancia_km)] já ordenadas pela distância
+    # (ver indice_ubs.py). Devolve os n próximos horários livres nelas como
+    # [(registro, distancia_km, datetime)], por ordem de horário e distância.
+    agenda = obter_agenda(conn)
+    filas = [
+        [(momento, km, u) for momento in agenda.proximos_livres(u["id"], n, a_partir)]
+        for u, km in unidades[:max_ubs]
+    ]
+    mesclados = heapq.merge(*filas, key=lambda x: (x[0], x[1]))
+    return [(u, km, momento) for momento, km, u in islice(mesclados, n)]
+
+
+def reservar(conn, id_paciente, id_ubs, momento, urgencia):
+    # Marca a consulta se o horário for futuro, estiver na grade do atendimento
+    # e livre. O conflito é conferido no banco com o lock de escrita, não no índice.
+    if momento < datetime.now():
+        raise HorarioIndisponivel("Não é possível marcar consulta num horário que já passou.")
+    agenda = obter_agenda(conn)
+    h = agenda.horario(id_ubs)
+    if not agenda.atende(id_ubs, momento):
+        raise HorarioIndisponivel(
+            f"A UBS atende das {h.abertura} às {h.fechamento}, consultas de {h.duracao} min."
+        )
+    if not agenda.na_grade(id_ubs, momento):
+        raise HorarioIndisponivel(
+            f"As consultas desta UBS começam a cada {h.duracao} min a partir das {h.abertura}."
+        )
+    duracao = timedelta(minutes=h.duracao)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # data_hora é texto e nem todas as linhas antigas têm segundos: o limite
+        # inferior leva ":00" e o superior não, para que "13:30" e "13:30:00"
+        # contem como o mesmo instante nas duas pontas
+        conflito = conn.execute(consultas.CONFLITO_AGENDA, {
+            "id_ubs": id_ubs,
+            "inicio": formatar(momento - duracao),
+            "fim": (momento + duracao).strftime("%Y-%m-%d %H:%M"),
+            "cancelada": STATUS_CANCELADA,
+        }).fetchone()
+        if conflito:
+            raise HorarioIndisponivel("Este horário já está ocupado nesta UBS.")
+        cursor = conn.execute(
+            "INSERT INTO consulta (id_paciente, id_ubs, data_hora, urgencia) VALUES (?, ?, ?, ?)",
+            (id_paciente, id_ubs, formatar(momento), urgencia)
+        )
+        versao = conn.execute("SELECT versao FROM consulta_versao").fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    agenda.registrar(id_ubs, momento, versao)
+    return cursor.lastrowid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Define o horário de atendimento de uma UBS")
+    parser.add_argument("id_ubs", type=int)
+    parser.add_argument("abertura", help="HH:MM")
+    parser.add_argument("fechamento", help="HH:MM")
+    parser.add_argument("--duracao", type=int, default=DURACAO_CONSULTA, help="minutos por consulta")
+    parser.add_argument("--dias", default=DIAS_ATENDIMENTO, help="dias da semana ISO (1 = segunda)")
+    parser.add_argument("--banco", default=DB_PATH)
+    args = parser.parse_args()
+
+    conn = conectar(args.banco)
+    if conn.execute("SELECT 1 FROM ubs WHERE id=?", (args.id_ubs,)).fetchone() is None:
+        parser.error(f"UBS {args.id_ubs} não encontrada.")
+    try:
+        definir_horario(conn, args.id_ubs, args.abertura, args.fechamento, args.duracao, args.dias)
+    except ValueError as e:
+        parser.error(str(e))
+    conn.close()
+    print(f"✅ UBS {args.id_ubs}: {args.abertura}-{args.fechamento}, consultas de {args.duracao} min, "
+          f"dias {args.dias}.")
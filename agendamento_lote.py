@@ -0,0 +1,174 @@
+# Agendamento em lote dos pacientes pendentes.
+# A matriz de distâncias paciente × UBS é calculada com NumPy (haversine),
+# em blocos de pacientes para limitar a memória. Os pacientes são atendidos
+# por ordem de urgência (pacientes.nivel_atendimento) e, dentro da mesma
+# urgência, por ordem de cadastro; cada um vai para a UBS mais próxima que
+# ainda tenha horário livre no dia (ver agenda_ubs.py). Todas as consultas
+# são gravadas numa única transação.
+# Uso: python agendamento_lote.py [AAAA-MM-DD] [--capacidade N] [--raio KM]
+import sys
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import consultas
+from agenda_ubs import obter_agenda, formatar
+from catalogo_ubs import obter_catalogo
+from conexao import conectar
+from geocodificacao import obter_geocodificador
+
+DB_PATH = "clinica.db"
+RAIO_TERRA_KM = 6371.0088
+RAIO_MAXIMO_KM = 10  # acima disso o paciente fica pendente para escolha manual
+CANDIDATOS = 32  # UBS mais próximas examinadas antes da busca completa
+BLOCO = 512  # pacientes por bloco da matriz (512 × 7 mil ≈ 29 MB em float64)
+
+PRIORIDADE_URGENCIA = {"Alta": 0, "Média": 1, "Baixa": 2}
+URGENCIA_PADRAO = "Baixa"
+
+
+def matriz_distancias(lat_p, lon_p, lat_u, lon_u):
+    # Haversine vetorizado; recebe graus, devolve km com forma (pacientes, ubs)
+    lat_p, lon_p = np.radians(lat_p)[:, None], np.radians(lon_p)[:, None]
+    lat_u, lon_u = np.radians(lat_u)[None, :], np.radians(lon_u)[None, :]
+    a = (np.sin((lat_u - lat_p) / 2) ** 2
+         + np.cos(lat_p) * np.cos(lat_u) * np.sin((lon_u - lon_p) / 2) ** 2)
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def atribuir(coords_pacientes, coords_ubs, vagas, raio_max_km=RAIO_MAXIMO_KM,
+             candidatos=CANDIDATOS, bloco=BLOCO):
+    # coords_pacientes já na ordem de prioridade; vagas[j] é decrementado a cada
+    # atribuição. Devolve (índice da UBS ou -1, distância em km) por paciente.
+    coords_pacientes = np.asarray(coords_pacientes, dtype=float).reshape(-1, 2)
+    coords_ubs = np.asarray(coords_ubs, dtype=float).reshape(-1, 2)
+    n, m = len(coords_pacientes), len(coords_ubs)
+    escolhidas = np.full(n, -1, dtype=np.int64)
+    distancias = np.full(n, np.nan)
+    if not n or not m:
+        return escolhidas, distancias
+    limite = np.inf if raio_max_km is None else raio_max_km
+    k = min(candidatos, m)
+
+    for inicio in range(0, n, bloco):
+        fim = min(inicio + bloco, n)
+        d = matriz_distancias(coords_pacientes[inicio:fim, 0], coords_pacientes[inicio:fim, 1],
+                              coords_ubs[:, 0], coords_ubs[:, 1])
+        proximas = np.argpartition(d, k - 1, axis=1)[:, :k]
+        ordem = np.argsort(np.take_along_axis(d, proximas, axis=1), axis=1)
+        proximas = np.take_along_axis(proximas, ordem, axis=1)
+
+        for i, linha in enumerate(d):
+            escolhida = -1
+            for j in proximas[i]:
+                if linha[j] > limite:
+                    break
+                if vagas[j] > 0:
+                    escolhida = j
+                    break
+            else:
+                # As k mais próximas estão lotadas: procura em todas as UBS
+                livres = np.where((vagas > 0) & (linha <= limite), linha, np.inf)
+                j = int(livres.argmin())
+                if np.isfinite(livres[j]):
+                    escolhida = j
+            if escolhida >= 0:
+                vagas[escolhida] -= 1
+                escolhidas[inicio + i] = escolhida
+                distancias[inicio + i] = linha[escolhida]
+    return escolhidas, distancias
+
+
+def _prioridade(paciente):
+    urgencia = paciente["nivel_atendimento"] or URGENCIA_PADRAO
+    return (PRIORIDADE_URGENCIA.get(urgencia, len(PRIORIDADE_URGENCIA)), paciente["id"])
+
+
+def agendar_pendentes(conn, dia=None, capacidade=None, raio_max_km=RAIO_MAXIMO_KM,
+                      geocodificador=None):
+    # dia: AAAA-MM-DD (padrão: amanhã); capacidade: limite opcional de
+    # consultas por UBS no dia, além dos horários livres da agenda de cada uma
+    dia = dia or (date.today() + timedelta(days=1)).isoformat()
+    geocodificador = geocodificador or obter_geocodificador()
+
+    # Geocodificação fora da transação: pode ir à rede
+    coords = {}
+    for p in conn.execute(consultas.PACIENTES_PENDENTES).fetchall():
+        coord = geocodificador.coordenadas_paciente(conn, p)
+        if coord:
+            coords[p["id"]] = coord
+    catalogo, _ = obter_catalogo(conn)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Relidos com o lock de escrita: outro médico pode ter marcado alguém
+        pendentes = sorted(conn.execute(consultas.PACIENTES_PENDENTES).fetchall(), key=_prioridade)
+        com_coord = [p for p in pendentes if p["id"] in coords]
+        agenda = obter_agenda(conn)
+        data = date.fromisoformat(dia)
+        livres = [agenda.livres_no_dia(u["id"], data, datetime.now()) for u in catalogo]
+        if capacidade is None:
+            vagas = np.array([len(l) for l in livres], dtype=np.int64)
+        else:
+            vagas = np.array([
+                max(0, min(len(l), capacidade - agenda.marcadas_no_dia(u["id"], data)))
+                for u, l in zip(catalogo, livres)
+            ], dtype=np.int64)
+
+        escolhidas, distancias = atribuir(
+            [coords[p["id"]] for p in com_coord],
+            [(u["latitude"], u["longitude"]) for u in catalogo],
+            vagas, raio_max_km
+        )
+
+        linhas = []
+        agendadas = []
+        for p, j, km in zip(com_coord, escolhidas, distancias):
+            if j < 0:
+                continue
+            u = catalogo[j]
+            data_hora = formatar(livres[j].pop(0))
+            urgencia = p["nivel_atendimento"] or URGENCIA_PADRAO
+            linhas.append((p["id"], u["id"], data_hora, urgencia))
+            agendadas.append({"id_paciente": p["id"], "id_ubs": u["id"], "ubs": u["nome"],
+                              "data_hora": data_hora, "urgencia": urgencia, "km": float(km)})
+        conn.executemany(
+            "INSERT INTO consulta (id_paciente, id_ubs, data_hora, urgencia) VALUES (?, ?, ?, ?)",
+            linhas
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {
+        "dia": dia,
+        "agendadas": agendadas,
+        "sem_coordenadas": [p["id"] for p in pendentes if p["id"] not in coords],
+        "sem_vaga": [p["id"] for p, j in zip(com_coord, escolhidas) if j < 0],
+    }
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    opcoes = {}
+    for nome in ("--capacidade", "--raio"):
+        if nome in args:
+            i = args.index(nome)
+            opcoes[nome] = float(args[i + 1])
+            del args[i:i + 2]
+    raio = opcoes.get("--raio", RAIO_MAXIMO_KM)
+    conn = conectar(DB_PATH)
+    resultado = agendar_pendentes(
+        conn, args[0] if args else None,
+        capacidade=int(opcoes["--capacidade"]) if "--capacidade" in opcoes else None,
+        raio_max_km=raio,
+    )
+    conn.close()
+    for a in resultado["agendadas"]:
+        print(f"✅ Paciente {a['id_paciente']} → {a['ubs']} em {a['data_hora']} ({a['km']:.2f} km, {a['urgencia']})")
+    print(f"{len(resultado['agendadas'])} consultas marcadas para {resultado['dia']}.")
+    if resultado["sem_coordenadas"]:
+        print(f"⚠️ Sem coordenadas: {len(resultado['sem_coordenadas'])} pacientes.")
+    if resultado["sem_vaga"]:
+        print(f"⚠️ Sem UBS com vaga em {raio} km: {len(resultado['sem_vaga'])} pacientes.")
@@ -1,23 +1,112 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file
-import sqlite3
-from geopy.geocoders import Nominatim
-from geopy.distance import distance
-from datetime import datetime
+# Site da clínica. create_app() monta o app (o Flask o encontra sozinho em
+# `flask --app app run`); migrações e trabalhador da fila rodam na primeira
+# requisição de cada processo, e as bibliotecas pesadas (numpy, reportlab)
+# só são importadas pelas rotas que as usam.
+# Com vários workers, aquecer() faz esse trabalho uma vez no processo mestre,
+# antes do fork, e os workers herdam módulos e caches já carregados:
+#   gunicorn -w 4 --preload "app:create_app(pre_aquecer=True)"
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, g, Response, jsonify, current_app
+from datetime import date, datetime
 import os
 import io
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-
-app = Flask(__name__)
-app.secret_key = "supersecretkey"
-DB_PATH = "clinica.db"
+import threading
+from geocodificacao import obter_geocodificador
+from conexao import obter_pool, conectar, fechar_pools
+from migracoes import aplicar_migracoes
+import consultas
+import agenda_ubs
+import busca_textual
+import enriquecimento
+import mapa_ubs
+import metricas
+import retencao  # registra a tarefa de retenção periódica
+import tarefas
+
+DB_PATH = os.getenv("CLINICA_DB", "clinica.db")
+RAIO_UBS_KM = 5
+
+# (regra, função, opções) registradas por @rota e adicionadas em create_app
+ROTAS = []
+
+def rota(regra, **opcoes):
+    def registrar_rota(funcao):
+        ROTAS.append((regra, funcao, opcoes))
+        return funcao
+    return registrar_rota
+
+# Bancos já migrados neste processo (ou no mestre, antes do fork)
+_migrados = set()
+_migrados_lock = threading.Lock()
+
+def migrar(db_path):
+    if db_path in _migrados:
+        return
+    with _migrados_lock:
+        if db_path in _migrados or not os.path.exists(db_path):
+            return
+        # Conexão própria, fechada em seguida: nenhuma conexão atravessa o fork
+        conn = conectar(db_path)
+        try:
+            aplicar_migracoes(conn)
+        finally:
+            conn.close()
+        _migrados.add(db_path)
+
+def preparar_banco():
+    db_path = current_app.config["DB_PATH"]
+    migrar(db_path)
+    if db_path in _migrados:
+        # Enriquecimento dos pacientes novos (geocodificação e UBS próximas) em
+        # segundo plano; threads não sobrevivem ao fork, então sobem em cada worker
+        tarefas.iniciar_trabalhador(db_path)
+
+def aquecer(app):
+    # Gancho pré-fork: migra o banco, importa as bibliotecas das rotas, carrega
+    # catálogo, índice e agenda das UBS e compila os templates. Não inicia
+    # threads e fecha as conexões.
+    db_path = app.config["DB_PATH"]
+    migrar(db_path)
+    import agendamento_lote  # numpy
+    import atestado_pdf  # reportlab
+    from indice_ubs import obter_indice  # geopy
+
+    if db_path in _migrados:
+        conn = conectar(db_path)
+        try:
+            obter_indice(conn)
+            agenda_ubs.obter_agenda(conn)
+        finally:
+            conn.close()
+    for nome in app.jinja_env.list_templates():
+        app.jinja_env.get_template(nome)
+    fechar_pools()
+
+def create_app(db_path=None, pre_aquecer=False):
+    app = Flask(__name__)
+    app.secret_key = "supersecretkey"
+    app.config["DB_PATH"] = db_path or DB_PATH
+    # Histogramas por rota, SQL, geocodificador e PDF em /metrics (ver metricas.py)
+    metricas.instrumentar(app, "clinica")
+    app.before_request(preparar_banco)
+    app.teardown_appcontext(devolver_db_connection)
+    for regra, funcao, opcoes in ROTAS:
+        app.add_url_rule(regra, view_func=funcao, **opcoes)
+    if pre_aquecer:
+        aquecer(app)
+    return app
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Uma conexão do pool por requisição, devolvida no teardown
+    if "db" not in g:
+        g.db = obter_pool(current_app.config["DB_PATH"]).adquirir()
+    return g.db
+
+def devolver_db_connection(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        obter_pool(current_app.config["DB_PATH"]).devolver(conn)
 
-@app.route("/", methods=["GET", "POST"])
+@rota("/", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         login_user = request.form["login"]
@@ -26,7 +115,6 @@ def login():
         medico = conn.execute(
             "SELECT * FROM medico WHERE login=? AND senha=?", (login_user, senha)
         ).fetchone()
-        conn.close()
         if medico:
             session["medico"] = medico["id"]
             return redirect(url_for("pacientes"))
@@ -34,29 +122,112 @@ def login():
             flash("Login ou senha incorretos!")
     return render_template("login.html")
 
-@app.route("/pacientes")
+@rota("/pacientes")
 def pacientes():
     if "medico" not in session:
         return redirect(url_for("login"))
 
     conn = get_db_connection()
-    pendentes = conn.execute("""
-        SELECT * FROM pacientes
-        WHERE id NOT IN (SELECT id_paciente FROM consulta)
-    """).fetchall()
-
-    agendados = conn.execute("""
-        SELECT p.*, c.data_hora, u.nome as ubs_nome 
-        FROM pacientes p
-        JOIN consulta c ON p.id = c.id_paciente
-        JOIN ubs u ON c.id_ubs = u.id
-        ORDER BY c.data_hora DESC
-    """).fetchall()
-
-    conn.close()
+    pendentes = conn.execute(consultas.PACIENTES_PENDENTES).fetchall()
+    agendados = conn.execute(consultas.PACIENTES_AGENDADOS).fetchall()
+
     return render_template("pacientes.html", pendentes=pendentes, agendados=agendados)
 
-@app.route("/paciente/<int:id>", methods=["GET", "POST"])
+@rota("/busca")
+def busca():
+    # ?q=<texto>&tipo=pacientes|dialogos&ordem=relevancia|recentes
+    #  &pagina=<n>&por_pagina=<n>[&sessao=<id>]
+    if "medico" not in session:
+        return jsonify({"error": "Não autenticado"}), 401
+
+    texto = request.args.get("q", "")
+    tipo = request.args.get("tipo", "pacientes")
+    pagina = request.args.get("pagina", 1, type=int)
+    por_pagina = request.args.get("por_pagina", busca_textual.POR_PAGINA, type=int)
+    ordem = request.args.get("ordem", "relevancia")
+    if not busca_textual.expressao_fts(texto):
+        return jsonify({"error": "Busca vazia"}), 400
+    if ordem not in busca_textual.ORDENACOES:
+        return jsonify({"error": "Ordem inválida"}), 400
+
+    conn = get_db_connection()
+    if tipo == "pacientes":
+        linhas, proxima = busca_textual.buscar_pacientes(conn, texto, pagina, por_pagina, ordem)
+        resultados = [{"id": p["id"], "nome": p["nome"], "idade": p["idade"], "endereco": p["endereco"],
+                       "sintomas": p["sintomas"], "relevancia": p["relevancia"],
+                       "url": url_for("ver_paciente", id=p["id"])} for p in linhas]
+    elif tipo == "dialogos":
+        linhas, proxima = busca_textual.buscar_dialogos(conn, texto, pagina, por_pagina, ordem,
+                                                        request.args.get("sessao"))
+        resultados = [dict(d) for d in linhas]
+    else:
+        return jsonify({"error": "Tipo inválido"}), 400
+
+    return jsonify({"resultados": resultados, "pagina": max(1, pagina),
+                    "proxima_pagina": max(1, pagina) + 1 if proxima else None})
+
+@rota("/api/ubs")
+def api_ubs():
+    # GeoJSON das UBS na janela do mapa: ?bbox=oeste,sul,leste,norte&zoom=<n>
+    if "medico" not in session:
+        return jsonify({"error": "Não autenticado"}), 401
+
+    try:
+        bbox = [float(v) for v in request.args.get("bbox", "").split(",")]
+        if len(bbox) != 4:
+            raise ValueError
+        zoom = request.args.get("zoom", mapa_ubs.ZOOM_SEM_AGRUPAR, type=int)
+        conn = get_db_connection()
+        etag, janela, zoom = mapa_ubs.preparar(conn, bbox, zoom)
+    except ValueError:
+        return jsonify({"error": "Parâmetros inválidos: bbox=oeste,sul,leste,norte&zoom=<n>"}), 400
+
+    cabecalhos = {"ETag": f'"{etag}"', "Cache-Control": "private, max-age=300", "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=cabecalhos)
+
+    corpo, comprimido = mapa_ubs.resposta(conn, etag, janela, zoom)
+    if comprimido is not None and "gzip" in request.accept_encodings:
+        corpo = comprimido
+        cabecalhos["Content-Encoding"] = "gzip"
+    return Response(corpo, mimetype="application/geo+json", headers=cabecalhos)
+
+@rota("/admin/tarefas")
+def admin_tarefas():
+    # Estado da fila de tarefas: contagem por tipo/estado, recentes e falhas (?limite=<n>)
+    if "medico" not in session:
+        return jsonify({"error": "Não autenticado"}), 401
+
+    limite = max(1, min(request.args.get("limite", 20, type=int), 200))
+    return jsonify(tarefas.resumo(get_db_connection(), limite))
+
+@rota("/agendar_pendentes", methods=["POST"])
+def agendar_pendentes():
+    # Marca todos os pendentes de uma vez na UBS mais próxima com vaga no dia
+    if "medico" not in session:
+        return redirect(url_for("login"))
+
+    import agendamento_lote
+
+    dia = request.form.get("data") or None
+    if dia is not None:
+        try:
+            dia = date.fromisoformat(dia).isoformat()
+        except ValueError:
+            flash("❌ Data inválida!", "error")
+            return redirect(url_for("pacientes"))
+
+    conn = get_db_connection()
+    resultado = agendamento_lote.agendar_pendentes(conn, dia)
+
+    flash(f"✅ {len(resultado['agendadas'])} consultas marcadas para {resultado['dia']}.")
+    if resultado["sem_coordenadas"]:
+        flash(f"Não foi possível localizar o endereço de {len(resultado['sem_coordenadas'])} pacientes.")
+    if resultado["sem_vaga"]:
+        flash(f"{len(resultado['sem_vaga'])} pacientes sem UBS com vaga em {agendamento_lote.RAIO_MAXIMO_KM} km.")
+    return redirect(url_for("pacientes"))
+
+@rota("/paciente/<int:id>", methods=["GET", "POST"])
 def ver_paciente(id):
     if "medico" not in session:
         return redirect(url_for("login"))
@@ -64,36 +235,14 @@ def ver_paciente(id):
     conn = get_db_connection()
     paciente = conn.execute("SELECT * FROM pacientes WHERE id=?", (id,)).fetchone()
 
-    geolocator = Nominatim(user_agent="clinica_app")
-    location = geolocator.geocode(paciente["endereco"])
+    # UBS pré-calculadas pela fila de tarefas (em memória enquanto a tarefa não roda)
+    paciente_coord, ubs_proximas = enriquecimento.obter_ubs_proximas(conn, paciente, RAIO_UBS_KM)
 
-    if not location:
-        flash("Não foi possível localizar o endereço do paciente.")
-        ubs_proximas = []
-        paciente_coord = None
+    if not paciente_coord:
+        flash("Endereço do paciente ainda não localizado; as UBS próximas aparecem quando a localização for concluída.")
+        horarios_livres = []
     else:
-        paciente_coord = (location.latitude, location.longitude)
-        ubs_list = conn.execute("SELECT * FROM ubs").fetchall()
-
-        ubs_filtradas = []
-        visto = set()
-        for u in ubs_list:
-            if ("UBS" in u["nome"].upper() or "AMA" in u["nome"].upper()):
-                chave = (u["nome"], u["endereco"])
-                if chave not in visto:
-                    ubs_filtradas.append(u)
-                    visto.add(chave)
-
-        ubs_proximas = []
-        for u in ubs_filtradas:
-            try:
-                ubs_coord = (float(u["latitude"]), float(u["longitude"]))
-                d = distance(paciente_coord, ubs_coord).km
-                if d <= 5:
-                    ubs_proximas.append((u, d))
-            except:
-                continue
-        ubs_proximas.sort(key=lambda x: x[1])
+        horarios_livres = agenda_ubs.proximos_horarios(conn, ubs_proximas)
 
     if request.method == "POST":
         id_ubs = request.form.get("ubs")
@@ -105,28 +254,28 @@ def ver_paciente(id):
             flash("❌ Preencha todos os campos!", "error")
             return redirect(url_for("ver_paciente", id=id))
 
-        data_hora = f"{data_consulta} {hora_consulta}:00"
-
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO consulta (id_paciente, id_ubs, data_hora, urgencia) VALUES (?, ?, ?, ?)",
-            (paciente["id"], int(id_ubs), data_hora, urgencia)
-        )
-        conn.commit()
-        conn.close()
+        try:
+            data_hora = datetime.strptime(f"{data_consulta} {hora_consulta}", "%Y-%m-%d %H:%M")
+            agenda_ubs.reservar(conn, paciente["id"], int(id_ubs), data_hora, urgencia)
+        except ValueError:
+            flash("❌ Data ou hora inválida!", "error")
+            return redirect(url_for("ver_paciente", id=id))
+        except agenda_ubs.HorarioIndisponivel as e:
+            flash(f"❌ {e}", "error")
+            return redirect(url_for("ver_paciente", id=id))
 
         flash("✅ Consulta marcada com sucesso!")
         return redirect(url_for("consulta_confirmada", paciente_id=paciente["id"], ubs_id=id_ubs))
 
-    conn.close()
     return render_template(
         "ver_paciente.html",
         paciente=paciente,
         ubs_proximas=ubs_proximas,
+        horarios_livres=horarios_livres,
         paciente_coord=paciente_coord
     )
 
-@app.route("/consulta_confirmada/<int:paciente_id>/<int:ubs_id>")
+@rota("/consulta_confirmada/<int:paciente_id>/<int:ubs_id>")
 def consulta_confirmada(paciente_id, ubs_id):
     if "medico" not in session:
         return redirect(url_for("login"))
@@ -134,15 +283,8 @@ def consulta_confirmada(paciente_id, ubs_id):
     conn = get_db_connection()
     paciente = conn.execute("SELECT * FROM pacientes WHERE id=?", (paciente_id,)).fetchone()
     ubs = conn.execute("SELECT * FROM ubs WHERE id=?", (ubs_id,)).fetchone()
-    consulta = conn.execute(
-        "SELECT * FROM consulta WHERE id_paciente=? AND id_ubs=? ORDER BY data_hora DESC LIMIT 1",
-        (paciente_id, ubs_id)
-    ).fetchone()
-    conn.close()
-
-    geolocator = Nominatim(user_agent="clinica_app")
-    location = geolocator.geocode(paciente["endereco"])
-    paciente_coord = (location.latitude, location.longitude) if location else None
+    consulta = conn.execute(consultas.ULTIMA_CONSULTA_UBS, (paciente_id, ubs_id)).fetchone()
+    paciente_coord = obter_geocodificador().coordenadas_paciente(conn, paciente)
 
     return render_template(
         "consulta_confirmada.html",
@@ -152,75 +294,85 @@ def consulta_confirmada(paciente_id, ubs_id):
         paciente_coord=paciente_coord
     )
 
-@app.route("/gerar_atestado/<int:paciente_id>", methods=["GET", "POST"])
+@rota("/gerar_atestado/<int:paciente_id>", methods=["GET", "POST"])
 def gerar_atestado(paciente_id):
     if "medico" not in session:
         return redirect(url_for("login"))
 
     conn = get_db_connection()
     paciente = conn.execute("SELECT * FROM pacientes WHERE id=?", (paciente_id,)).fetchone()
-    consulta = conn.execute("""
-        SELECT * FROM consulta WHERE id_paciente=? ORDER BY data_hora DESC LIMIT 1
-    """, (paciente_id,)).fetchone()
-    conn.close()
+    consulta = conn.execute(consultas.ULTIMA_CONSULTA, (paciente_id,)).fetchone()
 
     if request.method == "POST":
+        import atestado_pdf
+
         descricao = request.form.get("descricao", "Atestado Médico")
         nome_medico = request.form.get("nome_medico", "Médico não informado")
 
-        buffer = io.BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        width, height = A4
-
-        left_margin = 50
-        top_margin = height - 50
-        c.setLineWidth(2)
-        c.rect(30, 30, width-60, height-60)
-        logo_path = "static/logo.png"  # Coloque sua logo em /static/logo.png
-        if os.path.exists(logo_path):
-            c.drawImage(logo_path, width/2 - 50, top_margin - 80, width=100, preserveAspectRatio=True, mask='auto')
-
-        c.setFont("Helvetica-Bold", 20)
-        c.drawCentredString(width / 2, top_margin - 120, "ATESTADO MÉDICO")
-        y = top_margin - 160
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(left_margin, y, f"Paciente: {paciente['nome']}")
-        y -= 20
-        c.drawString(left_margin, y, f"Idade: {paciente['idade']}")
-        y -= 20
-        c.drawString(left_margin, y, f"Endereço: {paciente['endereco']}")
-        if consulta:
-            y -= 30
-            c.setFont("Helvetica", 12)
-            c.drawString(left_margin, y, f"Data/Hora da Consulta: {consulta['data_hora']}")
-            y -= 20
-            c.drawString(left_margin, y, f"Urgência: {consulta['urgencia']}")
-        y -= 40
-        caixa_altura = 60  # altura do retângulo
-        c.setStrokeColorRGB(0.2, 0.2, 0.2)
-        c.setFillColorRGB(0.95, 0.95, 0.95)
-        c.rect(left_margin - 5, y - caixa_altura, width - left_margin * 2 + 10, caixa_altura, fill=1)
-        c.setFillColorRGB(0,0,0)
-        text = c.beginText(left_margin + 5, y - 20)  # +5 para margem interna
-        text.setFont("Helvetica", 12)
-        text.textLines(descricao)
-        c.drawText(text)
-        c.line(width-300, 120, width-100, 120)
-        c.setFont("Helvetica", 12)
-        c.drawString(width-300, 100, f"Médico: {nome_medico}")
-        c.setFont("Helvetica-Oblique", 10)
-        c.drawCentredString(width/2, 50, "Atestado válido mediante conferência dos dados e assinatura do médico.")
-
-        c.showPage()
-        c.save()
-        buffer.seek(0)
-
-        return send_file(buffer, as_attachment=True, download_name=f"Atestado_{paciente['nome']}.pdf", mimetype='application/pdf')
+        dados = dados_atestado(paciente, consulta, descricao, nome_medico)
+        buffer = io.BytesIO(atestado_pdf.gerar_atestado(dados))
+
+        return send_file(buffer, as_attachment=True, download_name=atestado_pdf.nome_arquivo(dados), mimetype='application/pdf')
 
     return render_template("atestado_form.html", paciente=paciente)
 
+def dados_atestado(paciente, consulta, descricao, nome_medico):
+    # Dicionário simples (serializável) para renderizar fora do processo da requisição
+    return {
+        "id": paciente["id"],
+        "nome": paciente["nome"],
+        "idade": paciente["idade"],
+        "endereco": paciente["endereco"],
+        "data_hora": consulta["data_hora"] if consulta else None,
+        "urgencia": consulta["urgencia"] if consulta else None,
+        "descricao": descricao,
+        "nome_medico": nome_medico,
+    }
+
+@rota("/gerar_atestados", methods=["POST"])
+def gerar_atestados():
+    # Atestados em lote: pacientes escolhidos (campo "pacientes") ou todos com
+    # consulta no mês informado (campo "mes", AAAA-MM). Sai um ZIP em streaming
+    # ou, com formato=pdf, um único PDF com uma página por paciente.
+    if "medico" not in session:
+        return redirect(url_for("login"))
+
+    descricao = request.form.get("descricao", "Atestado Médico")
+    nome_medico = request.form.get("nome_medico", "Médico não informado")
+    formato = request.form.get("formato", "zip")
+    ids = [int(i) for i in request.form.getlist("pacientes") if i.isdigit()]
+    mes = request.form.get("mes", "")
+
+    conn = get_db_connection()
+    if ids:
+        marcadores = ",".join("?" * len(ids))
+        linhas = conn.execute(consultas.ATESTADOS_PACIENTES.format(marcadores=marcadores), ids).fetchall()
+    elif mes:
+        linhas = conn.execute(consultas.ATESTADOS_DO_MES, {"mes": mes}).fetchall()
+    else:
+        flash("❌ Informe os pacientes ou o mês dos atestados!", "error")
+        return redirect(url_for("pacientes"))
+
+    lista = [dados_atestado(l, l if l["data_hora"] else None, descricao, nome_medico) for l in linhas]
+    if not lista:
+        flash("Nenhum paciente encontrado para os atestados.")
+        return redirect(url_for("pacientes"))
+
+    import atestado_pdf
+
+    sufixo = mes or "selecionados"
+    if formato == "pdf":
+        buffer = io.BytesIO(atestado_pdf.gerar_pdf(lista))
+        return send_file(buffer, as_attachment=True, download_name=f"Atestados_{sufixo}.pdf", mimetype='application/pdf')
+
+    return Response(
+        atestado_pdf.gerar_zip(lista),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=Atestados_{sufixo}.zip"},
+    )
+
 
-@app.route("/logout")
+@rota("/logout")
 def logout():
     session.pop("medico", None)
     return redirect(url_for("login"))
@@ -229,4 +381,4 @@ if __name__ == "__main__":
     if not os.path.exists(DB_PATH):
         print("⚠️ Banco de dados não encontrado. Execute primeiro o criar_banco.py")
     else:
-        app.run(debug=True)
\ No newline at end of file
+        create_app().run(debug=True)
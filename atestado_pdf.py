@@ -0,0 +1,167 @@
+# Geração dos atestados médicos em PDF.
+# A parte fixa da página (moldura, logo, título, linha de assinatura e rodapé)
+# é desenhada uma única vez por documento como form XObject e reaproveitada
+# em cada página; a logo é lida e decodificada uma vez por processo.
+# Por página só são desenhados os dados do paciente.
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from metricas import PDF, medir
+
+LOGO_PATH = "static/logo.png"  # Coloque sua logo em /static/logo.png
+FORM_MOLDURA = "moldura_atestado"
+LARGURA, ALTURA = A4
+MARGEM_ESQUERDA = 50
+MARGEM_TOPO = ALTURA - 50
+CAIXA_ALTURA = 60  # altura do retângulo da descrição
+
+_logo = None
+_logo_carregada = False
+
+
+def _obter_logo():
+    global _logo, _logo_carregada
+    if not _logo_carregada:
+        _logo = ImageReader(LOGO_PATH) if os.path.exists(LOGO_PATH) else None
+        _logo_carregada = True
+    return _logo
+
+
+def _desenhar_moldura(c):
+    c.beginForm(FORM_MOLDURA)
+    c.setLineWidth(2)
+    c.rect(30, 30, LARGURA - 60, ALTURA - 60)
+    logo = _obter_logo()
+    if logo is not None:
+        c.drawImage(logo, LARGURA / 2 - 50, MARGEM_TOPO - 80, width=100,
+                    preserveAspectRatio=True, mask='auto')
+    c.setFont("Helvetica-Bold", 20)
+    c.drawCentredString(LARGURA / 2, MARGEM_TOPO - 120, "ATESTADO MÉDICO")
+    c.line(LARGURA - 300, 120, LARGURA - 100, 120)
+    c.setFont("Helvetica-Oblique", 10)
+    c.drawCentredString(LARGURA / 2, 50, "Atestado válido mediante conferência dos dados e assinatura do médico.")
+    c.endForm()
+
+
+def _desenhar_pagina(c, dados):
+    # dados: dict com nome, idade, endereco, data_hora, urgencia, descricao, nome_medico
+    c.doForm(FORM_MOLDURA)
+    y = MARGEM_TOPO - 160
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(MARGEM_ESQUERDA, y, f"Paciente: {dados['nome']}")
+    y -= 20
+    c.drawString(MARGEM_ESQUERDA, y, f"Idade: {dados['idade']}")
+    y -= 20
+    c.drawString(MARGEM_ESQUERDA, y, f"Endereço: {dados['endereco']}")
+    if dados.get("data_hora"):
+        y -= 30
+        c.setFont("Helvetica", 12)
+        c.drawString(MARGEM_ESQUERDA, y, f"Data/Hora da Consulta: {dados['data_hora']}")
+        y -= 20
+        c.drawString(MARGEM_ESQUERDA, y, f"Urgência: {dados['urgencia']}")
+    y -= 40
+    c.setLineWidth(2)
+    c.setStrokeColorRGB(0.2, 0.2, 0.2)
+    c.setFillColorRGB(0.95, 0.95, 0.95)
+    c.rect(MARGEM_ESQUERDA - 5, y - CAIXA_ALTURA, LARGURA - MARGEM_ESQUERDA * 2 + 10, CAIXA_ALTURA, fill=1)
+    c.setFillColorRGB(0, 0, 0)
+    text = c.beginText(MARGEM_ESQUERDA + 5, y - 20)  # +5 para margem interna
+    text.setFont("Helvetica", 12)
+    text.textLines(dados["descricao"])
+    c.drawText(text)
+    c.setFont("Helvetica", 12)
+    c.drawString(LARGURA - 300, 100, f"Médico: {dados['nome_medico']}")
+    c.showPage()
+
+
+def gerar_pdf(lista_dados):
+    # Um PDF com uma página por atestado; a moldura entra uma vez no arquivo
+    lista_dados = list(lista_dados)
+    with medir(PDF, "atestado" if len(lista_dados) == 1 else "lote"):
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4)
+        _desenhar_moldura(c)
+        for dados in lista_dados:
+            _desenhar_pagina(c, dados)
+        c.save()
+    return buffer.getvalue()
+
+
+def gerar_atestado(dados):
+    return gerar_pdf([dados])
+
+
+def nome_arquivo(dados):
+    return f"Atestado_{dados['nome']}.pdf"
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def obter_executor():
+    # Pool único por processo. Os filhos não podem vir de um fork deste
+    # processo, que já tem threads (fila de tarefas, métricas, registro de
+    # diálogos) e poderia herdar um lock travado: usa forkserver (ou spawn,
+    # onde não houver)
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context(metodo))
+        return _executor
+
+
+class _SaidaZip:
+    # Destino sem seek para o ZipFile: acumula o que foi escrito até ser drenado
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def drenar(self):
+        dados = b"".join(self.partes)
+        self.partes = []
+        return dados
+
+
+def gerar_zip(lista_dados, executor=None, janela=None):
+    # Gera o ZIP em blocos: os PDFs são renderizados no pool de processos com
+    # no máximo `janela` pendentes, e cada um é enviado assim que fica pronto
+    executor = executor or obter_executor()
+    janela = janela or 2 * (os.cpu_count() or 1)
+    # Tempo total do ZIP (as páginas são renderizadas nos processos do pool)
+    with medir(PDF, "zip"):
+        saida = _SaidaZip()
+        nomes = set()
+        with zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_DEFLATED) as arquivo:
+            pendentes = []
+            lista_dados = iter(lista_dados)
+            while True:
+                for dados in lista_dados:
+                    pendentes.append((dados, executor.submit(gerar_atestado, dados)))
+                    if len(pendentes) >= janela:
+                        break
+                if not pendentes:
+                    break
+                dados, futuro = pendentes.pop(0)
+                nome = nome_arquivo(dados)
+                if nome in nomes:
+                    nome = f"Atestado_{dados['nome']}_{dados['id']}.pdf"
+                nomes.add(nome)
+                arquivo.writestr(nome, futuro.result())
+                yield saida.drenar()
+        yield saida.drenar()
@@ -0,0 +1,59 @@
+# Mede a atribuição em lote (matriz de distâncias NumPy) com dados sintéticos
+# e compara com o laço por paciente (distância geodésica contra todas as UBS,
+# como no ver_paciente), extrapolado a partir de uma amostra.
+# Uso: python benchmarks/bench_agendamento_lote.py [pacientes] [ubs] [capacidade]
+import os
+import sys
+import time
+
+import numpy as np
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+
+from geopy.distance import distance
+from agendamento_lote import atribuir
+
+# Retângulo aproximado da cidade de São Paulo
+LAT_MIN, LAT_MAX = -23.80, -23.40
+LON_MIN, LON_MAX = -46.80, -46.40
+AMOSTRA_LACO = 5
+
+
+def laco_por_paciente(coord, coords_ubs):
+    distancias = [distance(coord, tuple(u)).km for u in coords_ubs]
+    return int(np.argmin(distancias))
+
+
+def main():
+    n_pacientes = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    n_ubs = int(sys.argv[2]) if len(sys.argv) > 2 else 7_000
+    capacidade = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    rng = np.random.default_rng(42)
+
+    def pontos(n):
+        return np.column_stack([rng.uniform(LAT_MIN, LAT_MAX, n), rng.uniform(LON_MIN, LON_MAX, n)])
+
+    pacientes = pontos(n_pacientes)
+    ubs = pontos(n_ubs)
+    vagas = np.full(n_ubs, capacidade, dtype=np.int64)
+
+    inicio = time.perf_counter()
+    escolhidas, distancias = atribuir(pacientes, ubs, vagas, raio_max_km=None)
+    t_lote = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    for coord in pacientes[:AMOSTRA_LACO]:
+        laco_por_paciente(tuple(coord), ubs)
+    t_laco = (time.perf_counter() - inicio) / AMOSTRA_LACO * n_pacientes
+
+    assert (np.bincount(escolhidas[escolhidas >= 0], minlength=n_ubs) <= capacidade).all()
+    print(f"{n_pacientes} pacientes × {n_ubs} UBS, capacidade {capacidade} por UBS")
+    print(f"atribuídos        : {(escolhidas >= 0).sum()} (distância média {np.nanmean(distancias):.2f} km)")
+    print(f"lote NumPy        : {t_lote:8.2f} s")
+    print(f"laço por paciente : {t_laco:8.2f} s (estimado com {AMOSTRA_LACO} pacientes, sem capacidade)")
+    print(f"ganho             : {t_laco / max(t_lote, 1e-9):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
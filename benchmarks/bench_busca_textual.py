@@ -0,0 +1,104 @@
+# Compara a busca com LIKE '%...%' (varredura da tabela) contra o FTS5,
+# num banco temporário com pacientes e mensagens sintéticos. Os sintomas
+# sintéticos são poucos e repetidos (cada um em ~1/6 das linhas), o pior caso
+# para a ordenação por relevância.
+# Uso: python benchmarks/bench_busca_textual.py [pacientes] [mensagens]
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+
+import busca_textual
+
+NOMES = ["Ana", "João", "Maria", "José", "Antônio", "Francisca", "Carlos", "Paulo", "Lúcia", "Pedro"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima"]
+RUAS = ["Rua Augusta", "Avenida Paulista", "Rua da Consolação", "Rua Vergueiro", "Avenida São João"]
+SINTOMAS = ["febre", "dor de cabeça", "tosse seca", "dor no peito", "falta de ar", "náusea",
+            "dor nas costas", "tontura", "coriza", "dor de garganta", "cansaço", "pressão alta"]
+FRASES = ["Estou com {s} desde ontem.", "Sinto {s} quando acordo.", "Tenho {s} há três dias.",
+          "Minha mãe também teve {s}.", "A {s} piorou hoje à noite."]
+BUSCAS = ["febre", "dor no peito", "Conceição", "pressao", "silva augusta"]
+REPETICOES = 5
+
+
+def gerar(conn, n_pacientes, n_mensagens):
+    random.seed(42)
+    conn.executescript("""
+        CREATE TABLE pacientes (id INTEGER PRIMARY KEY AUTOINCREMENT, nome TEXT, idade TEXT,
+            endereco TEXT, telefone TEXT, sintomas TEXT);
+        CREATE TABLE dialogos (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, autor TEXT,
+            mensagem TEXT, sessao TEXT);
+    """)
+    conn.executemany(
+        "INSERT INTO pacientes (nome, idade, endereco, sintomas) VALUES (?, ?, ?, ?)",
+        ((f"{random.choice(NOMES)} {random.choice(SOBRENOMES)}", str(random.randint(1, 99)),
+          f"{random.choice(RUAS)}, {random.randint(1, 3000)} - Bairro Conceição" if random.random() < 0.05
+          else f"{random.choice(RUAS)}, {random.randint(1, 3000)}",
+          ", ".join(random.sample(SINTOMAS, 2))) for _ in range(n_pacientes))
+    )
+    conn.executemany(
+        "INSERT INTO dialogos (timestamp, autor, mensagem, sessao) VALUES ('2025-01-01', 'Usuário', ?, ?)",
+        ((random.choice(FRASES).format(s=random.choice(SINTOMAS)), str(i % 1000))
+         for i in range(n_mensagens))
+    )
+    conn.commit()
+
+
+def medir(conn, sql, params):
+    inicio = time.perf_counter()
+    for _ in range(REPETICOES):
+        total = len(conn.execute(sql, params).fetchall())
+    return (time.perf_counter() - inicio) / REPETICOES * 1000, total
+
+
+def medir_pagina(funcao, conn, texto, ordem):
+    # Primeira página da busca (o que o endpoint faz), em ms
+    inicio = time.perf_counter()
+    for _ in range(REPETICOES):
+        funcao(conn, texto, ordem=ordem)
+    return (time.perf_counter() - inicio) / REPETICOES * 1000
+
+
+def main():
+    n_pacientes = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    n_mensagens = int(sys.argv[2]) if len(sys.argv) > 2 else 500_000
+    with tempfile.TemporaryDirectory() as pasta:
+        conn = sqlite3.connect(os.path.join(pasta, "bench.db"))
+        conn.row_factory = sqlite3.Row
+        gerar(conn, n_pacientes, n_mensagens)
+        inicio = time.perf_counter()
+        busca_textual.criar_esquema(conn)
+        conn.commit()
+        print(f"{n_pacientes} pacientes, {n_mensagens} mensagens; "
+              f"indexação inicial {time.perf_counter() - inicio:.1f} s")
+
+        print(f"{'busca':<16}{'LIKE ms':>10}{'FTS ms':>10}{'relevância':>12}{'recentes':>10}"
+              f"{'LIKE':>9}{'FTS':>9}")
+        for texto in BUSCAS:
+            # LIKE: cada palavra em qualquer coluna (não ignora acentos)
+            palavras = texto.split()
+            condicao = " AND ".join("(nome LIKE ? OR endereco LIKE ? OR sintomas LIKE ?)" for _ in palavras)
+            params = [f"%{p}%" for p in palavras for _ in range(3)]
+            t_like, n_like = medir(conn, f"SELECT * FROM pacientes WHERE {condicao}", params)
+            t_fts, n_fts = medir(conn, "SELECT rowid FROM pacientes_fts WHERE pacientes_fts MATCH ?",
+                                 (busca_textual.expressao_fts(texto),))
+            t_relevancia = medir_pagina(busca_textual.buscar_pacientes, conn, texto, "relevancia")
+            t_recentes = medir_pagina(busca_textual.buscar_pacientes, conn, texto, "recentes")
+            print(f"{texto:<16}{t_like:>10.1f}{t_fts:>10.1f}{t_relevancia:>12.1f}{t_recentes:>10.1f}"
+                  f"{n_like:>9}{n_fts:>9}")
+
+        t_like, n_like = medir(conn, "SELECT id FROM dialogos WHERE mensagem LIKE ?", ("%dor no peito%",))
+        t_relevancia = medir_pagina(busca_textual.buscar_dialogos, conn, "dor no peito", "relevancia")
+        t_recentes = medir_pagina(busca_textual.buscar_dialogos, conn, "dor no peito", "recentes")
+        print(f"dialogos 'dor no peito': LIKE {t_like:.1f} ms ({n_like} linhas), primeira página "
+              f"por relevância {t_relevancia:.1f} ms, por recentes {t_recentes:.1f} ms")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
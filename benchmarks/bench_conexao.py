@@ -0,0 +1,111 @@
+# Concorrência de leitores e escritores no SQLite: uma conexão nova por
+# operação com o journal padrão (como era) contra o pool com WAL do conexao.py.
+# Uso: python benchmarks/bench_conexao.py [segundos] [leitores] [escritores]
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+
+from conexao import PoolConexoes
+
+MENSAGENS_INICIAIS = 20000
+
+
+def preparar_banco(caminho):
+    conn = sqlite3.connect(caminho)
+    conn.execute("""
+        CREATE TABLE dialogos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            autor TEXT,
+            mensagem TEXT
+        )
+    """)
+    agora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.executemany(
+        "INSERT INTO dialogos (timestamp, autor, mensagem) VALUES (?, ?, ?)",
+        ((agora, "Usuário", f"mensagem {i}") for i in range(MENSAGENS_INICIAIS))
+    )
+    conn.commit()
+    conn.close()
+
+
+def ler(conn):
+    conn.execute("SELECT timestamp, autor, mensagem FROM dialogos ORDER BY id DESC LIMIT 50").fetchall()
+
+
+def escrever(conn):
+    conn.execute(
+        "INSERT INTO dialogos (timestamp, autor, mensagem) VALUES (?, ?, ?)",
+        (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "Assistente", "resposta")
+    )
+    conn.commit()
+
+
+def operacao_antes(caminho, funcao):
+    conn = sqlite3.connect(caminho)
+    try:
+        funcao(conn)
+    finally:
+        conn.close()
+
+
+def executar(nome, caminho, segundos, leitores, escritores, operacao):
+    contagem = {"leitura": 0, "escrita": 0, "erros": 0}
+    lock = threading.Lock()
+    fim = time.perf_counter() + segundos
+
+    def trabalhador(tipo, funcao):
+        feitas = erros = 0
+        while time.perf_counter() < fim:
+            try:
+                operacao(funcao)
+                feitas += 1
+            except sqlite3.OperationalError:
+                erros += 1
+        with lock:
+            contagem[tipo] += feitas
+            contagem["erros"] += erros
+
+    threads = [threading.Thread(target=trabalhador, args=("leitura", ler)) for _ in range(leitores)]
+    threads += [threading.Thread(target=trabalhador, args=("escrita", escrever)) for _ in range(escritores)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"{nome:7}: {contagem['leitura'] / segundos:9.0f} leituras/s  "
+          f"{contagem['escrita'] / segundos:7.0f} escritas/s  {contagem['erros']} erros de lock")
+
+
+def main():
+    segundos = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    leitores = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    escritores = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    with tempfile.TemporaryDirectory() as pasta:
+        antes = os.path.join(pasta, "antes.db")
+        preparar_banco(antes)
+        executar("antes", antes, segundos, leitores, escritores,
+                 lambda funcao: operacao_antes(antes, funcao))
+
+        depois = os.path.join(pasta, "depois.db")
+        preparar_banco(depois)
+        pool = PoolConexoes(depois, tamanho=leitores + escritores)
+
+        def operacao_depois(funcao):
+            with pool.conexao() as conn:
+                funcao(conn)
+
+        executar("depois", depois, segundos, leitores, escritores, operacao_depois)
+        pool.fechar()
+
+
+if __name__ == "__main__":
+    main()
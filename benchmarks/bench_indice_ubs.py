@@ -0,0 +1,84 @@
+# Compara a busca de UBS próximas: varredura linear (como era no ver_paciente)
+# contra o índice espacial em grade.
+# Uso: python benchmarks/bench_indice_ubs.py [consultas] [raio_km]
+import os
+import random
+import sqlite3
+import sys
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+
+from geopy.distance import distance
+from indice_ubs import IndiceUBS, carregar_unidades
+
+DB_PATH = os.path.join(RAIZ, "clinica.db")
+# Retângulo aproximado da cidade de São Paulo
+LAT_MIN, LAT_MAX = -23.80, -23.40
+LON_MIN, LON_MAX = -46.80, -46.40
+
+
+def busca_linear(conn, coord, raio_km):
+    ubs_list = conn.execute("SELECT * FROM ubs").fetchall()
+    ubs_filtradas = []
+    visto = set()
+    for u in ubs_list:
+        if ("UBS" in u["nome"].upper() or "AMA" in u["nome"].upper()):
+            chave = (u["nome"], u["endereco"])
+            if chave not in visto:
+                ubs_filtradas.append(u)
+                visto.add(chave)
+    ubs_proximas = []
+    for u in ubs_filtradas:
+        try:
+            d = distance(coord, (float(u["latitude"]), float(u["longitude"]))).km
+            if d <= raio_km:
+                ubs_proximas.append((u, d))
+        except (TypeError, ValueError):
+            continue
+    ubs_proximas.sort(key=lambda x: x[1])
+    return ubs_proximas
+
+
+def main():
+    consultas = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    raio_km = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    random.seed(42)
+    pontos = [(random.uniform(LAT_MIN, LAT_MAX), random.uniform(LON_MIN, LON_MAX))
+              for _ in range(consultas)]
+
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+
+    inicio = time.perf_counter()
+    linear = [busca_linear(conn, p, raio_km) for p in pontos]
+    t_linear = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    indice = IndiceUBS(carregar_unidades(conn))
+    t_construcao = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    indexado = [indice.dentro_do_raio(p, raio_km) for p in pontos]
+    t_indice = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    for p in pontos:
+        indice.mais_proximas(p, 5)
+    t_knn = time.perf_counter() - inicio
+    conn.close()
+
+    for a, b in zip(linear, indexado):
+        assert [u["id"] for u, _ in a] == [u["id"] for u, _ in b], "resultados divergentes"
+
+    print(f"{indice.total} unidades, {consultas} consultas, raio {raio_km} km")
+    print(f"varredura linear : {t_linear / consultas * 1000:8.2f} ms/consulta")
+    print(f"construção índice: {t_construcao * 1000:8.2f} ms (uma vez)")
+    print(f"índice (raio)    : {t_indice / consultas * 1000:8.2f} ms/consulta")
+    print(f"índice (5 mais)  : {t_knn / consultas * 1000:8.2f} ms/consulta")
+    print(f"ganho            : {t_linear / max(t_indice, 1e-9):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# Teste de carga offline do app da clínica (app.py) e do backend de triagem,
+# pelos clientes de teste do Flask, sobre dados sintéticos (dados_sinteticos.py).
+# Nominatim e Gemini são trocados pelos substitutos locais (GEOCODER_BACKEND=offline,
+# MODELO_CHAT=local) com latência configurável. Para cada nível de concorrência
+# (threads, cada uma com o seu cliente) mede p50/p95/p99 por rota e a vazão total.
+# Os clientes rodam no mesmo processo do app, então a vazão inclui a disputa pelo
+# GIL: serve para comparar commits entre si, não como capacidade do servidor.
+#
+# O resultado vai para benchmarks/resultados/<commit>.json (com "-modificado" se a
+# árvore tiver alterações não commitadas), para comparar versões depois.
+# Uso: python benchmarks/carga.py [--pacientes N] [--consultas M] [--sessoes S]
+#                                 [--mensagens K] [--concorrencia 1,4,16]
+#                                 [--requisicoes R] [--latencia-geocoder SEG]
+#                                 [--latencia-modelo SEG] [--semente X]
+#      python benchmarks/carga.py --comparar <antes> <depois>
+import argparse
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+
+import dados_sinteticos
+
+PASTA_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+CONCORRENCIA = "1,4,16"
+REQUISICOES = 400  # por app e por nível de concorrência
+PERCENTIS = (50, 95, 99)
+BUSCAS = ["febre", "dor no peito", "silva", "conceicao", "pressao alta"]
+BAIRROS = [  # (lat, lon) de pontos da cidade para as janelas do mapa
+    (-23.5505, -46.6333), (-23.5329, -46.7917), (-23.6817, -46.7012),
+    (-23.5401, -46.4716), (-23.4820, -46.6208),
+]
+CAMPOS_CHAT = ["nome", "idade", "endereco", "telefone", "sintomas"]
+
+
+def commit_atual():
+    # Hash curto do HEAD; "-modificado" se houver alterações não commitadas
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        alterado = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=RAIZ,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "sem-git"
+    return commit + ("-modificado" if alterado else "")
+
+
+def percentil(ordenados, p):
+    # Método do posto mais próximo
+    if not ordenados:
+        return None
+    posto = max(1, -(-p * len(ordenados) // 100))
+    return ordenados[posto - 1]
+
+
+def carregar_backend():
+    # O backend fica em chatbot/SistemaTriagem/backend/app.py, com o mesmo nome
+    # de módulo do site; é importado pelo caminho, como "backend_triagem"
+    caminho = os.path.join(RAIZ, "chatbot", "SistemaTriagem", "backend", "app.py")
+    spec = importlib.util.spec_from_file_location("backend_triagem", caminho)
+    triagem = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(triagem)
+    return triagem
+
+
+def carregar_apps(dados):
+    # Os dois apps pelas fábricas, apontando para os bancos sintéticos (o
+    # clinica.db e o conversas.db do repositório nunca são abertos)
+    import app as clinica
+
+    return clinica.create_app(dados["clinica"]), carregar_backend().create_app(dados["conversas"])
+
+
+def operacoes_clinica(dados):
+    # (rota, peso, função(cliente, rng) -> resposta)
+    ids = range(1, dados["pacientes"] + 1)
+    consultas = dados["consultas"]
+    ubs = dados["ubs"]
+    sessoes = dados["sessoes"]
+
+    def janela(rng):
+        lat, lon = rng.choice(BAIRROS)
+        zoom = rng.choice((11, 12, 13, 14, 15))
+        meia = 180 / 2 ** zoom
+        lat += rng.uniform(-0.02, 0.02)
+        lon += rng.uniform(-0.02, 0.02)
+        return f"{lon - meia:.6f},{lat - meia / 2:.6f},{lon + meia:.6f},{lat + meia / 2:.6f}", zoom
+
+    def reservar(c, rng):
+        # Mesma grade da agenda sintética: parte cai em horário ocupado ou fim de semana
+        momento = dados_sinteticos.INICIO_AGENDA + timedelta(
+            days=rng.randrange(dados_sinteticos.DIAS_AGENDA),
+            minutes=30 * rng.randrange(dados_sinteticos.HORARIOS_POR_DIA))
+        return c.post(f"/paciente/{rng.choice(ids)}", data={
+            "ubs": rng.choice(ubs), "urgencia": rng.choice(dados_sinteticos.URGENCIAS),
+            "data_consulta": momento.strftime("%Y-%m-%d"), "hora_consulta": momento.strftime("%H:%M"),
+        })
+
+    def mapa(c, rng):
+        bbox, zoom = janela(rng)
+        return c.get(f"/api/ubs?bbox={bbox}&zoom={zoom}")
+
+    return [
+        ("GET /pacientes", 2, lambda c, rng: c.get("/pacientes")),
+        ("GET /paciente/<id>", 10, lambda c, rng: c.get(f"/paciente/{rng.choice(ids)}")),
+        ("POST /paciente/<id>", 2, reservar),
+        ("GET /consulta_confirmada/<p>/<u>", 4,
+         lambda c, rng: c.get("/consulta_confirmada/{}/{}".format(*rng.choice(consultas)))),
+        ("GET /busca?tipo=pacientes", 6, lambda c, rng: c.get(f"/busca?q={rng.choice(BUSCAS)}")),
+        ("GET /busca?tipo=dialogos", 3, lambda c, rng: c.get(
+            f"/busca?tipo=dialogos&q={rng.choice(BUSCAS)}&sessao={rng.choice(sessoes)}")),
+        ("GET /api/ubs", 10, mapa),
+        ("POST /gerar_atestado/<id>", 1, lambda c, rng: c.post(
+            "/gerar_atestado/{}".format(rng.choice(consultas)[0]),
+            data={"descricao": "Repouso de 2 dias", "nome_medico": "Dra. Carga"})),
+    ]
+
+
+def operacoes_triagem(dados):
+    sessoes = dados["sessoes"]
+
+    def chat(c, rng, stream=False):
+        corpo = {"message": rng.choice(dados_sinteticos.FRASES).format(s=rng.choice(dados_sinteticos.SINTOMAS)),
+                 "session_id": f"carga-{rng.randrange(50)}", "stream": stream}
+        if rng.random() < 0.3:
+            corpo["campo"] = rng.choice(CAMPOS_CHAT)
+        resposta = c.post("/chat", json=corpo)
+        resposta.get_data()  # consome o stream inteiro
+        return resposta
+
+    def exportar(c, rng):
+        resposta = c.get(f"/history/export?sessao={rng.choice(sessoes)}")
+        resposta.get_data()
+        return resposta
+
+    return [
+        ("POST /chat", 6, chat),
+        ("POST /chat (stream)", 3, lambda c, rng: chat(c, rng, stream=True)),
+        ("GET /history", 6, lambda c, rng: c.get(f"/history?sessao={rng.choice(sessoes)}&limit=100")),
+        ("GET /history/export", 1, exportar),
+        ("GET /chat/contexto", 1, lambda c, rng: c.get("/chat/contexto")),
+    ]
+
+
+def _cliente_clinica(app):
+    cliente = app.test_client()
+    with cliente.session_transaction() as s:
+        s["medico"] = 1
+    return cliente
+
+
+def executar(app, operacoes, concorrencia, requisicoes, semente, novo_cliente):
+    # Divide as requisições entre as threads; cada uma sorteia as rotas pelos pesos
+    rotas = [o[0] for o in operacoes]
+    pesos = [o[1] for o in operacoes]
+    funcoes = {o[0]: o[2] for o in operacoes}
+    tempos = {rota: [] for rota in rotas}
+    erros = {rota: 0 for rota in rotas}
+    lock = threading.Lock()
+    largada = threading.Barrier(concorrencia + 1)
+
+    def trabalhador(indice, quantidade):
+        rng = random.Random(semente * 1000 + indice)
+        cliente = novo_cliente(app)
+        locais = []
+        largada.wait()
+        for _ in range(quantidade):
+            rota = rng.choices(rotas, pesos)[0]
+            inicio = time.perf_counter()
+            resposta = funcoes[rota](cliente, rng)
+            locais.append((rota, (time.perf_counter() - inicio) * 1000, resposta.status_code >= 500))
+        with lock:
+            for rota, ms, erro in locais:
+                tempos[rota].append(ms)
+                erros[rota] += erro
+
+    threads = [threading.Thread(target=trabalhador, args=(i, requisicoes // concorrencia
+                                                          + (i < requisicoes % concorrencia)))
+               for i in range(concorrencia)]
+    for t in threads:
+        t.start()
+    largada.wait()
+    inicio = time.perf_counter()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    resultado = {"rotas": {}, "requisicoes": requisicoes, "segundos": round(duracao, 3),
+                 "vazao": round(requisicoes / duracao, 1)}
+    for rota in rotas:
+        ordenados = sorted(tempos[rota])
+        if not ordenados:
+            continue
+        resultado["rotas"][rota] = {"n": len(ordenados), "erros": erros[rota],
+                                    **{f"p{p}": round(percentil(ordenados, p), 2) for p in PERCENTIS}}
+    return resultado
+
+
+def imprimir(nome, nivel, resultado):
+    print(f"\n{nome} — {nivel} thread(s): {resultado['vazao']} req/s "
+          f"({resultado['requisicoes']} em {resultado['segundos']} s)")
+    print(f"  {'rota':<34}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'erros':>7}")
+    for rota, r in resultado["rotas"].items():
+        print(f"  {rota:<34}{r['n']:>6}{r['p50']:>10.2f}{r['p95']:>10.2f}{r['p99']:>10.2f}{r['erros']:>7}")
+
+
+def caminho_resultado(nome):
+    if os.path.exists(nome):
+        return nome
+    return os.path.join(PASTA_RESULTADOS, nome if nome.endswith(".json") else f"{nome}.json")
+
+
+def comparar(antes, depois):
+    # p95 e vazão de duas execuções salvas (por commit ou caminho do arquivo)
+    with open(caminho_resultado(antes), encoding="utf-8") as f:
+        a = json.load(f)
+    with open(caminho_resultado(depois), encoding="utf-8") as f:
+        d = json.load(f)
+    print(f"{a['commit']} -> {d['commit']}")
+    for nome, niveis in d["apps"].items():
+        for nivel, resultado in niveis.items():
+            base = a["apps"].get(nome, {}).get(nivel)
+            if base is None:
+                continue
+            print(f"\n{nome} — {nivel} thread(s): vazão {base['vazao']} -> {resultado['vazao']} req/s")
+            print(f"  {'rota':<34}{'p95 antes':>11}{'p95 depois':>12}{'variação':>10}")
+            for rota, r in resultado["rotas"].items():
+                anterior = base["rotas"].get(rota)
+                if anterior is None:
+                    continue
+                variacao = (r["p95"] / anterior["p95"] - 1) * 100 if anterior["p95"] else 0.0
+                print(f"  {rota:<34}{anterior['p95']:>11.2f}{r['p95']:>12.2f}{variacao:>+9.0f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga offline dos apps da clínica e da triagem")
+    parser.add_argument("--pacientes", type=int, default=5000)
+    parser.add_argument("--consultas", type=int, default=3000)
+    parser.add_argument("--sessoes", type=int, default=200)
+    parser.add_argument("--mensagens", type=int, default=100, help="mensagens por sessão")
+    parser.add_argument("--concorrencia", default=CONCORRENCIA, help="níveis separados por vírgula")
+    parser.add_argument("--requisicoes", type=int, default=REQUISICOES, help="por app e por nível")
+    parser.add_argument("--latencia-geocoder", type=float, default=0.05, help="segundos por consulta")
+    parser.add_argument("--latencia-modelo", type=float, default=0.2, help="segundos até o primeiro trecho")
+    parser.add_argument("--semente", type=int, default=dados_sinteticos.SEMENTE)
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DEPOIS"))
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    niveis = [int(n) for n in args.concorrencia.split(",")]
+    commit = commit_atual()
+    with tempfile.TemporaryDirectory() as pasta:
+        inicio = time.perf_counter()
+        dados = dados_sinteticos.gerar(pasta, args.pacientes, args.consultas, args.sessoes,
+                                       args.mensagens, args.semente)
+        print(f"Dados sintéticos em {time.perf_counter() - inicio:.1f} s: {args.pacientes} pacientes, "
+              f"{len(dados['consultas'])} consultas, {len(dados['ubs'])} UBS, "
+              f"{args.sessoes}×{args.mensagens} mensagens")
+
+        os.environ.update({
+            "GEOCODER_BACKEND": "offline",
+            "GEOCODER_OFFLINE_CSV": dados["enderecos"],
+            "GEOCODER_OFFLINE_LATENCIA": str(args.latencia_geocoder),
+            "MODELO_CHAT": "local",
+            "MODELO_LOCAL_LATENCIA": str(args.latencia_modelo),
+        })
+        try:
+            app_clinica, app_triagem = carregar_apps(dados)
+            apps = {
+                "clinica": (app_clinica, operacoes_clinica(dados), _cliente_clinica),
+                "triagem": (app_triagem, operacoes_triagem(dados), lambda app: app.test_client()),
+            }
+            resultados = {}
+            for nome, (app, operacoes, novo_cliente) in apps.items():
+                resultados[nome] = {}
+                for nivel in niveis:
+                    resultado = executar(app, operacoes, nivel, args.requisicoes, args.semente, novo_cliente)
+                    resultados[nome][str(nivel)] = resultado
+                    imprimir(nome, nivel, resultado)
+        finally:
+            from conexao import fechar_pools
+            from registro_dialogos import obter_registro
+            from tarefas import parar_trabalhadores
+            parar_trabalhadores()
+            obter_registro(dados["conversas"]).fechar()
+            fechar_pools()
+
+    saida = {
+        "commit": commit,
+        "data": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "parametros": {k: v for k, v in vars(args).items() if k != "comparar"},
+        "apps": resultados,
+    }
+    os.makedirs(PASTA_RESULTADOS, exist_ok=True)
+    arquivo = os.path.join(PASTA_RESULTADOS, f"{commit}.json")
+    with open(arquivo, "w", encoding="utf-8") as f:
+        json.dump(saida, f, ensure_ascii=False, indent=2)
+    print(f"\nResultado salvo em {os.path.relpath(arquivo, RAIZ)}")
+
+
+if __name__ == "__main__":
+    main()
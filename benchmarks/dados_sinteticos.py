@@ -0,0 +1,185 @@
+# Gerador determinístico de dados para os testes de carga: clinica.db com o
+# esquema das migrações (migracoes.py), o ubs.csv inteiro, N pacientes (endereços
+# perto de UBS reais), M consultas e históricos longos em dialogos; conversas.db
+# com os mesmos diálogos; e o CSV de endereços do geocodificador offline.
+# A mesma semente gera sempre os mesmos dados.
+# Uso: python benchmarks/dados_sinteticos.py <pasta> [pacientes] [consultas] [sessoes] [mensagens por sessão]
+import csv
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+
+import catalogo_ubs
+import importar_ubs
+import registro_dialogos
+from agenda_ubs import formatar
+from conexao import conectar
+from migracoes import aplicar_migracoes
+
+SEMENTE = 42
+LOGIN = "carga"
+SENHA = "carga"
+SEM_COORDENADAS = 0.1  # fração de pacientes que o app ainda precisa geocodificar
+DESLOCAMENTO_MAX = 0.02  # graus (~2 km) entre o paciente e a UBS de referência
+INICIO_AGENDA = datetime(2025, 3, 3, 8, 0)  # uma segunda-feira
+DIAS_AGENDA = 30
+HORARIOS_POR_DIA = 18  # 08:00-17:00 de 30 em 30 min
+
+NOMES = ["Ana", "João", "Maria", "José", "Antônio", "Francisca", "Carlos", "Paulo", "Lúcia", "Pedro",
+         "Conceição", "Raimundo", "Luiza", "Marcos", "Juliana"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira",
+              "Lima", "Gomes", "Ribeiro", "Carvalho"]
+RUAS = ["Rua Augusta", "Avenida Paulista", "Rua da Consolação", "Rua Vergueiro", "Avenida São João",
+        "Rua Teodoro Sampaio", "Avenida Ipiranga", "Rua Voluntários da Pátria", "Estrada do M'Boi Mirim"]
+SINTOMAS = ["febre", "dor de cabeça", "tosse seca", "dor no peito", "falta de ar", "náusea",
+            "dor nas costas", "tontura", "coriza", "dor de garganta", "cansaço", "pressão alta"]
+FRASES = ["Estou com {s} desde ontem.", "Sinto {s} quando acordo.", "Tenho {s} há três dias.",
+          "Minha mãe também teve {s}.", "A {s} piorou hoje à noite."]
+RESPOSTA = "Entendi, {s} pode ter várias causas. Há quanto tempo você sente isso?"
+URGENCIAS = ["Alta", "Média", "Baixa"]
+
+
+def _pacientes(rng, ubs, n):
+    # (nome, idade, endereco, telefone, sintomas, nivel, latitude, longitude) e os
+    # endereços do geocodificador offline; cada paciente mora perto de uma UBS
+    pacientes, enderecos = [], []
+    for i in range(n):
+        _, lat_ubs, lon_ubs = rng.choice(ubs)
+        lat = lat_ubs + rng.uniform(-DESLOCAMENTO_MAX, DESLOCAMENTO_MAX)
+        lon = lon_ubs + rng.uniform(-DESLOCAMENTO_MAX, DESLOCAMENTO_MAX)
+        endereco = f"{rng.choice(RUAS)}, {i + 1} - São Paulo"
+        enderecos.append((endereco, lat, lon))
+        sem_coordenadas = rng.random() < SEM_COORDENADAS
+        pacientes.append((
+            f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}",
+            str(rng.randint(1, 99)),
+            endereco,
+            f"(11) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+            ", ".join(rng.sample(SINTOMAS, 2)),
+            rng.choice(URGENCIAS),
+            None if sem_coordenadas else lat,
+            None if sem_coordenadas else lon,
+        ))
+    return pacientes, enderecos
+
+
+def _consultas(rng, ids_ubs, n_pacientes, n):
+    # Horários distintos por UBS em dias úteis; cada paciente tem no máximo uma consulta
+    n = min(n, n_pacientes)
+    horarios = set()
+    consultas = []
+    for id_paciente in rng.sample(range(1, n_pacientes + 1), n):
+        while True:
+            id_ubs = rng.choice(ids_ubs)
+            dia = INICIO_AGENDA + timedelta(days=rng.randrange(DIAS_AGENDA))
+            if dia.isoweekday() > 5:
+                continue
+            momento = dia + timedelta(minutes=30 * rng.randrange(HORARIOS_POR_DIA))
+            if (id_ubs, momento) not in horarios:
+                break
+        horarios.add((id_ubs, momento))
+        consultas.append((id_paciente, id_ubs, formatar(momento), rng.choice(URGENCIAS)))
+    return consultas
+
+
+def _dialogos(rng, n_sessoes, por_sessao):
+    # Conversas longas alternando usuário e assistente, em ordem de tempo
+    inicio = datetime(2025, 1, 1, 8, 0)
+    linhas = []
+    for s in range(n_sessoes):
+        sessao = f"sessao-{s:05d}"
+        momento = inicio + timedelta(minutes=s)
+        for m in range(por_sessao):
+            sintoma = rng.choice(SINTOMAS)
+            if m % 2 == 0:
+                autor, mensagem = "Usuário", rng.choice(FRASES).format(s=sintoma)
+            else:
+                autor, mensagem = "Assistente", RESPOSTA.format(s=sintoma)
+            linhas.append((momento.strftime("%Y-%m-%d %H:%M:%S"), autor, mensagem, sessao))
+            momento += timedelta(seconds=20)
+    linhas.sort()
+    return linhas
+
+
+def gerar(pasta, n_pacientes=5000, n_consultas=3000, n_sessoes=200, por_sessao=100, semente=SEMENTE):
+    # Cria clinica.db, conversas.db e enderecos.csv em pasta; devolve os caminhos e
+    # o que os testes de carga precisam sortear (ids, sessões, consultas)
+    rng = random.Random(semente)
+    clinica = os.path.join(pasta, "clinica.db")
+    conversas = os.path.join(pasta, "conversas.db")
+    enderecos_csv = os.path.join(pasta, "enderecos.csv")
+    for caminho in (clinica, conversas):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+    conn = conectar(clinica)
+    # Esquema completo pelas migrações, a partir do banco vazio (tabelas,
+    # índices, FTS e R*Tree como em produção); os dados entram depois, pelos
+    # mesmos triggers que o app usa
+    aplicar_migracoes(conn, mostrar=False)
+    conn.execute("INSERT INTO medico (nome, login, senha) VALUES ('Dra. Carga', ?, ?)", (LOGIN, SENHA))
+    conn.commit()
+    importar_ubs.importar(conn, os.path.join(RAIZ, importar_ubs.CSV_PATH))
+    ubs = conn.execute("SELECT id, latitude, longitude FROM ubs ORDER BY id").fetchall()
+    ubs = [tuple(u) for u in ubs]
+
+    pacientes, enderecos = _pacientes(rng, ubs, n_pacientes)
+    consultas = _consultas(rng, [u[0] for u in ubs], n_pacientes, n_consultas)
+    dialogos = _dialogos(rng, n_sessoes, por_sessao)
+    agora = INICIO_AGENDA.strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany(
+        "INSERT INTO pacientes (nome, idade, endereco, telefone, sintomas, nivel_atendimento, "
+        "latitude, longitude, data_registro) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (p + (agora,) for p in pacientes)
+    )
+    conn.executemany(
+        "INSERT INTO consulta (id_paciente, id_ubs, data_hora, urgencia) VALUES (?, ?, ?, ?)", consultas
+    )
+    conn.execute("UPDATE pacientes SET consulta_marcada = 1 WHERE id IN (SELECT id_paciente FROM consulta)")
+    conn.executemany("INSERT INTO dialogos (timestamp, autor, mensagem, sessao) VALUES (?, ?, ?, ?)", dialogos)
+    conn.commit()
+    catalogo_ubs.garantir_catalogo(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+    conn = conectar(conversas)
+    registro_dialogos.criar_esquema(conn)
+    conn.executemany("INSERT INTO dialogos (timestamp, autor, mensagem, sessao) VALUES (?, ?, ?, ?)", dialogos)
+    conn.commit()
+    conn.close()
+
+    with open(enderecos_csv, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["endereco", "latitude", "longitude"])
+        escritor.writerows(enderecos)
+
+    return {
+        "clinica": clinica,
+        "conversas": conversas,
+        "enderecos": enderecos_csv,
+        "pacientes": n_pacientes,
+        "consultas": [(c[0], c[1]) for c in consultas],
+        "ubs": [u[0] for u in ubs],
+        "sessoes": [f"sessao-{s:05d}" for s in range(n_sessoes)],
+    }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Uso: python benchmarks/dados_sinteticos.py <pasta> [pacientes] [consultas] "
+              "[sessoes] [mensagens por sessão]")
+        sys.exit(1)
+    numeros = [int(a) for a in sys.argv[2:6]]
+    dados = gerar(sys.argv[1], *numeros)
+    print(f"{dados['pacientes']} pacientes, {len(dados['consultas'])} consultas, {len(dados['ubs'])} UBS, "
+          f"{len(dados['sessoes'])} sessões em {sys.argv[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# Tempo de partida dos dois apps (site da clínica e backend de triagem) sobre
+# dados sintéticos, cada medição num interpretador novo:
+#   importar  - import do módulo do app
+#   criar     - create_app() (com --aquecer, inclui o aquecimento pré-fork)
+#   primeira  - primeira requisição (migrações, modelo, índices sob demanda)
+#   segunda   - a mesma requisição de novo, já aquecida
+# Com --workers N > 1 o processo cria o app, faz fork de N workers (como um
+# servidor pré-fork) e mede a primeira e a segunda requisição em cada um; o
+# custo de cada worker é o que ficou para depois do fork.
+# O resultado vai para benchmarks/resultados/inicializacao-<commit>.json.
+# Uso: python benchmarks/inicializacao.py [--repeticoes N] [--workers 1,4] [--pacientes N]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+
+import dados_sinteticos
+from carga import PASTA_RESULTADOS, commit_atual
+
+REPETICOES = 5
+WORKERS = "1,4"
+APPS = ("clinica", "triagem")
+ETAPAS = ("importar", "criar", "primeira", "segunda")
+
+
+def _requisicao(nome, app):
+    # Uma requisição típica de cada app; devolve o tempo em segundos
+    cliente = app.test_client()
+    inicio = time.perf_counter()
+    if nome == "clinica":
+        with cliente.session_transaction() as sessao:
+            sessao["medico"] = 1
+        resposta = cliente.get("/paciente/1")
+    else:
+        resposta = cliente.post("/chat", json={"message": "Estou com febre", "session_id": "partida"})
+    if resposta.status_code != 200:
+        raise RuntimeError(f"{nome}: status {resposta.status_code}")
+    return time.perf_counter() - inicio
+
+
+def _encerrar(nome, app):
+    from conexao import fechar_pools
+    from registro_dialogos import obter_registro
+    from tarefas import parar_trabalhadores
+
+    parar_trabalhadores()
+    if nome == "triagem":
+        obter_registro(app.config["DB_PATH"]).fechar()
+    fechar_pools()
+
+
+def medir_processo(nome, pasta, workers, aquecer):
+    # Roda dentro do interpretador novo; devolve {etapa: segundos} (ou uma lista
+    # de {primeira, segunda} por worker)
+    inicio = time.perf_counter()
+    if nome == "clinica":
+        import app as modulo
+        banco = os.path.join(pasta, "clinica.db")
+    else:
+        from carga import carregar_backend
+        modulo = carregar_backend()
+        banco = os.path.join(pasta, "conversas.db")
+    importado = time.perf_counter()
+    app = modulo.create_app(banco, pre_aquecer=aquecer)
+    criado = time.perf_counter()
+    resultado = {"importar": importado - inicio, "criar": criado - importado}
+
+    if workers <= 1:
+        resultado["primeira"] = _requisicao(nome, app)
+        resultado["segunda"] = _requisicao(nome, app)
+        _encerrar(nome, app)
+        return resultado
+
+    filhos = []
+    for _ in range(workers):
+        leitura, escrita = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(leitura)
+            try:
+                tempos = {"primeira": _requisicao(nome, app), "segunda": _requisicao(nome, app)}
+                _encerrar(nome, app)
+            except Exception as e:
+                tempos = {"erro": str(e)}
+            with os.fdopen(escrita, "w") as saida:
+                json.dump(tempos, saida)
+            os._exit(0)
+        os.close(escrita)
+        filhos.append((pid, leitura))
+    resultado["workers"] = []
+    for pid, leitura in filhos:
+        with os.fdopen(leitura) as entrada:
+            resultado["workers"].append(json.load(entrada))
+        os.waitpid(pid, 0)
+    _encerrar(nome, app)
+    return resultado
+
+
+def _ambiente(dados):
+    ambiente = dict(os.environ)
+    ambiente.update({
+        "GEOCODER_BACKEND": "offline",
+        "GEOCODER_OFFLINE_CSV": dados["enderecos"],
+        "GEOCODER_OFFLINE_LATENCIA": "0",
+        "MODELO_CHAT": "local",
+        "MODELO_LOCAL_LATENCIA": "0",
+    })
+    return ambiente
+
+
+def rodar(nome, pasta, workers, aquecer, ambiente):
+    comando = [sys.executable, os.path.abspath(__file__), "--processo", nome, pasta, str(workers)]
+    if aquecer:
+        comando.append("--aquecer")
+    saida = subprocess.run(comando, cwd=pasta, env=ambiente, capture_output=True, text=True)
+    if saida.returncode != 0:
+        raise RuntimeError(f"{nome}: {saida.stderr.strip()}")
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def resumir(medicoes):
+    # Mediana em ms de cada etapa; com workers, média e pior caso entre eles
+    resumo = {}
+    for etapa in ETAPAS:
+        valores = []
+        for m in medicoes:
+            if etapa in m:
+                valores.append(m[etapa])
+            elif "workers" in m:
+                valores.extend(w[etapa] for w in m["workers"] if etapa in w)
+        if valores:
+            resumo[etapa] = {"mediana": round(statistics.median(valores) * 1000, 2),
+                             "max": round(max(valores) * 1000, 2)}
+    return resumo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de partida dos apps da clínica e da triagem")
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES)
+    parser.add_argument("--workers", default=WORKERS, help="quantidades de workers separadas por vírgula")
+    parser.add_argument("--pacientes", type=int, default=2000)
+    parser.add_argument("--processo", nargs=3, metavar=("APP", "PASTA", "WORKERS"), help=argparse.SUPPRESS)
+    parser.add_argument("--aquecer", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.processo:
+        nome, pasta, workers = args.processo
+        print(json.dumps(medir_processo(nome, pasta, int(workers), args.aquecer)))
+        return
+
+    niveis = [int(n) for n in args.workers.split(",")]
+    commit = commit_atual()
+    resultados = {}
+    with tempfile.TemporaryDirectory() as pasta:
+        dados = dados_sinteticos.gerar(pasta, args.pacientes, args.pacientes // 2, 50, 20)
+        ambiente = _ambiente(dados)
+        print(f"  {'app':<9}{'workers':>8}{'aquecer':>9}" + "".join(f"{e + ' ms':>14}" for e in ETAPAS))
+        for nome in APPS:
+            for workers in niveis:
+                for aquecer in (False, True):
+                    medicoes = [rodar(nome, pasta, workers, aquecer, ambiente) for _ in range(args.repeticoes)]
+                    resumo = resumir(medicoes)
+                    resultados.setdefault(nome, {}).setdefault(str(workers), {})[
+                        "aquecido" if aquecer else "sob_demanda"] = resumo
+                    print(f"  {nome:<9}{workers:>8}{'sim' if aquecer else 'não':>9}" + "".join(
+                        f"{resumo[e]['mediana']:>14.2f}" for e in ETAPAS))
+
+    saida = {
+        "commit": commit,
+        "data": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("processo", "aquecer")},
+        "apps": resultados,
+    }
+    os.makedirs(PASTA_RESULTADOS, exist_ok=True)
+    arquivo = os.path.join(PASTA_RESULTADOS, f"inicializacao-{commit}.json")
+    with open(arquivo, "w", encoding="utf-8") as f:
+        json.dump(saida, f, ensure_ascii=False, indent=2)
+    print(f"\nResultado salvo em {os.path.relpath(arquivo, RAIZ)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Busca textual (FTS5) em pacientes (nome, endereco, sintomas) e nas mensagens
+# de dialogos. As tabelas FTS usam a própria tabela como conteúdo externo e são
+# mantidas por triggers; o tokenizador ignora acentos ("febre" acha "Febre",
+# "coracao" acha "coração") e a última palavra da busca vale como prefixo.
+import re
+
+# nome pesa mais que sintomas, que pesa mais que endereco (bm25: menor é melhor)
+PESOS = {"pacientes": (10.0, 2.0, 5.0)}
+POR_PAGINA = 20
+MAX_POR_PAGINA = 100
+TOKENIZADOR = "unicode61 remove_diacritics 2"
+
+_TABELAS = {
+    # tabela: (tabela fts, colunas)
+    "pacientes": ("pacientes_fts", ("nome", "endereco", "sintomas")),
+    "dialogos": ("dialogos_fts", ("mensagem",)),
+}
+
+
+def _criar_fts(conn, tabela):
+    fts, colunas = _TABELAS[tabela]
+    lista = ", ".join(colunas)
+    novos = ", ".join(f"new.{c}" for c in colunas)
+    antigos = ", ".join(f"old.{c}" for c in colunas)
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {lista}, content='{tabela}', content_rowid='id',
+            tokenize='{TOKENIZADOR}', prefix='2 3'
+        )
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {tabela} BEGIN
+            INSERT INTO {fts} (rowid, {lista}) VALUES (new.id, {novos});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {tabela} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {lista}) VALUES ('delete', old.id, {antigos});
+        END
+    """)
+    # Só reindexa quando uma coluna indexada muda (não a cada UPDATE de coordenadas)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {lista} ON {tabela} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {lista}) VALUES ('delete', old.id, {antigos});
+            INSERT INTO {fts} (rowid, {lista}) VALUES (new.id, {novos});
+        END
+    """)
+    conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+    pesos = PESOS.get(tabela)
+    if pesos:
+        conn.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', ?)",
+                     (f"bm25({', '.join(map(str, pesos))})",))
+
+
+def criar_esquema(conn):
+    # Sem commit: roda dentro da transação da migração
+    for tabela in _TABELAS:
+        _criar_fts(conn, tabela)
+
+
+def expressao_fts(texto):
+    # Cada palavra vira um termo entre aspas e todas precisam aparecer; a última
+    # vale também como prefixo ("jo" acha "João"). Aspas e operadores digitados
+    # pelo usuário não chegam ao FTS5.
+    termos = [f'"{t}"' for t in re.findall(r"\w+", texto or "")]
+    if termos:
+        termos[-1] += "*"
+    return " ".join(termos)
+
+
+def _paginacao(pagina, por_pagina):
+    pagina = max(1, pagina)
+    por_pagina = max(1, min(por_pagina, MAX_POR_PAGINA))
+    return pagina, por_pagina
+
+
+# Por relevância o FTS calcula o bm25 de todas as linhas encontradas antes de
+# ordenar; por mais recentes ele já percorre o índice na ordem de rowid.
+# (ordem dentro do FTS, ordem do resultado final)
+ORDENACOES = {"relevancia": ("rank", "r.relevancia"), "recentes": ("rowid DESC", "r.rowid DESC")}
+
+
+def buscar_pacientes(conn, texto, pagina=1, por_pagina=POR_PAGINA, ordem="relevancia"):
+    # Registros da página (com a coluna relevancia) e se há próxima página
+    expressao = expressao_fts(texto)
+    if not expressao:
+        return [], False
+    pagina, por_pagina = _paginacao(pagina, por_pagina)
+    # Ordena e pagina só dentro do FTS (rank usa os pesos configurados em
+    # criar_esquema); o JOIN com pacientes fica restrito às linhas da página
+    linhas = conn.execute(f"""
+        SELECT p.*, r.relevancia
+        FROM (
+            SELECT rowid, rank AS relevancia FROM pacientes_fts
+            WHERE pacientes_fts MATCH ?
+            ORDER BY {ORDENACOES[ordem][0]}
+            LIMIT ? OFFSET ?
+        ) r
+        JOIN pacientes p ON p.id = r.rowid
+        ORDER BY {ORDENACOES[ordem][1]}
+    """, (expressao, por_pagina + 1, (pagina - 1) * por_pagina)).fetchall()
+    return linhas[:por_pagina], len(linhas) > por_pagina
+
+
+def buscar_dialogos(conn, texto, pagina=1, por_pagina=POR_PAGINA, ordem="relevancia", sessao=None):
+    # Mensagens da página com o trecho encontrado destacado entre colchetes
+    expressao = expressao_fts(texto)
+    if not expressao:
+        return [], False
+    pagina, por_pagina = _paginacao(pagina, por_pagina)
+    filtro = "AND rowid IN (SELECT id FROM dialogos WHERE sessao = :sessao)" if sessao else ""
+    # Com ORDER BY rank + LIMIT o próprio FTS5 ordena e só calcula o trecho
+    # destacado (snippet) das linhas devolvidas
+    linhas = conn.execute(f"""
+        SELECT d.id, d.timestamp, d.autor, d.sessao, r.trecho, r.relevancia
+        FROM (
+            SELECT rowid, snippet(dialogos_fts, 0, '[', ']', '…', 16) AS trecho, rank AS relevancia
+            FROM dialogos_fts
+            WHERE dialogos_fts MATCH :expressao {filtro}
+            ORDER BY {ORDENACOES[ordem][0]}
+            LIMIT :limite OFFSET :inicio
+        ) r
+        JOIN dialogos d ON d.id = r.rowid
+        ORDER BY {ORDENACOES[ordem][1]}
+    """, {"expressao": expressao, "sessao": sessao, "limite": por_pagina + 1,
+          "inicio": (pagina - 1) * por_pagina}).fetchall()
+    return linhas[:por_pagina], len(linhas) > por_pagina
@@ -0,0 +1,121 @@
+# Catálogo derivado de UBS/AMA: tabela ubs_catalogo persistida e indexada,
+# mais uma cópia quente em memória. Só as unidades com "UBS"/"AMA" no nome,
+# sem duplicatas de (nome, endereco) e com coordenadas válidas entram.
+# A tabela ubs tem um contador de versão mantido por triggers (ubs_versao);
+# o catálogo guarda a versão de que foi derivado e é ressincronizado por diff.
+import sqlite3
+import threading
+
+
+def criar_esquema(conn):
+    # Sem commit: roda dentro da transação da migração
+    conn.execute("CREATE TABLE IF NOT EXISTS ubs_versao (versao INTEGER NOT NULL)")
+    conn.execute("INSERT INTO ubs_versao (versao) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM ubs_versao)")
+    for evento in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS ubs_versao_{evento.lower()} AFTER {evento} ON ubs
+            BEGIN UPDATE ubs_versao SET versao = versao + 1; END
+        """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ubs_catalogo (
+            id INTEGER PRIMARY KEY,
+            nome TEXT NOT NULL,
+            endereco TEXT,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ubs_catalogo_lat_lon ON ubs_catalogo (latitude, longitude)")
+    conn.execute("CREATE TABLE IF NOT EXISTS ubs_catalogo_meta (versao_ubs INTEGER)")
+    conn.execute(
+        "INSERT INTO ubs_catalogo_meta (versao_ubs) SELECT -1 WHERE NOT EXISTS (SELECT 1 FROM ubs_catalogo_meta)"
+    )
+
+
+# Unidades do catálogo derivadas da tabela ubs (primeira de cada nome/endereço)
+SQL_DERIVADO = """
+    SELECT u.id, u.nome, u.endereco, u.latitude, u.longitude
+    FROM ubs u
+    JOIN (
+        SELECT MIN(id) AS id FROM ubs
+        WHERE (upper(nome) LIKE '%UBS%' OR upper(nome) LIKE '%AMA%')
+          AND latitude BETWEEN -90 AND 90
+          AND longitude BETWEEN -180 AND 180
+        GROUP BY nome, endereco
+    ) primeiros ON primeiros.id = u.id
+"""
+
+
+def versao_ubs(conn):
+    # Só leitura: as tabelas são criadas pela migração 1 (migracoes.py)
+    return conn.execute("SELECT versao FROM ubs_versao").fetchone()[0]
+
+
+def sincronizar_catalogo(conn):
+    # Aplica só a diferença entre o catálogo atual e o derivado de ubs,
+    # numa única transação: leitores nunca veem o catálogo vazio.
+    versao = versao_ubs(conn)
+    conn.execute("DROP TABLE IF EXISTS temp.ubs_catalogo_novo")
+    conn.execute(f"CREATE TEMP TABLE ubs_catalogo_novo AS {SQL_DERIVADO}")
+    cur = conn.cursor()
+    cur.execute("""
+        DELETE FROM ubs_catalogo
+        WHERE id NOT IN (SELECT id FROM temp.ubs_catalogo_novo)
+    """)
+    removidas = cur.rowcount
+    cur.execute("""
+        INSERT INTO ubs_catalogo (id, nome, endereco, latitude, longitude)
+        SELECT id, nome, endereco, latitude, longitude FROM temp.ubs_catalogo_novo WHERE true
+        ON CONFLICT (id) DO UPDATE SET
+            nome = excluded.nome,
+            endereco = excluded.endereco,
+            latitude = excluded.latitude,
+            longitude = excluded.longitude
+        WHERE nome IS NOT excluded.nome
+           OR endereco IS NOT excluded.endereco
+           OR latitude IS NOT excluded.latitude
+           OR longitude IS NOT excluded.longitude
+    """)
+    alteradas = cur.rowcount
+    cur.execute("UPDATE ubs_catalogo_meta SET versao_ubs=?", (versao,))
+    conn.commit()
+    conn.execute("DROP TABLE temp.ubs_catalogo_novo")
+    return {"removidas": removidas, "inseridas_ou_alteradas": alteradas, "versao": versao}
+
+
+def garantir_catalogo(conn):
+    # Ressincroniza apenas se a tabela ubs mudou desde a última derivação
+    versao = versao_ubs(conn)
+    derivada = conn.execute("SELECT versao_ubs FROM ubs_catalogo_meta").fetchone()[0]
+    if derivada != versao:
+        sincronizar_catalogo(conn)
+    return versao
+
+
+_catalogo = None
+_versao = None
+_lock = threading.Lock()
+
+
+def _versoes(conn):
+    # (versão atual de ubs, versão de que ubs_catalogo foi derivado); (None, None)
+    # num banco ainda não migrado
+    try:
+        return versao_ubs(conn), conn.execute("SELECT versao_ubs FROM ubs_catalogo_meta").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None, None
+
+
+def obter_catalogo(conn):
+    # Cópia quente do catálogo; só relê quando a versão muda. Não grava nada:
+    # se ubs_catalogo estiver atrasado (ou não existir), deriva direto de ubs
+    global _catalogo, _versao
+    versao, derivada = _versoes(conn)
+    with _lock:
+        if _catalogo is None or versao != _versao:
+            origem = "ubs_catalogo" if versao is not None and derivada == versao else f"({SQL_DERIVADO})"
+            _catalogo = conn.execute(
+                f"SELECT id, nome, endereco, latitude, longitude FROM {origem} ORDER BY id"
+            ).fetchall()
+            _versao = versao
+        return _catalogo, versao
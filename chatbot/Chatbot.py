@@ -1,15 +1,15 @@
 import os
-import sqlite3
-import google.generativeai as genai
+import sys
+import uuid
 from datetime import datetime
 
-# CONFIGURAÇÃO DO GEMINI
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("API key not found. Please set the GOOGLE_API_KEY environment variable.")
-genai.configure(api_key=GOOGLE_API_KEY)
-
-model = genai.GenerativeModel("gemini-2.5-flash")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from conexao import conexao
+from registro_dialogos import obter_registro, criar_esquema as criar_esquema_dialogos
+from modelos import criar_modelo
+from contexto_chat import ConversaLimitada
+import enriquecimento
+import tarefas
 
 system_prompt = (
     "You are an AI Health Assistant. " 
@@ -21,63 +21,45 @@ system_prompt = (
     "and send this link to the person to talk to a real doctor: https://meet.google.com/ovr-ocwa-mxi."
 )
 
-
-chat = model.start_chat(history=[{"role": "user", "parts": [system_prompt]}])
-
-# BANCO DE DADOS SQLIT
-DB_PATH = r"C:\Users\willi\Desktop\site\clinica.db"
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+# BANCO DE DADOS SQLITE (o mesmo clinica.db do site, salvo CLINICA_DB)
+DB_PATH = os.getenv("CLINICA_DB", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "clinica.db")))
+# Identifica as mensagens desta execução na tabela dialogos
+SESSAO = uuid.uuid4().hex
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS dialogos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            autor TEXT,
-            mensagem TEXT
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS pacientes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT,
-            idade TEXT,
-            endereco TEXT,
-            telefone TEXT,
-            sintomas TEXT,
-            data_registro TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+    with conexao(DB_PATH) as conn:
+        criar_esquema_dialogos(conn)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS pacientes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT,
+                idade TEXT,
+                endereco TEXT,
+                telefone TEXT,
+                sintomas TEXT,
+                data_registro TEXT
+            )
+        """)
+        tarefas.criar_esquema(conn)
+        conn.commit()
 
 def salvar_dialogo(autor, mensagem):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO dialogos (timestamp, autor, mensagem) VALUES (?, ?, ?)",
-        (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), autor, mensagem)
-    )
-    conn.commit()
-    conn.close()
+    # Gravação em lote pela thread do registro; a fila é descarregada ao sair
+    obter_registro(DB_PATH).registrar(autor, mensagem, SESSAO)
 
 def salvar_paciente(dados):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO pacientes (nome, idade, endereco, telefone, sintomas, data_registro) VALUES (?, ?, ?, ?, ?, ?)",
-        (dados.get("nome"), dados.get("idade"), dados.get("endereco"),
-         dados.get("telefone"), dados.get("sintomas"),
-         datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-    )
-    conn.commit()
-    conn.close()
+    with conexao(DB_PATH) as conn:
+        cursor = conn.execute(
+            "INSERT INTO pacientes (nome, idade, endereco, telefone, sintomas, data_registro) VALUES (?, ?, ?, ?, ?, ?)",
+            (dados.get("nome"), dados.get("idade"), dados.get("endereco"),
+             dados.get("telefone"), dados.get("sintomas"),
+             datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        )
+        # Geocodificação e UBS próximas ficam com o trabalhador da fila (tarefas.py)
+        enriquecimento.enfileirar(conn, cursor.lastrowid)
+        conn.commit()
     print("✅ Dados do paciente salvos no banco!")
 
-init_db()
-
 # COLETA GUIADA DINÂMICA
 campos = [
     ('nome', "Qual é o seu nome?"),
@@ -87,31 +69,45 @@ campos = [
     ('sintomas', "Quais são os seus sintomas?")
 ]
 
-print("🤖 Chatbot rodando. Digite 'sair' a qualquer momento para encerrar.\n")
-print("Sou seu assistente de saúde. Vou fazer algumas perguntas para entender melhor sua situação.\n")
-paciente = {}
-
-for chave, pergunta in campos:
-    while True:
-        user = input(f"{pergunta}\nVocê: ")
-        if not user.strip():
-            print("Por favor, digite alguma coisa.")
-            continue
-        if user.lower() in {"sair", "exit", "quit"}:
-            print("Encerrando por aqui. Cuide-se!")
-            salvar_dialogo("Sistema", "Sessão encerrada pelo usuário.")
-            exit()
-
-        salvar_dialogo("Usuário", user)
-        paciente[chave] = user
-
-        # Resposta do assistente
-        response = chat.send_message(user)
-        ai_message = response.text or "Desculpe, não consegui gerar uma resposta."
-        print("Assistente:", ai_message)
-        salvar_dialogo("Assistente", ai_message)
-        break  # vai para próxima pergunta
-
-# Salva paciente completo
-salvar_paciente(paciente)
-print("\n✅ Coleta finalizada! Todos os dados foram salvos.")
\ No newline at end of file
+def main():
+    pasta = os.path.dirname(DB_PATH)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    init_db()
+
+    # CONFIGURAÇÃO DO MODELO (Gemini ou local, ver modelos.py); contexto limitado:
+    # os dados já respondidos ficam fixados e os turnos antigos resumidos
+    chat = ConversaLimitada(criar_modelo(), system_prompt)
+
+    print("🤖 Chatbot rodando. Digite 'sair' a qualquer momento para encerrar.\n")
+    print("Sou seu assistente de saúde. Vou fazer algumas perguntas para entender melhor sua situação.\n")
+    paciente = {}
+
+    for chave, pergunta in campos:
+        while True:
+            user = input(f"{pergunta}\nVocê: ")
+            if not user.strip():
+                print("Por favor, digite alguma coisa.")
+                continue
+            if user.lower() in {"sair", "exit", "quit"}:
+                print("Encerrando por aqui. Cuide-se!")
+                salvar_dialogo("Sistema", "Sessão encerrada pelo usuário.")
+                exit()
+
+            salvar_dialogo("Usuário", user)
+            paciente[chave] = user
+
+            # Resposta do assistente
+            response = chat.send_message(user)
+            chat.fixar(chave, user)
+            ai_message = response.text or "Desculpe, não consegui gerar uma resposta."
+            print("Assistente:", ai_message)
+            salvar_dialogo("Assistente", ai_message)
+            break  # vai para próxima pergunta
+
+    # Salva paciente completo
+    salvar_paciente(paciente)
+    print("\n✅ Coleta finalizada! Todos os dados foram salvos.")
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, current_app
 from dotenv import load_dotenv
 load_dotenv()
 import os
-import sqlite3
-import google.generativeai as genai
-from datetime import datetime
+import sys
+import json
+import hashlib
+import threading
+import uuid
 from flask_cors import CORS
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from conexao import conexao, fechar_pools
+import metricas
+from registro_dialogos import obter_registro, criar_esquema as criar_esquema_dialogos
+from modelos import criar_modelo, importar_dependencias
+from sessoes_chat import GerenciadorSessoes
+from contexto_chat import ConversaLimitada, CAMPOS, PERGUNTAS, estatisticas as estatisticas_contexto
+
 # =============================
-# CONFIG GEMINI
+# CONFIG MODELO (Gemini ou local, ver modelos.py)
 # =============================
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("API key not found. Please set the GOOGLE_API_KEY environment variable.")
-
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel("gemini-2.5-flash")
-
 system_prompt = (
     "You are an AI Health Assistant. "
     "Your role is to gather basic information (Name, Age, Zip Code, Phone Number, and Symptoms) "
@@ -27,100 +30,258 @@ system_prompt = (
     "and send this link to the person to talk to a real doctor: https://meet.google.com/ovr-ocwa-mxi."
 )
 
-# Inicializa o chat com histórico inicial
-chat = model.start_chat(history=[{"role": "user", "parts": [system_prompt]}])
+# O modelo (e a biblioteca do Gemini) só é criado na primeira conversa do processo
+_modelo = None
+_modelo_lock = threading.Lock()
+
+def obter_modelo():
+    global _modelo
+    with _modelo_lock:
+        if _modelo is None:
+            _modelo = criar_modelo()
+        return _modelo
+
+# Um chat por conversa com contexto limitado: prompt do sistema, dados fixados,
+# resumo dos turnos antigos e os últimos turnos na íntegra
+sessoes = GerenciadorSessoes(lambda: ConversaLimitada(obter_modelo(), system_prompt))
 
 # =============================
 # BANCO SQLITE
 # =============================
-DB_PATH = os.path.join(os.path.dirname(__file__), "conversas.db")
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS dialogos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            autor TEXT,
-            mensagem TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-def salvar_dialogo(autor, mensagem):
+DB_PATH = os.getenv("TRIAGEM_DB", os.path.join(os.path.dirname(__file__), "conversas.db"))
+
+# Bancos cujo esquema já foi criado neste processo (ou no mestre, antes do fork)
+_preparados = set()
+_preparados_lock = threading.Lock()
+
+def init_db(db_path=None):
+    db_path = db_path or DB_PATH
+    if db_path in _preparados:
+        return
+    with _preparados_lock:
+        if db_path in _preparados:
+            return
+        with conexao(db_path) as conn:
+            criar_esquema_dialogos(conn)
+            conn.commit()
+        _preparados.add(db_path)
+
+def salvar_dialogo(autor, mensagem, sessao=None):
     # Converte objetos em string, se necessário
     if not isinstance(mensagem, str):
         mensagem = str(mensagem)
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO dialogos (timestamp, autor, mensagem) VALUES (?, ?, ?)",
-        (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), autor, mensagem)
-    )
-    conn.commit()
-    conn.close()
-
-def salvar_paciente(dados):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO pacientes (nome, idade, endereco, telefone, sintomas, data_registro) VALUES (?, ?, ?, ?, ?, ?)",
-        (dados.get("nome"), dados.get("idade"), dados.get("endereco"),
-         dados.get("telefone"), dados.get("sintomas"),
-         datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-    )
-    conn.commit()
-    conn.close()
-    print("✅ Dados do paciente salvos no banco!")
-
-init_db()    
+    # Gravação em lote pela thread do registro; a fila é descarregada ao sair
+    obter_registro(current_app.config["DB_PATH"]).registrar(autor, mensagem, sessao)
 
 # =============================
 # FLASK APP
 # =============================
-app = Flask(__name__)
-CORS(app)  # permite frontend acessar backend
+# (regra, função, opções) registradas por @rota e adicionadas em create_app
+ROTAS = []
+
+def rota(regra, **opcoes):
+    def registrar_rota(funcao):
+        ROTAS.append((regra, funcao, opcoes))
+        return funcao
+    return registrar_rota
+
+def preparar_banco():
+    init_db(current_app.config["DB_PATH"])
+
+def aquecer(app):
+    # Gancho pré-fork: cria o esquema e importa a biblioteca do modelo. O cliente
+    # do modelo, a thread do registro e as conexões ficam para cada worker.
+    init_db(app.config["DB_PATH"])
+    importar_dependencias()
+    fechar_pools()
 
-@app.route("/chat", methods=["POST"])
+def create_app(db_path=None, pre_aquecer=False):
+    # Com vários workers: gunicorn -w 4 --preload "app:create_app(pre_aquecer=True)"
+    app = Flask(__name__)
+    app.config["DB_PATH"] = db_path or DB_PATH
+    CORS(app)  # permite frontend acessar backend
+    # Histogramas por rota, SQL e chamadas ao modelo em /metrics (ver metricas.py)
+    metricas.instrumentar(app, "triagem")
+    app.before_request(preparar_banco)
+    for regra, funcao, opcoes in ROTAS:
+        app.add_url_rule(regra, view_func=funcao, **opcoes)
+    if pre_aquecer:
+        aquecer(app)
+    return app
+
+def proximo_campo(sessao):
+    # Próximo dado a coletar segundo o estado do servidor (None quando todos
+    # estão fixados); se a sessão foi despejada, a coleta recomeça do início
+    fixados = sessoes.campos_fixados(sessao)
+    for campo in CAMPOS:
+        if campo not in fixados:
+            return {"campo": campo, "pergunta": PERGUNTAS[campo]}
+    return None
+
+@rota("/chat", methods=["POST"])
 def chat_api():
     data = request.json
     user_message = data.get("message", "")
+    # Sem session_id o cliente ganha uma conversa nova (devolvida na resposta)
+    sessao = data.get("session_id") or uuid.uuid4().hex
+    stream = bool(data.get("stream")) or request.args.get("stream") == "1"
 
     if not user_message:
         return jsonify({"error": "Mensagem vazia"}), 400
 
+    # Opcional: "campo" indica qual dado do paciente a mensagem responde
+    campo = data.get("campo")
+    if campo is not None and campo not in CAMPOS:
+        return jsonify({"error": "Campo inválido"}), 400
+
     # Salva mensagem do usuário
-    salvar_dialogo("Usuário", user_message)
+    salvar_dialogo("Usuário", user_message, sessao)
+    if campo:
+        sessoes.fixar(sessao, campo, user_message)
 
-    # Obtém resposta do Gemini AI
-    response = chat.send_message(user_message)
+    if stream:
+        return Response(stream_with_context(chat_stream(sessao, user_message)),
+                        mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    # Extrai texto da resposta
-    if isinstance(response, str):
-        ai_message = response
-    else:
-        ai_message = getattr(response, "text", str(response))
+    # Obtém resposta do modelo na sessão desta conversa
+    ai_message = sessoes.enviar(sessao, user_message)
 
     # Salva resposta do assistente
-    salvar_dialogo("Assistente", ai_message)
+    salvar_dialogo("Assistente", ai_message, sessao)
 
-    return jsonify({"reply": ai_message})
+    return jsonify({"reply": ai_message, "session_id": sessao, "proximo_campo": proximo_campo(sessao)})
 
-@app.route("/history", methods=["GET"])
+@rota("/chat/campos", methods=["GET"])
+def campos_chat():
+    # Onde a coleta guiada da conversa está (o frontend pergunta ao abrir a página)
+    sessao = request.args.get("session_id", "")
+    return jsonify({"session_id": sessao, "proximo_campo": proximo_campo(sessao)})
+
+def evento_sse(dados, evento=None):
+    linhas = f"event: {evento}\n" if evento else ""
+    return linhas + f"data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+def chat_stream(sessao, user_message):
+    # Server-Sent Events: um evento por trecho e um "fim" com a resposta completa
+    partes = []
+    try:
+        for trecho in sessoes.enviar_stream(sessao, user_message):
+            if trecho:
+                partes.append(trecho)
+                yield evento_sse({"delta": trecho})
+    except Exception as e:
+        yield evento_sse({"error": str(e)}, "erro")
+        return
+    ai_message = "".join(partes)
+    salvar_dialogo("Assistente", ai_message, sessao)
+    yield evento_sse({"reply": ai_message, "session_id": sessao, "proximo_campo": proximo_campo(sessao)}, "fim")
+
+@rota("/chat/contexto", methods=["GET"])
+def contexto_metricas():
+    # Tamanho dos prompts enviados ao modelo (caracteres e tokens estimados)
+    return jsonify(estatisticas_contexto.resumo())
+
+HISTORICO_LIMITE_PADRAO = 100
+HISTORICO_LIMITE_MAXIMO = 1000
+EXPORTACAO_LOTE = 500
+
+def filtro_sessao(sessao):
+    if sessao is None:
+        return "", ()
+    return " AND sessao = ?", (sessao,)
+
+def etag_historico(conn, sessao, *partes):
+    # dialogos só cresce no fim (e a retenção só apaga o começo), então o
+    # par (menor id, maior id) identifica o conteúdo sem ler as mensagens
+    where, params = filtro_sessao(sessao)
+    menor, maior = conn.execute(
+        f"SELECT (SELECT id FROM dialogos WHERE 1=1{where} ORDER BY id ASC LIMIT 1),"
+        f" (SELECT id FROM dialogos WHERE 1=1{where} ORDER BY id DESC LIMIT 1)",
+        params + params
+    ).fetchone()
+    chave = json.dumps([sessao, menor, maior, *partes])
+    return hashlib.sha1(chave.encode()).hexdigest()
+
+def dialogo_json(row):
+    return {"id": row["id"], "timestamp": row["timestamp"], "autor": row["autor"],
+            "mensagem": row["mensagem"], "sessao": row["sessao"]}
+
+@rota("/history", methods=["GET"])
 def get_history():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT timestamp, autor, mensagem FROM dialogos ORDER BY id ASC")
-    rows = cursor.fetchall()
-    conn.close()
+    # Paginação por chave: ?after_id=<último id recebido>&limit=<n>&sessao=<id>
+    after_id = request.args.get("after_id", 0, type=int)
+    limit = request.args.get("limit", HISTORICO_LIMITE_PADRAO, type=int)
+    limit = max(1, min(limit, HISTORICO_LIMITE_MAXIMO))
+    sessao = request.args.get("sessao")
+    where, params = filtro_sessao(sessao)
+
+    with conexao(current_app.config["DB_PATH"]) as conn:
+        etag = etag_historico(conn, sessao, after_id, limit)
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+        rows = conn.execute(
+            f"SELECT id, timestamp, autor, mensagem, sessao FROM dialogos"
+            f" WHERE id > ?{where} ORDER BY id ASC LIMIT ?",
+            (after_id, *params, limit)
+        ).fetchall()
+
+    history = [dialogo_json(row) for row in rows]
+    response = jsonify({
+        "dialogos": history,
+        "next_after_id": history[-1]["id"] if len(history) == limit else None,
+    })
+    response.set_etag(etag)
+    return response
+
+@rota("/history/export", methods=["GET"])
+def export_history():
+    # Exportação completa em streaming (NDJSON por padrão, ?formato=json para array)
+    sessao = request.args.get("sessao")
+    formato = request.args.get("formato", "ndjson")
+    if formato not in ("ndjson", "json"):
+        return jsonify({"error": "Formato inválido"}), 400
+    where, params = filtro_sessao(sessao)
+    db_path = current_app.config["DB_PATH"]
+
+    with conexao(db_path) as conn:
+        etag = etag_historico(conn, sessao, formato)
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+    def gerar():
+        # A conexão fica com o gerador até o fim da resposta; as linhas
+        # saem do cursor em blocos, sem montar a lista inteira na memória
+        with conexao(db_path) as conn:
+            cursor = conn.execute(
+                f"SELECT id, timestamp, autor, mensagem, sessao FROM dialogos"
+                f" WHERE 1=1{where} ORDER BY id ASC", params
+            )
+            primeiro = True
+            if formato == "json":
+                yield "["
+            while True:
+                rows = cursor.fetchmany(EXPORTACAO_LOTE)
+                if not rows:
+                    break
+                partes = []
+                for row in rows:
+                    item = json.dumps(dialogo_json(row), ensure_ascii=False)
+                    if formato == "json":
+                        partes.append(item if primeiro else "," + item)
+                        primeiro = False
+                    else:
+                        partes.append(item + "\n")
+                yield "".join(partes)
+            if formato == "json":
+                yield "]"
 
-    # Retorna como lista de objetos JSON
-    history = [{"timestamp": ts, "autor": autor, "mensagem": msg} for ts, autor, msg in rows]
-    return jsonify(history)
+    mimetype = "application/x-ndjson" if formato == "ndjson" else "application/json"
+    response = Response(gerar(), mimetype=mimetype)
+    response.set_etag(etag)
+    return response
 
 if __name__ == "__main__":
-    init_db()
-    app.run(port=5000, debug=True)
\ No newline at end of file
+    create_app().run(port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,107 @@
+# Gerenciamento compartilhado de conexões SQLite (site, chatbot e backend de triagem).
+# Cada banco tem um pool de conexões já configuradas: WAL para que leitores e
+# escritores não se bloqueiem, synchronous=NORMAL, cache de páginas, mmap,
+# busy timeout e cache de comandos preparados (reaproveitado entre requisições
+# porque a conexão não é fechada ao final de cada uso).
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from metricas import ConexaoMedida
+
+TAMANHO_POOL = 8
+CACHE_COMANDOS = 256
+TIMEOUT_OCUPADO_MS = 5000
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",      # ~16 MB por conexão
+    "PRAGMA mmap_size=134217728",    # 128 MB
+    f"PRAGMA busy_timeout={TIMEOUT_OCUPADO_MS}",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def conectar(db_path):
+    conn = sqlite3.connect(
+        db_path,
+        timeout=TIMEOUT_OCUPADO_MS / 1000,
+        cached_statements=CACHE_COMANDOS,
+        check_same_thread=False,
+        factory=ConexaoMedida,  # tempo de cada comando em metricas.SQL
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class PoolConexoes:
+    def __init__(self, db_path, tamanho=TAMANHO_POOL):
+        self.db_path = db_path
+        self.tamanho = tamanho
+        self._livres = queue.LifoQueue(maxsize=tamanho)
+        self._fechado = False
+
+    def adquirir(self):
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            return conectar(self.db_path)
+
+    def devolver(self, conn):
+        # Transação esquecida aberta não pode vazar para o próximo uso
+        if conn.in_transaction:
+            conn.rollback()
+        if self._fechado:
+            conn.close()
+            return
+        try:
+            self._livres.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def conexao(self):
+        conn = self.adquirir()
+        try:
+            yield conn
+        finally:
+            self.devolver(conn)
+
+    def fechar(self):
+        self._fechado = True
+        while True:
+            try:
+                self._livres.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def obter_pool(db_path):
+    chave = os.path.abspath(db_path)
+    with _pools_lock:
+        if chave not in _pools:
+            _pools[chave] = PoolConexoes(db_path)
+        return _pools[chave]
+
+
+@contextmanager
+def conexao(db_path):
+    with obter_pool(db_path).conexao() as conn:
+        yield conn
+
+
+@atexit.register
+def fechar_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.fechar()
+        _pools.clear()
@@ -0,0 +1,62 @@
+# Consultas SQL das telas de agendamento. Ficam aqui para que o app e a
+# verificação de planos (python migracoes.py --verificar) usem o mesmo texto.
+
+# Anti-join: para cada paciente basta uma busca no índice de consulta(id_paciente)
+PACIENTES_PENDENTES = """
+    SELECT p.* FROM pacientes p
+    WHERE NOT EXISTS (SELECT 1 FROM consulta c WHERE c.id_paciente = p.id)
+"""
+
+PACIENTES_AGENDADOS = """
+    SELECT p.*, c.data_hora, u.nome as ubs_nome
+    FROM consulta c
+    JOIN pacientes p ON p.id = c.id_paciente
+    JOIN ubs u ON c.id_ubs = u.id
+    ORDER BY c.data_hora DESC
+"""
+
+ULTIMA_CONSULTA_UBS = """
+    SELECT * FROM consulta WHERE id_paciente=? AND id_ubs=? ORDER BY data_hora DESC LIMIT 1
+"""
+
+ULTIMA_CONSULTA = """
+    SELECT * FROM consulta WHERE id_paciente=? ORDER BY data_hora DESC LIMIT 1
+"""
+
+# Dados dos atestados em lote, com a consulta mais recente de cada paciente
+ATESTADOS_PACIENTES = """
+    SELECT p.id, p.nome, p.idade, p.endereco, c.data_hora, c.urgencia
+    FROM pacientes p
+    LEFT JOIN consulta c ON c.id = (
+        SELECT id FROM consulta WHERE id_paciente = p.id ORDER BY data_hora DESC LIMIT 1
+    )
+    WHERE p.id IN ({marcadores})
+    ORDER BY p.nome
+"""
+
+ATESTADOS_DO_MES = """
+    SELECT p.id, p.nome, p.idade, p.endereco, MAX(c.data_hora) AS data_hora, c.urgencia
+    FROM consulta c
+    JOIN pacientes p ON p.id = c.id_paciente
+    WHERE c.data_hora >= :mes || '-01' AND c.data_hora < date(:mes || '-01', '+1 month')
+    GROUP BY p.id
+    ORDER BY p.nome
+"""
+
+# Marcação: alguma consulta da UBS começa dentro da faixa (ver agenda_ubs.py)
+CONFLITO_AGENDA = """
+    SELECT 1 FROM consulta
+    WHERE id_ubs = :id_ubs AND data_hora > :inicio AND data_hora < :fim AND status IS NOT :cancelada
+    LIMIT 1
+"""
+
+# (nome, sql, parâmetros, tabelas que podem ser percorridas por inteiro)
+# Em pacientes pendentes a lista inteira de pacientes é o próprio resultado.
+CONSULTAS_CRITICAS = [
+    ("pacientes pendentes", PACIENTES_PENDENTES, (), {"p"}),
+    ("pacientes agendados", PACIENTES_AGENDADOS, (), set()),
+    ("consulta confirmada", ULTIMA_CONSULTA_UBS, (1, 1), set()),
+    ("atestado", ULTIMA_CONSULTA, (1,), set()),
+    ("conflito de agenda", CONFLITO_AGENDA,
+     {"id_ubs": 1, "inicio": "2025-01-01 08:00:00", "fim": "2025-01-01 09:00", "cancelada": "Cancelada"}, set()),
+]
@@ -0,0 +1,156 @@
+# Janela de contexto limitada para a conversa de triagem.
+# Em vez de reenviar o histórico inteiro a cada turno, o prompt é montado com:
+#   - o prompt do sistema;
+#   - os dados já coletados do paciente (nome, idade, endereco, telefone,
+#     sintomas) fixados como estado compacto;
+#   - um resumo dos turnos antigos;
+#   - os últimos N turnos na íntegra.
+# O tamanho do prompt de cada turno é medido (caracteres e tokens estimados).
+import threading
+from collections import deque
+
+TURNOS_NA_INTEGRA = 6
+MAX_CARACTERES_RESUMO = 1500
+MAX_CARACTERES_TRECHO = 160  # por fala no resumo extrativo
+CARACTERES_POR_TOKEN = 4  # estimativa; evita uma chamada de rede ao count_tokens
+MAX_METRICAS = 50  # medidas dos últimos turnos guardadas por conversa
+CAMPOS = ("nome", "idade", "endereco", "telefone", "sintomas")
+# Pergunta de cada campo na coleta guiada (as mesmas do Chatbot.py)
+PERGUNTAS = {
+    "nome": "Qual é o seu nome?",
+    "idade": "Qual é a sua idade?",
+    "endereco": "Qual é o seu endereço?",
+    "telefone": "Qual é o seu telefone?",
+    "sintomas": "Quais são os seus sintomas?",
+}
+
+
+def _encurtar(texto, limite=MAX_CARACTERES_TRECHO):
+    texto = " ".join(str(texto).split())
+    return texto if len(texto) <= limite else texto[:limite - 1] + "…"
+
+
+def resumo_extrativo(resumo, usuario, assistente, limite=MAX_CARACTERES_RESUMO):
+    # Acrescenta o turno como uma linha curta e descarta as linhas mais antigas
+    linhas = resumo.splitlines() if resumo else []
+    linhas.append(f"- Paciente: {_encurtar(usuario)} | Assistente: {_encurtar(assistente)}")
+    while len(linhas) > 1 and sum(len(l) + 1 for l in linhas) > limite:
+        linhas.pop(0)
+    return "\n".join(linhas)
+
+
+class EstatisticasContexto:
+    def __init__(self, amostras=1000):
+        self._lock = threading.Lock()
+        self.turnos = 0
+        self.caracteres_total = 0
+        self.caracteres_max = 0
+        self.recentes = deque(maxlen=amostras)
+
+    def registrar(self, medida):
+        with self._lock:
+            self.turnos += 1
+            self.caracteres_total += medida["caracteres"]
+            self.caracteres_max = max(self.caracteres_max, medida["caracteres"])
+            self.recentes.append(medida)
+
+    def resumo(self):
+        with self._lock:
+            recentes = sorted(m["caracteres"] for m in self.recentes)
+            return {
+                "turnos": self.turnos,
+                "caracteres_medio": self.caracteres_total / self.turnos if self.turnos else 0,
+                "caracteres_max": self.caracteres_max,
+                "caracteres_p95_recentes": recentes[int(len(recentes) * 0.95) - 1] if recentes else 0,
+                "tokens_estimados_medio": (self.caracteres_total / self.turnos / CARACTERES_POR_TOKEN
+                                           if self.turnos else 0),
+            }
+
+
+estatisticas = EstatisticasContexto()
+
+
+class _RespostaStream:
+    # Repassa os trechos do modelo e fecha o turno quando a resposta termina
+    def __init__(self, resposta, ao_terminar):
+        self._resposta = resposta
+        self._ao_terminar = ao_terminar
+
+    def __iter__(self):
+        partes = []
+        for trecho in self._resposta:
+            partes.append(getattr(trecho, "text", "") or "")
+            yield trecho
+        self._ao_terminar("".join(partes))
+
+
+class ConversaLimitada:
+    # Mesma interface do ChatSession (send_message), com contexto limitado
+    def __init__(self, modelo, system_prompt, turnos_na_integra=TURNOS_NA_INTEGRA,
+                 max_caracteres_resumo=MAX_CARACTERES_RESUMO, resumidor=resumo_extrativo):
+        self.modelo = modelo
+        self.system_prompt = system_prompt
+        self.turnos_na_integra = turnos_na_integra
+        self.max_caracteres_resumo = max_caracteres_resumo
+        self.resumidor = resumidor
+        self.campos = {}
+        self.resumo = ""
+        self.turnos = []  # [(usuario, assistente)]
+        self.metricas = deque(maxlen=MAX_METRICAS)
+        self.turnos_medidos = 0
+
+    def fixar(self, campo, valor):
+        if campo not in CAMPOS:
+            raise ValueError(f"Campo desconhecido: {campo}")
+        self.campos[campo] = _encurtar(valor, 300)
+
+    def tamanho(self):
+        # Caracteres mantidos em memória: dados fixados, resumo e turnos na íntegra
+        return (sum(len(c) + len(v) for c, v in self.campos.items()) + len(self.resumo)
+                + sum(len(u) + len(a) for u, a in self.turnos))
+
+    def _preambulo(self):
+        partes = [self.system_prompt]
+        if self.campos:
+            dados = "; ".join(f"{c}: {self.campos[c]}" for c in CAMPOS if c in self.campos)
+            partes.append(f"Dados já coletados do paciente: {dados}.")
+        if self.resumo:
+            partes.append(f"Resumo da conversa até aqui:\n{self.resumo}")
+        return "\n\n".join(partes)
+
+    def _montar(self, mensagem):
+        conteudo = [{"role": "user", "parts": [self._preambulo()]}]
+        for usuario, assistente in self.turnos:
+            conteudo.append({"role": "user", "parts": [usuario]})
+            conteudo.append({"role": "model", "parts": [assistente]})
+        conteudo.append({"role": "user", "parts": [mensagem]})
+        return conteudo
+
+    def _medir(self, conteudo):
+        caracteres = sum(len(p) for item in conteudo for p in item["parts"])
+        self.turnos_medidos += 1
+        medida = {
+            "turno": self.turnos_medidos,
+            "caracteres": caracteres,
+            "tokens_estimados": caracteres // CARACTERES_POR_TOKEN,
+            "turnos_na_integra": len(self.turnos),
+            "caracteres_resumo": len(self.resumo),
+        }
+        self.metricas.append(medida)
+        estatisticas.registrar(medida)
+        return medida
+
+    def _fechar_turno(self, mensagem, resposta):
+        self.turnos.append((mensagem, resposta))
+        while len(self.turnos) > self.turnos_na_integra:
+            usuario, assistente = self.turnos.pop(0)
+            self.resumo = self.resumidor(self.resumo, usuario, assistente, self.max_caracteres_resumo)
+
+    def send_message(self, mensagem, stream=False):
+        conteudo = self._montar(mensagem)
+        self._medir(conteudo)
+        resposta = self.modelo.gerar(conteudo, stream=stream)
+        if stream:
+            return _RespostaStream(resposta, lambda texto: self._fechar_turno(mensagem, texto))
+        self._fechar_turno(mensagem, resposta.text)
+        return resposta
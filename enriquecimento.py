@@ -0,0 +1,162 @@
+# Enriquecimento de pacientes em segundo plano (tarefa "enriquecer_paciente").
+# Ao salvar um paciente, o chatbot enfileira a tarefa; o trabalhador geocodifica
+# o endereço, calcula as TOP_K UBS mais próximas (até RAIO_MAX_KM) e grava a
+# lista em paciente_ubs_proximas. A página do paciente só lê essas linhas; na
+# falta delas enfileira a tarefa e usa as coordenadas já conhecidas.
+# O resultado vale enquanto o catálogo de UBS não muda (versao_ubs) e as
+# coordenadas do paciente continuam as mesmas; fora disso é recalculado.
+import tarefas
+from catalogo_ubs import garantir_catalogo
+from geocodificacao import obter_geocodificador
+
+TIPO = "enriquecer_paciente"
+TOP_K = 120  # folga sobre o máximo de UBS a 5 km no catálogo atual (~75, no centro)
+RAIO_MAX_KM = 10
+
+
+def criar_esquema(conn):
+    # Sem commit: roda dentro da transação da migração
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS paciente_enriquecimento (
+            id_paciente INTEGER PRIMARY KEY,
+            latitude REAL,
+            longitude REAL,
+            versao_ubs INTEGER,
+            concluido_em TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS paciente_ubs_proximas (
+            id_paciente INTEGER,
+            posicao INTEGER,
+            id_ubs INTEGER,
+            distancia_km REAL,
+            PRIMARY KEY (id_paciente, posicao)
+        ) WITHOUT ROWID
+    """)
+
+
+def enfileirar(conn, id_paciente):
+    # Sem commit: entra na transação que gravou o paciente
+    return tarefas.enfileirar(conn, TIPO, {"id_paciente": id_paciente}, chave=str(id_paciente))
+
+
+def enfileirar_pendentes(conn):
+    # Pacientes ainda sem enriquecimento (carga inicial e bancos antigos)
+    ids = conn.execute("""
+        SELECT p.id FROM pacientes p
+        WHERE NOT EXISTS (SELECT 1 FROM paciente_enriquecimento e WHERE e.id_paciente = p.id)
+    """).fetchall()
+    return sum(1 for (i,) in ids if enfileirar(conn, i) is not None)
+
+
+@tarefas.tratador(TIPO)
+def enriquecer(conn, id_paciente, k=TOP_K, raio_max_km=RAIO_MAX_KM):
+    paciente = conn.execute("SELECT * FROM pacientes WHERE id=?", (id_paciente,)).fetchone()
+    if paciente is None:
+        return "paciente não encontrado"
+    # A geocodificação (rede) fica fora da transação de escrita
+    coord = obter_geocodificador().coordenadas_paciente(conn, paciente)
+    if not coord:
+        # Sem linha gravada: a página tenta de novo (o geocache evita repetir a consulta)
+        return "endereço não localizado"
+    # Importado aqui: quem só enfileira (os chatbots) não precisa do geopy
+    from indice_ubs import obter_indice
+
+    versao = garantir_catalogo(conn)
+    proximas = obter_indice(conn).mais_proximas(coord, k, raio_max_km)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM paciente_ubs_proximas WHERE id_paciente=?", (id_paciente,))
+        conn.executemany(
+            "INSERT INTO paciente_ubs_proximas (id_paciente, posicao, id_ubs, distancia_km) VALUES (?, ?, ?, ?)",
+            [(id_paciente, i, u["id"], d) for i, (u, d) in enumerate(proximas)]
+        )
+        conn.execute("""
+            INSERT OR REPLACE INTO paciente_enriquecimento
+                (id_paciente, latitude, longitude, versao_ubs, concluido_em)
+            VALUES (?, ?, ?, ?, datetime('now', 'localtime'))
+        """, (id_paciente, coord[0], coord[1], versao))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return f"{len(proximas)} UBS"
+
+
+def ubs_proximas(conn, paciente, raio_km):
+    # (coordenadas, [(registro, distancia_km)]) já calculados, ou None se o
+    # paciente ainda não foi processado ou o resultado ficou desatualizado
+    pronto = conn.execute(
+        "SELECT latitude, longitude, versao_ubs FROM paciente_enriquecimento WHERE id_paciente=?",
+        (paciente["id"],)
+    ).fetchone()
+    if pronto is None or pronto["versao_ubs"] != garantir_catalogo(conn):
+        return None
+    coord = (pronto["latitude"], pronto["longitude"])
+    if paciente["latitude"] is not None and (paciente["latitude"], paciente["longitude"]) != coord:
+        return None
+    linhas = conn.execute("""
+        SELECT c.id, c.nome, c.endereco, c.latitude, c.longitude, p.distancia_km
+        FROM paciente_ubs_proximas p JOIN ubs_catalogo c ON c.id = p.id_ubs
+        WHERE p.id_paciente = ? AND p.distancia_km <= ?
+        ORDER BY p.posicao
+    """, (paciente["id"], raio_km)).fetchall()
+    return coord, [(u, u["distancia_km"]) for u in linhas]
+
+
+def agendar(conn, id_paciente):
+    # Enfileira numa transação própria e acorda o trabalhador deste processo.
+    # A leitura antes do lock evita disputar o banco quando a tarefa já está na fila
+    ativa = conn.execute(
+        "SELECT 1 FROM tarefas WHERE tipo = ? AND chave = ? AND estado IN (?, ?)",
+        (TIPO, str(id_paciente), tarefas.PENDENTE, tarefas.EXECUTANDO)
+    ).fetchone()
+    if ativa is not None:
+        return None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        id_tarefa = enfileirar(conn, id_paciente)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if id_tarefa is not None:
+        tarefas.despertar(conn.execute("PRAGMA database_list").fetchone()[2])
+    return id_tarefa
+
+
+def _calcular_em_memoria(conn, paciente, raio_km):
+    # Alternativa sem rede e sem gravação: coordenadas já conhecidas (paciente
+    # ou geocache) no índice em memória; (None, []) se o endereço ainda não foi
+    # geocodificado pela tarefa
+    from indice_ubs import obter_indice
+
+    try:
+        if paciente["latitude"] is not None and paciente["longitude"] is not None:
+            coord = (paciente["latitude"], paciente["longitude"])
+        else:
+            coord = obter_geocodificador().coordenadas_em_cache(conn, paciente["endereco"])
+        if not coord:
+            return None, []
+        return coord, obter_indice(conn).dentro_do_raio(coord, raio_km)
+    except Exception as e:
+        print(f"⚠️ UBS próximas do paciente {paciente['id']} indisponíveis: {e}")
+        return None, []
+
+
+def obter_ubs_proximas(conn, paciente, raio_km):
+    # Leitura da página: usa o pré-calculado; se ainda não houver (ou estiver
+    # desatualizado), enfileira a tarefa e responde com o cálculo em memória,
+    # sem geocodificar na requisição.
+    # Devolve (coordenadas ou None, [(registro, distancia_km)])
+    pronto = ubs_proximas(conn, paciente, raio_km)
+    if pronto is not None:
+        return pronto
+    try:
+        agendar(conn, paciente["id"])
+    except Exception as e:
+        # Banco ocupado: a página sai mesmo assim e a próxima visita tenta de novo
+        print(f"⚠️ Não foi possível enfileirar o paciente {paciente['id']}: {e}")
+    return _calcular_em_memoria(conn, paciente, raio_km)
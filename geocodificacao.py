@@ -0,0 +1,214 @@
+# Camada de geocodificação com cache persistente (tabela geocache) e LRU em memória.
+# O backend é plugável: Nominatim (padrão) ou um backend offline para testes.
+# Escolha por variável de ambiente: GEOCODER_BACKEND=nominatim|offline
+# (o offline lê GEOCODER_OFFLINE_CSV com colunas endereco,latitude,longitude
+# e espera GEOCODER_OFFLINE_LATENCIA segundos por consulta, simulando a rede).
+import csv
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from metricas import EXTERNAS, medir
+
+TAMANHO_LRU = 1024
+# Endereços não encontrados são tentados de novo depois desse prazo (geocache e LRU)
+VALIDADE_NEGATIVA = timedelta(days=1)
+_NAO_ENCONTRADO = object()
+
+
+def normalizar_endereco(endereco):
+    texto = unicodedata.normalize("NFKD", endereco or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w,\-]+", " ", texto.lower())
+    texto = re.sub(r"\s*,\s*", ", ", texto)
+    return re.sub(r"\s+", " ", texto).strip(" ,")
+
+
+class GeocodificadorNominatim:
+    nome = "nominatim"
+
+    def __init__(self, user_agent="clinica_app", timeout=10):
+        from geopy.geocoders import Nominatim
+        self._geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    def geocodificar(self, endereco):
+        location = self._geolocator.geocode(endereco)
+        if not location:
+            return None
+        return (location.latitude, location.longitude)
+
+
+class GeocodificadorOffline:
+    # Resolve apenas endereços conhecidos, sem acesso à rede
+    nome = "offline"
+
+    def __init__(self, enderecos=None, arquivo=None, latencia=None):
+        self.latencia = float(os.getenv("GEOCODER_OFFLINE_LATENCIA", 0) if latencia is None else latencia)
+        self.enderecos = {}
+        for endereco, coord in (enderecos or {}).items():
+            self.enderecos[normalizar_endereco(endereco)] = tuple(coord)
+        if arquivo:
+            with open(arquivo, newline="", encoding="utf-8") as f:
+                for linha in csv.DictReader(f):
+                    self.enderecos[normalizar_endereco(linha["endereco"])] = (
+                        float(linha["latitude"]), float(linha["longitude"]))
+
+    def geocodificar(self, endereco):
+        if self.latencia:
+            time.sleep(self.latencia)
+        return self.enderecos.get(normalizar_endereco(endereco))
+
+
+def criar_backend():
+    tipo = os.getenv("GEOCODER_BACKEND", "nominatim").lower()
+    if tipo == "offline":
+        return GeocodificadorOffline(arquivo=os.getenv("GEOCODER_OFFLINE_CSV"))
+    if tipo == "nominatim":
+        return GeocodificadorNominatim()
+    raise ValueError(f"Backend de geocodificação desconhecido: {tipo}")
+
+
+def criar_esquema(conn):
+    # Sem commit: roda dentro da transação da migração
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS geocache (
+            endereco TEXT PRIMARY KEY,
+            latitude REAL,
+            longitude REAL,
+            atualizado_em TEXT
+        )
+    """)
+    colunas = {c[1] for c in conn.execute("PRAGMA table_info(pacientes)")}
+    if colunas and "latitude" not in colunas:
+        conn.execute("ALTER TABLE pacientes ADD COLUMN latitude REAL")
+    if colunas and "longitude" not in colunas:
+        conn.execute("ALTER TABLE pacientes ADD COLUMN longitude REAL")
+
+
+class Geocodificador:
+    def __init__(self, backend=None, tamanho_lru=TAMANHO_LRU):
+        self._backend = backend
+        self.tamanho_lru = tamanho_lru
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._esquema_ok = False
+
+    @property
+    def backend(self):
+        # Só cria o backend (e importa geopy) quando há um cache miss de verdade
+        if self._backend is None:
+            self._backend = criar_backend()
+        return self._backend
+
+    def _lru_get(self, chave):
+        # Entradas com validade (os "não encontrado") somem ao expirar
+        with self._lock:
+            if chave in self._lru:
+                valor, expira_em = self._lru[chave]
+                if expira_em is not None and time.monotonic() >= expira_em:
+                    del self._lru[chave]
+                    return None
+                self._lru.move_to_end(chave)
+                return valor
+        return None
+
+    def _lru_put(self, chave, valor, validade=None):
+        # validade (timedelta): por quanto tempo a entrada vale; None = sem prazo
+        expira_em = None if validade is None else time.monotonic() + validade.total_seconds()
+        with self._lock:
+            self._lru[chave] = (valor, expira_em)
+            self._lru.move_to_end(chave)
+            while len(self._lru) > self.tamanho_lru:
+                self._lru.popitem(last=False)
+
+    def _garantir_esquema(self, conn):
+        if not self._esquema_ok:
+            criar_esquema(conn)
+            conn.commit()
+            self._esquema_ok = True
+
+    def coordenadas(self, conn, endereco):
+        # (lat, lon) do endereço ou None; consulta LRU -> geocache -> backend
+        chave = normalizar_endereco(endereco)
+        if not chave:
+            return None
+        valor = self._lru_get(chave)
+        if valor is not None:
+            return None if valor is _NAO_ENCONTRADO else valor
+
+        self._garantir_esquema(conn)
+        linha = conn.execute(
+            "SELECT latitude, longitude, atualizado_em FROM geocache WHERE endereco=?", (chave,)
+        ).fetchone()
+        if linha is not None:
+            if linha[0] is not None:
+                valor = (linha[0], linha[1])
+                self._lru_put(chave, valor)
+                return valor
+            atualizado = datetime.strptime(linha[2], "%Y-%m-%d %H:%M:%S")
+            restante = VALIDADE_NEGATIVA - (datetime.now() - atualizado)
+            if restante > timedelta(0):
+                self._lru_put(chave, _NAO_ENCONTRADO, restante)
+                return None
+
+        backend = self.backend
+        with medir(EXTERNAS, getattr(backend, "nome", type(backend).__name__), "geocodificar"):
+            valor = backend.geocodificar(endereco)
+        conn.execute(
+            "INSERT OR REPLACE INTO geocache (endereco, latitude, longitude, atualizado_em) VALUES (?, ?, ?, ?)",
+            (chave, valor[0] if valor else None, valor[1] if valor else None,
+             datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        )
+        conn.commit()
+        if valor:
+            self._lru_put(chave, valor)
+        else:
+            self._lru_put(chave, _NAO_ENCONTRADO, VALIDADE_NEGATIVA)
+        return valor
+
+    def coordenadas_em_cache(self, conn, endereco):
+        # Só LRU e geocache: sem consultar o backend e sem gravar
+        chave = normalizar_endereco(endereco)
+        if not chave:
+            return None
+        valor = self._lru_get(chave)
+        if valor is not None:
+            return None if valor is _NAO_ENCONTRADO else valor
+        linha = conn.execute("SELECT latitude, longitude FROM geocache WHERE endereco=?", (chave,)).fetchone()
+        if linha is None or linha[0] is None:
+            return None
+        valor = (linha[0], linha[1])
+        self._lru_put(chave, valor)
+        return valor
+
+    def coordenadas_paciente(self, conn, paciente):
+        # Usa as coordenadas gravadas no paciente; se faltarem, geocodifica e grava
+        chaves = paciente.keys()
+        if "latitude" in chaves and paciente["latitude"] is not None and paciente["longitude"] is not None:
+            return (paciente["latitude"], paciente["longitude"])
+        coord = self.coordenadas(conn, paciente["endereco"])
+        if coord:
+            conn.execute(
+                "UPDATE pacientes SET latitude=?, longitude=? WHERE id=?",
+                (coord[0], coord[1], paciente["id"])
+            )
+            conn.commit()
+        return coord
+
+
+_geocodificador = None
+_geocodificador_lock = threading.Lock()
+
+
+def obter_geocodificador():
+    global _geocodificador
+    with _geocodificador_lock:
+        if _geocodificador is None:
+            _geocodificador = Geocodificador()
+        return _geocodificador
+
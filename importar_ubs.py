@@ -0,0 +1,120 @@
+# Importa/ressincroniza a tabela ubs a partir do ubs.csv
+# Uso: python importar_ubs.py [arquivo.csv] [--remover-ausentes]
+#
+# O CSV traz LAT/LONG em ponto fixo (ex.: -23522787 = -23.522787).
+# A carga é incremental: compara pelo par (nome, endereco) com o que já está
+# no banco e aplica só inserções/alterações (e remoções, se pedido) numa única
+# transação, com executemany. A tabela nunca fica vazia durante a recarga e os
+# ids existentes (referenciados por consulta) são preservados. O ID do CSV não
+# é usado como chave: as cargas antigas do banco não seguem essa numeração.
+import csv
+import sys
+
+from catalogo_ubs import sincronizar_catalogo
+from conexao import conectar
+from migracoes import aplicar_migracoes
+
+DB_PATH = "clinica.db"
+CSV_PATH = "ubs.csv"
+TAMANHO_LOTE = 500
+ESCALA_COORDENADA = 1_000_000
+
+
+def converter_coordenada(texto):
+    texto = texto.strip()
+    if "." in texto:
+        return float(texto)
+    return int(texto) / ESCALA_COORDENADA
+
+
+def ler_csv(caminho):
+    # Gera (nome, endereco, bairro, latitude, longitude) linha a linha
+    with open(caminho, newline="", encoding="utf-8") as f:
+        for linha in csv.DictReader(f):
+            try:
+                yield (
+                    linha["ESTABELECI"].strip(),
+                    linha["ENDERECO"].strip(),
+                    linha["BAIRRO"].strip(),
+                    converter_coordenada(linha["LAT"]),
+                    converter_coordenada(linha["LONG"]),
+                )
+            except (KeyError, ValueError):
+                print(f"⚠️ Linha ignorada: {linha}")
+
+
+def _aplicar(cursor, sql, lote):
+    if lote:
+        cursor.executemany(sql, lote)
+    return len(lote)
+
+
+def importar(conn, caminho=CSV_PATH, remover_ausentes=False):
+    sql_insert = "INSERT INTO ubs (nome, endereco, cep, latitude, longitude) VALUES (?, ?, ?, ?, ?)"
+    sql_update = "UPDATE ubs SET cep=?, latitude=?, longitude=? WHERE id=?"
+
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # (nome, endereco) -> (id, cep, latitude, longitude); em duplicatas vale o menor id
+        existentes = {}
+        for id_, nome, endereco, cep, lat, lon in cursor.execute(
+                "SELECT id, nome, endereco, cep, latitude, longitude FROM ubs ORDER BY id"):
+            existentes.setdefault((nome, endereco), (id_, cep, lat, lon))
+
+        vistos = set()
+        inseridas = alteradas = 0
+        novas, mudadas = [], []
+        for nome, endereco, bairro, lat, lon in ler_csv(caminho):
+            chave = (nome, endereco)
+            if chave in vistos:
+                continue
+            vistos.add(chave)
+            atual = existentes.get(chave)
+            if atual is None:
+                novas.append((nome, endereco, bairro, lat, lon))
+            elif atual[1:] != (bairro, lat, lon):
+                mudadas.append((bairro, lat, lon, atual[0]))
+            if len(novas) >= TAMANHO_LOTE:
+                inseridas += _aplicar(cursor, sql_insert, novas)
+                novas = []
+            if len(mudadas) >= TAMANHO_LOTE:
+                alteradas += _aplicar(cursor, sql_update, mudadas)
+                mudadas = []
+        inseridas += _aplicar(cursor, sql_insert, novas)
+        alteradas += _aplicar(cursor, sql_update, mudadas)
+
+        removidas = 0
+        if remover_ausentes:
+            # Remove unidades fora do CSV e cópias de cargas repetidas,
+            # exceto as que já têm consulta marcada
+            canonicos = {v[0] for k, v in existentes.items() if k in vistos}
+            cursor.execute("""
+                SELECT id FROM ubs
+                WHERE id NOT IN (SELECT id_ubs FROM consulta WHERE id_ubs IS NOT NULL)
+            """)
+            ausentes = [(i,) for (i,) in cursor.fetchall() if i not in canonicos]
+            removidas = _aplicar(cursor, "DELETE FROM ubs WHERE id=?", ausentes)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {"inseridas": inseridas, "alteradas": alteradas, "removidas": removidas}
+
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    caminho = argumentos[0] if argumentos else CSV_PATH
+
+    conn = conectar(DB_PATH)
+    # As tabelas do catálogo vêm das migrações; a sincronização só as preenche
+    aplicar_migracoes(conn)
+    resultado = importar(conn, caminho, remover_ausentes="--remover-ausentes" in sys.argv)
+    catalogo = sincronizar_catalogo(conn)
+    conn.close()
+
+    print(f"✅ UBS: {resultado['inseridas']} inseridas, {resultado['alteradas']} alteradas, "
+          f"{resultado['removidas']} removidas")
+    print(f"✅ Catálogo UBS/AMA: {catalogo['inseridas_ou_alteradas']} inseridas/alteradas, "
+          f"{catalogo['removidas']} removidas")
@@ -0,0 +1,148 @@
+# Índice espacial em memória sobre o catálogo de UBS/AMA.
+# A grade é montada uma vez e reconstruída só quando a tabela ubs muda
+# (a versão é mantida por triggers em ubs_versao, ver catalogo_ubs.py).
+import math
+import threading
+from geopy.distance import distance
+from catalogo_ubs import obter_catalogo
+
+RAIO_TERRA_KM = 6371.0088
+KM_POR_GRAU_LAT = 111.32
+TAMANHO_CELULA = 0.05  # graus (~5,5 km de lado em São Paulo)
+# A distância haversine difere da geodésica em no máximo ~0,5%;
+# a margem garante que o pré-filtro nunca descarta uma unidade válida.
+MARGEM_PREFILTRO = 1.01
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RAIO_TERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def carregar_unidades(conn):
+    # O catálogo já vem filtrado (UBS/AMA), sem duplicatas e com coordenadas válidas
+    catalogo, _ = obter_catalogo(conn)
+    return [(u["latitude"], u["longitude"], u) for u in catalogo]
+
+
+class IndiceUBS:
+    def __init__(self, unidades, tamanho_celula=TAMANHO_CELULA):
+        # unidades: lista de (lat, lon, registro)
+        self.tamanho_celula = tamanho_celula
+        self.total = len(unidades)
+        self.celulas = {}
+        for lat, lon, u in unidades:
+            self.celulas.setdefault(self._celula(lat, lon), []).append((lat, lon, u))
+        if self.celulas:
+            linhas = [c[0] for c in self.celulas]
+            colunas = [c[1] for c in self.celulas]
+            self.limites = (min(linhas), max(linhas), min(colunas), max(colunas))
+        else:
+            self.limites = (0, -1, 0, -1)
+
+    def _celula(self, lat, lon):
+        return (math.floor(lat / self.tamanho_celula), math.floor(lon / self.tamanho_celula))
+
+    def _km_por_celula(self, lat):
+        # Menor lado da célula em km na latitude informada
+        lado_lat = self.tamanho_celula * KM_POR_GRAU_LAT
+        lado_lon = lado_lat * max(math.cos(math.radians(abs(lat) + self.tamanho_celula)), 0.01)
+        return min(lado_lat, lado_lon)
+
+    def _anel(self, centro, r):
+        ci, cj = centro
+        if r == 0:
+            yield centro
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield (ci - r, j)
+            yield (ci + r, j)
+        for i in range(ci - r + 1, ci + r):
+            yield (i, cj - r)
+            yield (i, cj + r)
+
+    def _candidatos_caixa(self, coord, raio_km):
+        lat, lon = coord
+        dlat = raio_km / KM_POR_GRAU_LAT
+        dlon = raio_km / (KM_POR_GRAU_LAT * max(math.cos(math.radians(abs(lat) + dlat)), 0.01))
+        i0, j0 = self._celula(lat - dlat, lon - dlon)
+        i1, j1 = self._celula(lat + dlat, lon + dlon)
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                for item in self.celulas.get((i, j), ()):
+                    if lat - dlat <= item[0] <= lat + dlat and lon - dlon <= item[1] <= lon + dlon:
+                        yield item
+
+    def dentro_do_raio(self, coord, raio_km):
+        # [(registro, distancia_km)] ordenado pela distância geodésica
+        resultado = []
+        limite = raio_km * MARGEM_PREFILTRO
+        for lat, lon, u in self._candidatos_caixa(coord, limite):
+            if haversine_km(coord[0], coord[1], lat, lon) > limite:
+                continue
+            d = distance(coord, (lat, lon)).km
+            if d <= raio_km:
+                resultado.append((u, d))
+        resultado.sort(key=lambda x: x[1])
+        return resultado
+
+    def mais_proximas(self, coord, k, raio_max_km=None):
+        if k <= 0 or not self.total:
+            return []
+        centro = self._celula(*coord)
+        passo_km = self._km_por_celula(coord[0])
+        i_min, i_max, j_min, j_max = self.limites
+        r_max = max(abs(centro[0] - i_min), abs(centro[0] - i_max),
+                    abs(centro[1] - j_min), abs(centro[1] - j_max))
+
+        candidatos = []  # (haversine, lat, lon, registro)
+        r = 0
+        while r <= r_max:
+            for celula in self._anel(centro, r):
+                for lat, lon, u in self.celulas.get(celula, ()):
+                    candidatos.append((haversine_km(coord[0], coord[1], lat, lon), lat, lon, u))
+            # Tudo que está fora do anel r fica a pelo menos r * passo_km
+            cobertura = r * passo_km
+            if raio_max_km is not None and cobertura > raio_max_km * MARGEM_PREFILTRO:
+                break
+            if len(candidatos) >= k:
+                candidatos.sort(key=lambda x: x[0])
+                if candidatos[k - 1][0] * MARGEM_PREFILTRO <= cobertura:
+                    break
+            r += 1
+
+        if not candidatos:
+            return []
+        candidatos.sort(key=lambda x: x[0])
+        corte = candidatos[min(k, len(candidatos)) - 1][0] * MARGEM_PREFILTRO
+        if raio_max_km is not None:
+            corte = min(corte, raio_max_km * MARGEM_PREFILTRO)
+
+        resultado = []
+        for h, lat, lon, u in candidatos:
+            if h > corte:
+                break
+            d = distance(coord, (lat, lon)).km
+            if raio_max_km is None or d <= raio_max_km:
+                resultado.append((u, d))
+        resultado.sort(key=lambda x: x[1])
+        return resultado[:k]
+
+
+_indice = None
+_versao = None
+_lock = threading.Lock()
+
+
+def obter_indice(conn):
+    # Reaproveita o índice enquanto a tabela ubs não mudar
+    global _indice, _versao
+    catalogo, versao = obter_catalogo(conn)
+    with _lock:
+        if _indice is None or versao != _versao:
+            _indice = IndiceUBS([(u["latitude"], u["longitude"], u) for u in catalogo])
+            _versao = versao
+        return _indice
+
@@ -0,0 +1,175 @@
+# Marcadores de UBS para o mapa (GeoJSON por janela de visualização).
+# As unidades do catálogo ficam num índice R*Tree (ubs_catalogo_rtree),
+# mantido por triggers sobre ubs_catalogo. Em zoom baixo as unidades são
+# agrupadas no servidor numa grade proporcional ao zoom; a janela pedida é
+# alinhada a essa grade, então janelas vizinhas geram os mesmos grupos e o
+# mesmo conteúdo pode ser reaproveitado (cache em memória e ETag).
+import gzip
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+
+from catalogo_ubs import garantir_catalogo
+
+ZOOM_MIN = 0
+ZOOM_MAX = 19
+ZOOM_SEM_AGRUPAR = 13  # a partir deste zoom cada unidade é um ponto
+CELULAS_POR_TILE = 4  # grupos de ~64 px num tile de 256 px
+MAX_PONTOS = 2000  # acima disso agrupa mesmo em zoom alto
+TAMANHO_CACHE = 256
+TAMANHO_MIN_GZIP = 1024  # bytes
+TOLERANCIA = 1e-3  # fração de célula ignorada no alinhamento (arredondamento do cliente)
+
+
+def criar_esquema(conn):
+    # Sem commit: roda dentro da transação da migração
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS ubs_catalogo_rtree
+        USING rtree(id, lat_min, lat_max, lon_min, lon_max)
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS ubs_catalogo_rtree_insert AFTER INSERT ON ubs_catalogo BEGIN
+            INSERT INTO ubs_catalogo_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS ubs_catalogo_rtree_update AFTER UPDATE OF latitude, longitude ON ubs_catalogo BEGIN
+            UPDATE ubs_catalogo_rtree
+            SET lat_min = new.latitude, lat_max = new.latitude, lon_min = new.longitude, lon_max = new.longitude
+            WHERE id = new.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS ubs_catalogo_rtree_delete AFTER DELETE ON ubs_catalogo BEGIN
+            DELETE FROM ubs_catalogo_rtree WHERE id = old.id;
+        END
+    """)
+    conn.execute("DELETE FROM ubs_catalogo_rtree")
+    conn.execute("""
+        INSERT INTO ubs_catalogo_rtree
+        SELECT id, latitude, latitude, longitude, longitude FROM ubs_catalogo
+    """)
+
+
+def tamanho_celula(zoom):
+    # Largura da célula da grade em graus (um tile tem 360 / 2^zoom graus)
+    return 360.0 / (2 ** zoom) / CELULAS_POR_TILE
+
+
+def alinhar_janela(bbox, zoom):
+    # bbox: (oeste, sul, leste, norte); expande até a grade do zoom. Uma janela
+    # já alinhada (com até 6 casas decimais, como o mapa envia) não muda.
+    celula = tamanho_celula(zoom)
+    oeste, sul, leste, norte = bbox
+    i0 = math.floor((sul + 90) / celula + TOLERANCIA)
+    j0 = math.floor((oeste + 180) / celula + TOLERANCIA)
+    i1 = max(i0 + 1, math.ceil((norte + 90) / celula - TOLERANCIA))
+    j1 = max(j0 + 1, math.ceil((leste + 180) / celula - TOLERANCIA))
+    return (j0 * celula - 180, i0 * celula - 90, j1 * celula - 180, i1 * celula - 90)
+
+
+def _ponto(u):
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [u["longitude"], u["latitude"]]},
+        "properties": {"id": u["id"], "nome": u["nome"], "endereco": u["endereco"]},
+    }
+
+
+def _grupo(g):
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [g["longitude"], g["latitude"]]},
+        "properties": {"grupo": True, "quantidade": g["quantidade"]},
+    }
+
+
+def consultar(conn, bbox, zoom):
+    # FeatureCollection das unidades na janela (já alinhada), agrupadas em zoom baixo
+    oeste, sul, leste, norte = bbox
+    janela = {"oeste": oeste, "sul": sul, "leste": leste, "norte": norte}
+    # O R*Tree guarda as coordenadas em float de 32 bits, arredondadas para
+    # fora: a busca nele é por sobreposição e o corte exato é feito no catálogo
+    filtro = """
+        FROM ubs_catalogo_rtree r JOIN ubs_catalogo c ON c.id = r.id
+        WHERE r.lat_max >= :sul AND r.lat_min <= :norte
+          AND r.lon_max >= :oeste AND r.lon_min <= :leste
+          AND c.latitude BETWEEN :sul AND :norte
+          AND c.longitude BETWEEN :oeste AND :leste
+    """
+    pontos = None
+    if zoom >= ZOOM_SEM_AGRUPAR:
+        pontos = conn.execute(
+            f"SELECT c.id, c.nome, c.endereco, c.latitude, c.longitude {filtro} LIMIT {MAX_PONTOS + 1}",
+            janela
+        ).fetchall()
+        if len(pontos) > MAX_PONTOS:
+            pontos = None
+    if pontos is not None:
+        features = [_ponto(u) for u in pontos]
+    else:
+        # Agrupa por célula; grupos de uma unidade só viram o próprio ponto
+        grupos = conn.execute(f"""
+            SELECT count(*) AS quantidade, avg(c.latitude) AS latitude, avg(c.longitude) AS longitude,
+                   min(c.id) AS id, min(c.nome) AS nome, min(c.endereco) AS endereco
+            {filtro}
+            GROUP BY CAST((c.latitude + 90) / :celula AS INTEGER),
+                     CAST((c.longitude + 180) / :celula AS INTEGER)
+        """, dict(janela, celula=tamanho_celula(zoom))).fetchall()
+        features = [_ponto(g) if g["quantidade"] == 1 else _grupo(g) for g in grupos]
+    return {"type": "FeatureCollection", "bbox": [oeste, sul, leste, norte], "features": features}
+
+
+class CacheMapa:
+    # Respostas prontas (JSON e gzip) por chave; a chave inclui a versão do
+    # catálogo, então uma mudança em ubs nunca serve dados antigos
+    def __init__(self, tamanho=TAMANHO_CACHE):
+        self.tamanho = tamanho
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                self._itens.move_to_end(chave)
+            return item
+
+    def guardar(self, chave, item):
+        with self._lock:
+            self._itens[chave] = item
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho:
+                self._itens.popitem(last=False)
+
+
+_cache = CacheMapa()
+
+
+def preparar(conn, bbox, zoom):
+    # Alinha a janela e calcula o ETag sem consultar as unidades:
+    # (etag, janela alinhada, zoom)
+    if not all(math.isfinite(v) for v in bbox):
+        raise ValueError("bbox inválido: use oeste,sul,leste,norte")
+    oeste, sul, leste, norte = bbox
+    oeste, leste = max(-180.0, oeste), min(180.0, leste)
+    sul, norte = max(-90.0, sul), min(90.0, norte)
+    if oeste >= leste or sul >= norte:
+        raise ValueError("bbox inválido: use oeste,sul,leste,norte")
+    zoom = max(ZOOM_MIN, min(int(zoom), ZOOM_MAX))
+    janela = alinhar_janela((oeste, sul, leste, norte), zoom)
+    chave = json.dumps([garantir_catalogo(conn), zoom, [round(v, 9) for v in janela]])
+    return hashlib.sha1(chave.encode()).hexdigest(), janela, zoom
+
+
+def resposta(conn, etag, janela, zoom):
+    # (corpo JSON, corpo gzip ou None), do cache quando possível
+    item = _cache.obter(etag)
+    if item is None:
+        corpo = json.dumps(consultar(conn, janela, zoom), ensure_ascii=False, separators=(",", ":")).encode()
+        comprimido = gzip.compress(corpo, 5) if len(corpo) >= TAMANHO_MIN_GZIP else None
+        item = (corpo, comprimido)
+        _cache.guardar(etag, item)
+    return item
@@ -0,0 +1,271 @@
+# Instrumentação dos apps Flask (site da clínica e backend de triagem).
+# Histogramas em memória para o tempo de cada rota, de cada comando SQL (texto
+# normalizado, sem valores), de cada chamada externa (geocodificador, modelo
+# de chat), de cada PDF gerado e das tarefas em segundo plano, expostos em
+# /metrics no formato do Prometheus.
+# Os valores são por processo: com vários workers, cada um é coletado à parte.
+#
+# Acesso a /metrics (expõe texto de SQL e tempos das rotas): só de localhost,
+# ou de qualquer origem com METRICAS_TOKEN=<token> no cabeçalho
+# "Authorization: Bearer <token>". Atrás de um proxy reverso no mesmo host
+# toda requisição parece vir de localhost: nesse caso o proxy não deve
+# encaminhar /metrics, ou METRICAS_TOKEN deve ser definido.
+#
+# Log de requisições lentas (opcional): com METRICAS_LENTAS_MS=<ms>, toda
+# requisição acima desse tempo é registrada no log do app com o detalhamento
+# do tempo gasto em SQL, chamadas externas e PDFs.
+import hmac
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+LIMITES_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_SQL = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+MAX_CARACTERES_SQL = 200
+MAX_ITENS_DETALHE = 5  # itens mais lentos listados no log de requisições lentas
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+ENDERECOS_LOCAIS = ("127.0.0.1", "::1")
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histograma:
+    # Contagens cumulativas por limite (le), soma e total por combinação de rótulos.
+    # categoria agrupa as medições no detalhamento das requisições lentas.
+    def __init__(self, nome, ajuda, rotulos, limites=LIMITES_PADRAO, categoria=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.limites = tuple(limites)
+        self.categoria = categoria
+        self._series = {}  # valores dos rótulos -> [contagens por limite, soma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, segundos, *valores):
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * len(self.limites), 0.0, 0]
+            for i, limite in enumerate(self.limites):
+                if segundos <= limite:
+                    serie[0][i] += 1
+            serie[1] += segundos
+            serie[2] += 1
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            series = sorted((v, (list(s[0]), s[1], s[2])) for v, s in self._series.items())
+        for valores, (contagens, soma, total) in series:
+            rotulos = ",".join(f'{r}="{_escapar(v)}"' for r, v in zip(self.rotulos, valores))
+            prefixo = rotulos + "," if rotulos else ""
+            for limite, contagem in zip(self.limites, contagens):
+                linhas.append(f'{self.nome}_bucket{{{prefixo}le="{limite}"}} {contagem}')
+            linhas.append(f'{self.nome}_bucket{{{prefixo}le="+Inf"}} {total}')
+            linhas.append(f"{self.nome}_sum{{{rotulos}}} {soma:.6f}")
+            linhas.append(f"{self.nome}_count{{{rotulos}}} {total}")
+        return "\n".join(linhas)
+
+
+REQUISICOES = Histograma(
+    "clinica_requisicao_segundos", "Tempo de resposta por rota.", ("app", "metodo", "rota", "status"))
+SQL = Histograma(
+    "clinica_sql_segundos", "Tempo por comando SQL (texto normalizado); fase execucao ou leitura.",
+    ("banco", "fase", "comando"), LIMITES_SQL, categoria="sql")
+EXTERNAS = Histograma(
+    "clinica_chamada_externa_segundos", "Tempo das chamadas a serviços externos.",
+    ("servico", "operacao"), categoria="externa")
+PDF = Histograma("clinica_pdf_segundos", "Tempo de geração de PDFs.", ("tipo",), categoria="pdf")
+TAREFAS = Histograma(
+    "clinica_tarefa_segundos", "Tempo das tarefas em segundo plano por desfecho.", ("tipo", "desfecho"),
+    categoria="tarefa")
+HISTOGRAMAS = (REQUISICOES, SQL, EXTERNAS, PDF, TAREFAS)
+
+# Detalhamento da requisição em andamento nesta thread (lista de medições) ou None
+_local = threading.local()
+
+
+def registrar(histograma, segundos, *valores):
+    histograma.observar(segundos, *valores)
+    detalhe = getattr(_local, "detalhe", None)
+    if detalhe is not None:
+        detalhe.append((histograma.categoria, " ".join(map(str, valores)), segundos))
+
+
+@contextmanager
+def medir(histograma, *valores):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(histograma, time.perf_counter() - inicio, *valores)
+
+
+class IteravelMedido:
+    # Repassa uma resposta iterável (stream do modelo) e registra o tempo desde a
+    # chamada até o último item; os demais atributos vêm do objeto original
+    def __init__(self, iteravel, histograma, *valores):
+        self._iteravel = iteravel
+        self._histograma = histograma
+        self._valores = valores
+        self._inicio = time.perf_counter()
+
+    def __iter__(self):
+        try:
+            yield from self._iteravel
+        finally:
+            registrar(self._histograma, time.perf_counter() - self._inicio, *self._valores)
+
+    def __getattr__(self, nome):
+        return getattr(self._iteravel, nome)
+
+
+# ---------- SQL ----------
+
+@lru_cache(maxsize=1024)
+def normalizar_sql(sql):
+    # Sem literais e com listas IN (?, ?, ...) reduzidas, para que o mesmo
+    # comando com valores diferentes caia na mesma série
+    texto = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    texto = re.sub(r"\b\d+(?:\.\d+)?\b", "?", texto)
+    texto = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?, ...)", texto)
+    texto = re.sub(r"\s+", " ", texto).strip()
+    return texto[:MAX_CARACTERES_SQL]
+
+
+class CursorMedido(sqlite3.Cursor):
+    # execute/executemany medem a preparação e o primeiro passo do comando;
+    # fetchone/fetchmany/fetchall medem a leitura das linhas restantes.
+    # (Iterar direto sobre o cursor não entra na fase de leitura.)
+    _comando = None
+
+    def _medir(self, fase, funcao, *args):
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args)
+        finally:
+            if self._comando is not None:
+                registrar(SQL, time.perf_counter() - inicio, self.connection.banco, fase, self._comando)
+
+    def execute(self, sql, parametros=()):
+        self._comando = normalizar_sql(sql)
+        return self._medir("execucao", super().execute, sql, parametros)
+
+    def executemany(self, sql, parametros):
+        self._comando = normalizar_sql(sql)
+        return self._medir("execucao", super().executemany, sql, parametros)
+
+    def fetchone(self):
+        return self._medir("leitura", super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._medir("leitura", super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._medir("leitura", super().fetchall)
+
+
+class ConexaoMedida(sqlite3.Connection):
+    # Conexão cujos cursores são medidos
+    def __init__(self, banco, *args, **kwargs):
+        super().__init__(banco, *args, **kwargs)
+        self.banco = os.path.basename(str(banco))
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    # conn.execute do sqlite3 cria o cursor internamente, sem passar por cursor()
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+
+# ---------- Flask ----------
+
+def exportar():
+    return "\n".join(h.exportar() for h in HISTOGRAMAS) + "\n"
+
+
+def _limite_lentas():
+    valor = os.getenv("METRICAS_LENTAS_MS")
+    return float(valor) / 1000 if valor else None
+
+
+def _resumo_detalhe(detalhe):
+    # Totais por categoria e os itens (somados pelo rótulo) que mais pesaram
+    categorias = {}
+    itens = {}
+    for categoria, rotulo, segundos in detalhe:
+        total = categorias.setdefault(categoria, {"n": 0, "ms": 0.0})
+        total["n"] += 1
+        total["ms"] += segundos * 1000
+        item = itens.setdefault((categoria, rotulo), {"categoria": categoria, "item": rotulo, "n": 0, "ms": 0.0})
+        item["n"] += 1
+        item["ms"] += segundos * 1000
+    for total in categorias.values():
+        total["ms"] = round(total["ms"], 2)
+    mais_lentos = sorted(itens.values(), key=lambda i: i["ms"], reverse=True)[:MAX_ITENS_DETALHE]
+    for item in mais_lentos:
+        item["ms"] = round(item["ms"], 2)
+    return categorias, mais_lentos
+
+
+def acesso_permitido(request):
+    token = os.getenv("METRICAS_TOKEN")
+    if token:
+        enviado = request.headers.get("Authorization", "")
+        return hmac.compare_digest(enviado.encode(), f"Bearer {token}".encode())
+    return request.remote_addr in ENDERECOS_LOCAIS
+
+
+def instrumentar(app, nome):
+    # Mede todas as rotas de app (rótulo app=nome) e registra GET /metrics
+    from flask import Response, g, request
+
+    limite = _limite_lentas()
+
+    @app.before_request
+    def _iniciar_medicao():
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_status = 500
+        _local.detalhe = [] if limite is not None else None
+
+    @app.after_request
+    def _guardar_status(response):
+        g.metricas_status = response.status_code
+        return response
+
+    # No teardown a resposta já foi enviada (ou o stream terminou, quando a
+    # rota usa stream_with_context)
+    @app.teardown_request
+    def _encerrar_medicao(exc):
+        inicio = g.pop("metricas_inicio", None)
+        detalhe, _local.detalhe = getattr(_local, "detalhe", None), None
+        if inicio is None:
+            return
+        duracao = time.perf_counter() - inicio
+        rota = request.url_rule.rule if request.url_rule else "<sem rota>"
+        status = g.pop("metricas_status", 500)
+        REQUISICOES.observar(duracao, nome, request.method, rota, status)
+        if limite is not None and duracao >= limite:
+            categorias, mais_lentos = _resumo_detalhe(detalhe or [])
+            app.logger.warning("Requisição lenta: %s", json.dumps({
+                "app": nome, "metodo": request.method, "caminho": request.full_path.rstrip("?"),
+                "rota": rota, "status": status, "ms": round(duracao * 1000, 2),
+                "categorias": categorias, "mais_lentos": mais_lentos,
+            }, ensure_ascii=False))
+
+    @app.route("/metrics")
+    def metrics():
+        if not acesso_permitido(request):
+            return Response("Acesso negado\n", status=403, content_type="text/plain; charset=utf-8")
+        return Response(exportar(), content_type=TIPO_CONTEUDO)
@@ -0,0 +1,299 @@
+# Migrações versionadas do clinica.db (a versão fica em PRAGMA user_version).
+# Uso: python migracoes.py              aplica as migrações pendentes
+#      python migracoes.py --verificar  confere os planos das consultas críticas
+#                                       (sai com código 1 se houver varredura completa)
+# Cada migração aplicada é anunciada na saída. Antes das que apagam tabelas
+# (DESTRUTIVAS) o banco é copiado para <banco>.v<versão>.bak, dentro do mesmo
+# lock de escrita, também quando quem migra é o app na primeira requisição.
+import sqlite3
+import sys
+
+import agenda_ubs
+import busca_textual
+import catalogo_ubs
+import enriquecimento
+import mapa_ubs
+import geocodificacao
+import registro_dialogos
+import tarefas
+from conexao import conectar
+from consultas import CONSULTAS_CRITICAS
+
+DB_PATH = "clinica.db"
+
+# Tabelas do clinica.db versionado antes das migrações (versão 0); num banco
+# vazio a migração 1 as cria e as seguintes levam o esquema até a versão atual
+ESQUEMA_INICIAL = [
+    """CREATE TABLE IF NOT EXISTS paciente (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome_completo TEXT NOT NULL,
+        telefone TEXT,
+        estado TEXT,
+        endereco TEXT,
+        latitude REAL,
+        longitude REAL,
+        criado_em DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS triagem (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_paciente INTEGER,
+        queixa_principal TEXT,
+        resumo_sintomas TEXT,
+        sintomas_json TEXT,
+        FOREIGN KEY (id_paciente) REFERENCES paciente(id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS mensagem_chat (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_triagem INTEGER,
+        eh_bot INTEGER,
+        mensagem TEXT,
+        criado_em DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (id_triagem) REFERENCES triagem(id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS ubs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT,
+        endereco TEXT,
+        cep TEXT,
+        latitude REAL,
+        longitude REAL
+    )""",
+    """CREATE TABLE IF NOT EXISTS consulta (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_paciente INTEGER,
+        id_ubs INTEGER,
+        data_hora DATETIME,
+        urgencia TEXT,
+        status TEXT DEFAULT 'Agendada',
+        FOREIGN KEY (id_paciente) REFERENCES paciente(id),
+        FOREIGN KEY (id_ubs) REFERENCES ubs(id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS medico (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT,
+        login TEXT UNIQUE,
+        senha TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS pacientes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT,
+        idade TEXT,
+        endereco TEXT,
+        telefone TEXT,
+        sintomas TEXT,
+        nivel_atendimento TEXT,
+        consulta_marcada INTEGER DEFAULT 0,
+        data_registro TEXT
+    )""",
+]
+
+
+def _esquema_base(conn):
+    # Tabelas da versão 0 (só num banco vazio) e as que os módulos criavam sob demanda
+    for comando in ESQUEMA_INICIAL:
+        conn.execute(comando)
+    geocodificacao.criar_esquema(conn)
+    catalogo_ubs.criar_esquema(conn)
+    registro_dialogos.criar_esquema(conn)
+
+
+def _tabela_existe(conn, nome):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (nome,)
+    ).fetchone() is not None
+
+
+def _unificar_pacientes(conn):
+    # O app sempre usou pacientes; paciente (nome_completo, estado, ...) ficou
+    # sem uso. Os registros são copiados para pacientes e as chaves estrangeiras
+    # de consulta e triagem passam a apontar para pacientes.
+    conn.execute("DROP TABLE IF EXISTS temp.mapa_paciente")
+    conn.execute("CREATE TEMP TABLE mapa_paciente (antigo INTEGER PRIMARY KEY, novo INTEGER)")
+    if _tabela_existe(conn, "paciente"):
+        antigos = conn.execute("""
+            SELECT id, nome_completo, telefone, estado, endereco, latitude, longitude, criado_em
+            FROM paciente ORDER BY id
+        """).fetchall()
+        for id_, nome, telefone, estado, endereco, lat, lon, criado_em in antigos:
+            if estado and endereco and estado not in endereco:
+                endereco = f"{endereco}, {estado}"
+            novo = conn.execute(
+                "INSERT INTO pacientes (nome, endereco, telefone, latitude, longitude, data_registro) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (nome, endereco, telefone, lat, lon, criado_em)
+            ).lastrowid
+            conn.execute("INSERT INTO mapa_paciente (antigo, novo) VALUES (?, ?)", (id_, novo))
+
+    if _tabela_existe(conn, "triagem"):
+        conn.execute("""
+            CREATE TABLE triagem_nova (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id_paciente INTEGER,
+                queixa_principal TEXT,
+                resumo_sintomas TEXT,
+                sintomas_json TEXT,
+                FOREIGN KEY (id_paciente) REFERENCES pacientes(id)
+            )
+        """)
+        conn.execute("""
+            INSERT INTO triagem_nova (id, id_paciente, queixa_principal, resumo_sintomas, sintomas_json)
+            SELECT t.id, COALESCE(m.novo, t.id_paciente), t.queixa_principal, t.resumo_sintomas, t.sintomas_json
+            FROM triagem t LEFT JOIN temp.mapa_paciente m ON m.antigo = t.id_paciente
+        """)
+        conn.execute("DROP TABLE triagem")
+        conn.execute("ALTER TABLE triagem_nova RENAME TO triagem")
+
+    conn.execute("""
+        CREATE TABLE consulta_nova (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_paciente INTEGER,
+            id_ubs INTEGER,
+            data_hora DATETIME,
+            urgencia TEXT,
+            status TEXT DEFAULT 'Agendada',
+            FOREIGN KEY (id_paciente) REFERENCES pacientes(id),
+            FOREIGN KEY (id_ubs) REFERENCES ubs(id)
+        )
+    """)
+    conn.execute("""
+        INSERT INTO consulta_nova (id, id_paciente, id_ubs, data_hora, urgencia, status)
+        SELECT id, id_paciente, id_ubs, data_hora, urgencia, status FROM consulta
+    """)
+    conn.execute("DROP TABLE consulta")
+    conn.execute("ALTER TABLE consulta_nova RENAME TO consulta")
+    conn.execute("DROP TABLE IF EXISTS paciente")
+    conn.execute("DROP TABLE temp.mapa_paciente")
+
+
+def _indices_agendamento(conn):
+    # Pendentes (anti-join) e atestado: consulta por id_paciente, mais recente primeiro
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_consulta_paciente_data ON consulta (id_paciente, data_hora)")
+    # Consulta confirmada: id_paciente + id_ubs, mais recente primeiro
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_consulta_paciente_ubs_data ON consulta (id_paciente, id_ubs, data_hora)")
+    # Agendados: percorre consulta já na ordem de data_hora, sem ordenação temporária
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_consulta_data ON consulta (data_hora, id_paciente, id_ubs)")
+
+
+def _agenda_ubs(conn):
+    # Horários de atendimento por UBS, versão de consulta e índice de conflito
+    agenda_ubs.criar_esquema(conn)
+
+
+def _busca_textual(conn):
+    # Tabelas FTS5 de pacientes e dialogos, com triggers e indexação inicial
+    busca_textual.criar_esquema(conn)
+
+
+def _mapa_ubs(conn):
+    # Índice R*Tree das coordenadas do catálogo, para o GeoJSON do mapa
+    mapa_ubs.criar_esquema(conn)
+
+
+def _tarefas(conn):
+    # Fila de tarefas e UBS pré-calculadas por paciente; os pacientes que já
+    # existem entram na fila para serem enriquecidos pelo trabalhador
+    tarefas.criar_esquema(conn)
+    enriquecimento.criar_esquema(conn)
+    enriquecimento.enfileirar_pendentes(conn)
+
+
+# Migrações que removem tabelas (paciente, e triagem/consulta recriadas)
+DESTRUTIVAS = {2}
+
+MIGRACOES = [
+    (1, "esquema base (geocache, catálogo de UBS, dialogos.sessao)", _esquema_base),
+    (2, "unifica paciente em pacientes", _unificar_pacientes),
+    (3, "índices das consultas de agendamento", _indices_agendamento),
+    (4, "agenda das UBS (horários e conflitos)", _agenda_ubs),
+    (5, "busca textual em pacientes e dialogos", _busca_textual),
+    (6, "índice espacial do catálogo de UBS para o mapa", _mapa_ubs),
+    (7, "fila de tarefas e enriquecimento de pacientes", _tarefas),
+]
+
+
+def versao_atual(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _copia_de_seguranca(conn, versao):
+    # Cópia do banco na versão atual; None em bancos em memória. Lê por outra
+    # conexão: conn já tem o lock de escrita, então ninguém altera o banco
+    # durante a cópia
+    arquivo = conn.execute("PRAGMA database_list").fetchone()[2]
+    if not arquivo:
+        return None
+    destino = f"{arquivo}.v{versao}.bak"
+    origem = sqlite3.connect(f"file:{arquivo}?mode=ro", uri=True)
+    copia = sqlite3.connect(destino)
+    try:
+        origem.backup(copia)
+    finally:
+        copia.close()
+        origem.close()
+    return destino
+
+
+def aplicar_migracoes(conn, ate=None, mostrar=True):
+    aplicadas = []
+    for versao, descricao, funcao in MIGRACOES:
+        if ate is not None and versao > ate:
+            break
+        if versao <= versao_atual(conn):
+            continue
+        # BEGIN IMMEDIATE serializa processos migrando ao mesmo tempo;
+        # a versão é relida já com o lock de escrita
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if versao <= versao_atual(conn):
+                conn.rollback()
+                continue
+            if versao in DESTRUTIVAS:
+                copia = _copia_de_seguranca(conn, versao_atual(conn))
+                if copia and mostrar:
+                    print(f"💾 Cópia de segurança antes da migração {versao}: {copia}")
+            funcao(conn)
+            conn.execute(f"PRAGMA user_version = {int(versao)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if mostrar:
+            print(f"✅ Migração {versao}: {descricao}")
+        aplicadas.append((versao, descricao))
+    return aplicadas
+
+
+def verificar_planos(conn):
+    # Lista de problemas; vazia quando todas as consultas críticas usam índice
+    problemas = []
+    for nome, sql, params, permitidas in CONSULTAS_CRITICAS:
+        for _, _, _, detalhe in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            if detalhe.startswith("SCAN ") and "USING" not in detalhe:
+                tabela = detalhe.split()[1]
+                if tabela not in permitidas:
+                    problemas.append(f"{nome}: {detalhe}")
+            elif "USE TEMP B-TREE" in detalhe:
+                problemas.append(f"{nome}: {detalhe}")
+    return problemas
+
+
+if __name__ == "__main__":
+    if "--verificar" in sys.argv:
+        # Verifica numa cópia em memória; o banco é aberto só para leitura
+        # (conectar() mudaria o journal_mode no cabeçalho do arquivo)
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+        copia = sqlite3.connect(":memory:")
+        conn.backup(copia)
+        conn.close()
+        aplicar_migracoes(copia, mostrar=False)
+        problemas = verificar_planos(copia)
+        for problema in problemas:
+            print(f"❌ {problema}")
+        if problemas:
+            sys.exit(1)
+        print("✅ Todas as consultas críticas usam índice.")
+    else:
+        conn = conectar(DB_PATH)
+        aplicar_migracoes(conn)
+        print(f"Banco na versão {versao_atual(conn)}.")
+        conn.close()
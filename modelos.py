@@ -0,0 +1,101 @@
+# Modelos de linguagem usados na triagem.
+# MODELO_CHAT=gemini (padrão) usa o Gemini; MODELO_CHAT=local usa um modelo de
+# teste sem rede, com latência configurável (MODELO_LOCAL_LATENCIA para o
+# primeiro trecho e MODELO_LOCAL_LATENCIA_TRECHO entre trechos, em segundos).
+# Os dois expõem a mesma interface, gerar(conteudo, stream=False), com respostas
+# no formato do google.generativeai (.text e, em stream, trechos com .text);
+# o histórico da conversa é montado por contexto_chat.ConversaLimitada.
+import os
+import time
+
+from metricas import EXTERNAS, IteravelMedido, medir
+
+MODELO_GEMINI = "gemini-2.5-flash"
+
+
+class ModeloGemini:
+    def __init__(self, nome=MODELO_GEMINI):
+        import google.generativeai as genai
+
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("API key not found. Please set the GOOGLE_API_KEY environment variable.")
+        genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(nome)
+
+    def gerar(self, conteudo, stream=False):
+        if stream:
+            return IteravelMedido(self._model.generate_content(conteudo, stream=True), EXTERNAS, "gemini", "stream")
+        with medir(EXTERNAS, "gemini", "gerar"):
+            return self._model.generate_content(conteudo)
+
+
+class TrechoLocal:
+    def __init__(self, text):
+        self.text = text
+
+
+class RespostaLocal:
+    # Imita a resposta do Gemini: .text e, com stream=True, iterável por trechos
+    def __init__(self, trechos, latencia, latencia_trecho):
+        self._trechos = trechos
+        self.texto_completo = "".join(trechos)
+        self._latencia = latencia
+        self._latencia_trecho = latencia_trecho
+        self._consumida = False
+
+    def __iter__(self):
+        time.sleep(self._latencia)
+        for i, trecho in enumerate(self._trechos):
+            if i:
+                time.sleep(self._latencia_trecho)
+            yield TrechoLocal(trecho)
+        self._consumida = True
+
+    @property
+    def text(self):
+        if not self._consumida:
+            for _ in self:
+                pass
+        return self.texto_completo
+
+
+class ModeloLocal:
+    def __init__(self, latencia=None, latencia_trecho=None):
+        self.latencia = float(os.getenv("MODELO_LOCAL_LATENCIA", 0) if latencia is None else latencia)
+        self.latencia_trecho = float(
+            os.getenv("MODELO_LOCAL_LATENCIA_TRECHO", 0) if latencia_trecho is None else latencia_trecho
+        )
+
+    def gerar(self, conteudo, stream=False):
+        if isinstance(conteudo, str):
+            ultima = conteudo
+        else:
+            ultima = conteudo[-1]["parts"][0] if conteudo else ""
+        texto = f"Entendi: {ultima}. Obrigado por compartilhar, estou aqui para ajudar."
+        palavras = texto.split(" ")
+        trechos = [p + (" " if i < len(palavras) - 1 else "") for i, p in enumerate(palavras)]
+        resposta = RespostaLocal(trechos, self.latencia, self.latencia_trecho)
+        if stream:
+            return IteravelMedido(resposta, EXTERNAS, "local", "stream")
+        # Sem stream a espera acontece aqui, como na chamada bloqueante do Gemini
+        with medir(EXTERNAS, "local", "gerar"):
+            resposta.text
+        return resposta
+
+
+def criar_modelo():
+    tipo = os.getenv("MODELO_CHAT", "gemini").lower()
+    if tipo == "local":
+        return ModeloLocal()
+    if tipo == "gemini":
+        return ModeloGemini()
+    raise ValueError(f"Modelo de chat desconhecido: {tipo}")
+
+
+def importar_dependencias():
+    # Aquecimento antes do fork: importa a biblioteca do modelo escolhido sem
+    # criar o cliente. O cliente do Gemini (gRPC) não pode atravessar o fork,
+    # então cada processo cria o seu no primeiro uso.
+    if os.getenv("MODELO_CHAT", "gemini").lower() == "gemini":
+        import google.generativeai
@@ -0,0 +1,198 @@
+# Registro assíncrono (write-behind) das mensagens na tabela dialogos.
+# As mensagens entram numa fila limitada em memória e uma thread escritora
+# grava em lotes com executemany, fazendo commit por tamanho ou por tempo
+# (group commit). Assim o fsync sai do caminho da requisição.
+#
+# Durabilidade (DIALOGOS_DURABILIDADE):
+#   "lote"     - registrar() retorna assim que a mensagem entra na fila (padrão)
+#   "imediata" - registrar() espera o commit do lote que contém a mensagem
+# Em ambos os modos a fila é descarregada no encerramento normal (atexit).
+# Quem espera (modo "imediata" e descarregar()) recebe a exceção se o lote não
+# puder ser gravado, e desiste com TimeoutError depois de TEMPO_ESPERA.
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from conexao import conectar
+
+TAMANHO_FILA = 10000
+TAMANHO_LOTE = 200
+INTERVALO_COMMIT = 0.2  # segundos
+TENTATIVAS = 5
+TEMPO_ESPERA = 30  # segundos esperando vaga na fila ou o commit do lote
+DURABILIDADES = ("lote", "imediata")
+
+_PARAR = object()
+
+
+def criar_esquema(conn):
+    # Tabela dialogos com a coluna sessao (bancos antigos ganham a coluna).
+    # Sem commit: roda dentro da transação da migração ou de init_db
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dialogos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            autor TEXT,
+            mensagem TEXT,
+            sessao TEXT
+        )
+    """)
+    colunas = {c[1] for c in conn.execute("PRAGMA table_info(dialogos)")}
+    if "sessao" not in colunas:
+        conn.execute("ALTER TABLE dialogos ADD COLUMN sessao TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_dialogos_sessao_id ON dialogos (sessao, id)")
+
+
+class RegistroDialogos:
+    def __init__(self, db_path, tamanho_fila=TAMANHO_FILA, tamanho_lote=TAMANHO_LOTE,
+                 intervalo=INTERVALO_COMMIT, durabilidade=None):
+        durabilidade = durabilidade or os.getenv("DIALOGOS_DURABILIDADE", "lote")
+        if durabilidade not in DURABILIDADES:
+            raise ValueError(f"Durabilidade inválida: {durabilidade}")
+        self.db_path = db_path
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.durabilidade = durabilidade
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._fechado = False
+        self._lock = threading.Lock()
+        self._conn = None
+        self._thread = threading.Thread(target=self._escritor, name="registro-dialogos", daemon=True)
+        self._thread.start()
+        atexit.register(self.fechar)
+
+    def _enfileirar(self, item, futuro):
+        # Sob o lock: nada entra na fila depois de fechar(). Fila cheia bloqueia
+        # o chamador (contrapressão em vez de perder mensagens) até TEMPO_ESPERA.
+        with self._lock:
+            if self._fechado:
+                raise RuntimeError("Registro de diálogos já foi encerrado")
+            try:
+                self._fila.put((item, futuro), timeout=TEMPO_ESPERA)
+            except queue.Full:
+                raise TimeoutError("Fila do registro de diálogos cheia") from None
+
+    def registrar(self, autor, mensagem, sessao=None):
+        item = (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), autor, mensagem, sessao)
+        if self.durabilidade == "imediata":
+            futuro = Future()
+            self._enfileirar(item, futuro)
+            futuro.result(timeout=TEMPO_ESPERA)
+        else:
+            self._enfileirar(item, None)
+
+    def descarregar(self):
+        # Espera até tudo o que já foi registrado estar gravado
+        futuro = Future()
+        try:
+            self._enfileirar(None, futuro)
+        except RuntimeError:
+            return
+        futuro.result(timeout=TEMPO_ESPERA)
+
+    def fechar(self):
+        with self._lock:
+            if self._fechado:
+                return
+            self._fechado = True
+            self._fila.put((_PARAR, None))
+        self._thread.join(TEMPO_ESPERA)
+
+    def _gravar(self, linhas):
+        # Devolve None se o lote foi gravado ou a exceção que o impediu
+        for tentativa in range(TENTATIVAS):
+            try:
+                if self._conn is None:
+                    self._conn = conectar(self.db_path)
+                self._conn.executemany(
+                    "INSERT INTO dialogos (timestamp, autor, mensagem, sessao) VALUES (?, ?, ?, ?)",
+                    linhas
+                )
+                self._conn.commit()
+                return None
+            except Exception as e:
+                if self._conn is not None and self._conn.in_transaction:
+                    self._conn.rollback()
+                if not isinstance(e, sqlite3.OperationalError) or tentativa == TENTATIVAS - 1:
+                    print(f"⚠️ {len(linhas)} mensagens não foram gravadas em dialogos: {e}")
+                    return e
+                time.sleep(0.05 * 2 ** tentativa)
+
+    @staticmethod
+    def _avisar(lote, erro):
+        for _, futuro in lote:
+            if futuro is None:
+                continue
+            if erro is None:
+                futuro.set_result(None)
+            else:
+                futuro.set_exception(erro)
+
+    def _proximo_lote(self, primeiro):
+        lote = [primeiro]
+        # Com alguém esperando o commit, não se espera o lote encher:
+        # grava o que já está na fila e libera
+        aguardando = primeiro[1] is not None
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.tamanho_lote and primeiro[0] is not _PARAR:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                if aguardando:
+                    item = self._fila.get_nowait()
+                else:
+                    item = self._fila.get(timeout=restante)
+            except queue.Empty:
+                break
+            lote.append(item)
+            aguardando = aguardando or item[1] is not None
+            if item[0] is _PARAR:
+                break
+        return lote
+
+    def _escritor(self):
+        parar = False
+        while not parar:
+            try:
+                primeiro = self._fila.get(timeout=self.intervalo)
+            except queue.Empty:
+                continue
+            lote = [primeiro]
+            try:
+                lote = self._proximo_lote(primeiro)
+                linhas = [item for item, _ in lote if item is not None and item is not _PARAR]
+                erro = self._gravar(linhas) if linhas else None
+            except Exception as e:
+                # A thread não pode morrer: quem espera este lote recebe o erro
+                erro = e
+            self._avisar(lote, erro)
+            parar = any(item is _PARAR for item, _ in lote)
+        # Mensagens que entraram antes do pedido de parada e ficaram atrás dele
+        restantes = []
+        while True:
+            try:
+                restantes.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        linhas = [item for item, _ in restantes if item is not None and item is not _PARAR]
+        self._avisar(restantes, self._gravar(linhas) if linhas else None)
+        if self._conn is not None:
+            self._conn.close()
+
+
+_registros = {}
+_registros_lock = threading.Lock()
+
+
+def obter_registro(db_path):
+    chave = os.path.abspath(db_path)
+    with _registros_lock:
+        if chave not in _registros:
+            _registros[chave] = RegistroDialogos(db_path)
+        return _registros[chave]
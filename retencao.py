@@ -0,0 +1,280 @@
+# Retenção dos registros antigos: dialogos e consultas passadas vão para um
+# banco de arquivo (por padrão clinica_arquivo.db, ao lado do principal) e o
+# banco principal é compactado aos poucos (auto_vacuum=INCREMENTAL).
+# Cada lote é movido em duas transações curtas, uma por banco: primeiro a cópia
+# no arquivo, depois a remoção no principal. Em WAL uma transação que escreve em
+# dois bancos anexados não é atômica no conjunto; assim, uma queda no meio deixa
+# no máximo linhas repetidas (resolvidas na próxima execução), nunca perdidas.
+# Entre os lotes há uma pausa para os escritores do site e do chatbot.
+# De cada paciente fica sempre a consulta mais recente no banco principal: as
+# telas de pendentes/agendados e os atestados dependem dela.
+# Uso: python retencao.py [banco] [--dias-dialogos N] [--dias-consultas N] [--sem-compactar]
+#      python retencao.py [banco] --restaurar dialogos|consulta [--sessao S] [--paciente ID] [--de DATA] [--ate DATA]
+#      python retencao.py [banco] --agendar [--intervalo-horas H]
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import tarefas
+from conexao import conectar
+
+DB_PATH = "clinica.db"
+TIPO = "retencao"
+DIAS_DIALOGOS = 180
+DIAS_CONSULTAS = 365
+INTERVALO_HORAS = 24  # intervalo entre execuções da tarefa agendada
+LOTE = 500  # linhas por transação
+PAUSA = 0.05  # segundos entre lotes, para os escritores do app
+PAGINAS_POR_PASSO = 256  # páginas devolvidas por passo do incremental_vacuum
+PASSOS_MERGE_FTS = 500  # páginas escritas por passo do 'merge' do FTS5
+FORMATO = "%Y-%m-%d %H:%M:%S"
+AUTO_VACUUM_INCREMENTAL = 2
+
+# tabela: (coluna de data, condição extra para arquivar)
+ARQUIVAVEIS = {
+    "dialogos": ("timestamp", ""),
+    "consulta": ("data_hora", """
+        AND EXISTS (SELECT 1 FROM main.consulta n
+                    WHERE n.id_paciente = t.id_paciente AND n.data_hora > t.data_hora)
+    """),
+}
+# tabela: índice FTS5 que acompanha a tabela (mantido pelos triggers)
+FTS = {"dialogos": "dialogos_fts"}
+# Índices das buscas de restauração no arquivo
+INDICES_ARQUIVO = {
+    "dialogos": {"idx_dialogos_sessao": "sessao, id", "idx_dialogos_data": "timestamp"},
+    "consulta": {"idx_consulta_paciente": "id_paciente", "idx_consulta_data": "data_hora"},
+}
+
+
+def caminho_arquivo(db_path):
+    raiz, extensao = os.path.splitext(db_path)
+    return f"{raiz}_arquivo{extensao or '.db'}"
+
+
+def _caminho_principal(conn):
+    for _, nome, arquivo in conn.execute("PRAGMA database_list"):
+        if nome == "main":
+            return arquivo
+
+
+def _existe(conn, esquema, nome):
+    return conn.execute(
+        f"SELECT 1 FROM {esquema}.sqlite_master WHERE name=?", (nome,)
+    ).fetchone() is not None
+
+
+def _colunas(conn, tabela):
+    return [c["name"] for c in conn.execute(f"PRAGMA main.table_info({tabela})")]
+
+
+def anexar(conn, arquivo):
+    # Anexa o banco de arquivo como "arquivo" e cria nele as tabelas que faltam,
+    # com as colunas da tabela principal e a data do arquivamento
+    conn.execute("ATTACH DATABASE ? AS arquivo", (arquivo,))
+    for tabela in ARQUIVAVEIS:
+        if not _existe(conn, "main", tabela):
+            continue
+        definicoes = [
+            f"{c['name']} {c['type']}" + (" PRIMARY KEY" if c["pk"] else "")
+            for c in conn.execute(f"PRAGMA main.table_info({tabela})")
+        ]
+        conn.execute(f"CREATE TABLE IF NOT EXISTS arquivo.{tabela} ({', '.join(definicoes)}, arquivado_em TEXT)")
+        for indice, colunas in INDICES_ARQUIVO[tabela].items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS arquivo.{indice} ON {tabela} ({colunas})")
+    conn.commit()
+
+
+def _mover(conn, tabela, origem, destino, seletor, params, lote, pausa, arquivado_em=None):
+    # Move em lotes as linhas de origem.tabela cujos ids o seletor devolve
+    # (percorrendo por id a partir de :ultimo); devolve quantas foram movidas
+    colunas = ", ".join(_colunas(conn, tabela))
+    if arquivado_em is not None:
+        inserir = (f"INSERT OR REPLACE INTO {destino}.{tabela} ({colunas}, arquivado_em) "
+                   f"SELECT {colunas}, ? FROM {origem}.{tabela} WHERE id IN ({{}})")
+    else:
+        inserir = (f"INSERT OR IGNORE INTO {destino}.{tabela} ({colunas}) "
+                   f"SELECT {colunas} FROM {origem}.{tabela} WHERE id IN ({{}})")
+    extra = () if arquivado_em is None else (arquivado_em,)
+    ultimo, total = 0, 0
+    while True:
+        ids = [i for (i,) in conn.execute(seletor, {**params, "ultimo": ultimo, "lote": lote})]
+        if not ids:
+            break
+        ultimo = ids[-1]
+        marcadores = ",".join("?" * len(ids))
+        # Cada transação escreve em um banco só; BEGIN (adiado) não trava o outro
+        for comando, valores in (
+            (inserir.format(marcadores), (*extra, *ids)),
+            (f"DELETE FROM {origem}.{tabela} WHERE id IN ({marcadores})", ids),
+        ):
+            conn.execute("BEGIN")
+            try:
+                conn.execute(comando, valores)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        total += len(ids)
+        time.sleep(pausa)
+    return total
+
+
+def arquivar(conn, dias_dialogos=DIAS_DIALOGOS, dias_consultas=DIAS_CONSULTAS, lote=LOTE, pausa=PAUSA):
+    # Move para o arquivo (já anexado) o que passou do prazo; devolve {tabela: linhas}
+    prazos = {"dialogos": dias_dialogos, "consulta": dias_consultas}
+    movidas = {}
+    for tabela, (coluna, condicao) in ARQUIVAVEIS.items():
+        if prazos[tabela] is None or not _existe(conn, "main", tabela):
+            continue
+        corte = (datetime.now() - timedelta(days=prazos[tabela])).strftime(FORMATO)
+        seletor = f"""
+            SELECT t.id FROM main.{tabela} t
+            WHERE t.id > :ultimo AND t.{coluna} < :corte {condicao}
+            ORDER BY t.id LIMIT :lote
+        """
+        movidas[tabela] = _mover(conn, tabela, "main", "arquivo", seletor, {"corte": corte}, lote, pausa,
+                                 arquivado_em=datetime.now().strftime(FORMATO))
+    return movidas
+
+
+def restaurar(conn, tabela, sessao=None, id_paciente=None, de=None, ate=None, lote=LOTE, pausa=PAUSA):
+    # Devolve ao banco principal as linhas arquivadas que atendem aos filtros
+    # (os triggers de FTS e de versão da agenda rodam como num INSERT comum)
+    if tabela not in ARQUIVAVEIS:
+        raise ValueError(f"tabela não arquivável: {tabela}")
+    if not _existe(conn, "arquivo", tabela):
+        return 0
+    coluna = ARQUIVAVEIS[tabela][0]
+    filtros, params = [], {}
+    if sessao is not None:
+        filtros.append("sessao = :sessao")
+        params["sessao"] = sessao
+    if id_paciente is not None:
+        filtros.append("id_paciente = :id_paciente")
+        params["id_paciente"] = id_paciente
+    if de is not None:
+        filtros.append(f"{coluna} >= :de")
+        params["de"] = de
+    if ate is not None:
+        filtros.append(f"{coluna} < :ate")
+        params["ate"] = ate
+    seletor = f"""
+        SELECT id FROM arquivo.{tabela}
+        WHERE id > :ultimo {''.join(' AND ' + f for f in filtros)}
+        ORDER BY id LIMIT :lote
+    """
+    return _mover(conn, tabela, "arquivo", "main", seletor, params, lote, pausa)
+
+
+def compactar(conn, paginas=PAGINAS_POR_PASSO, pausa=PAUSA):
+    # Enxuga os índices FTS e devolve ao sistema as páginas livres do banco
+    # principal; devolve quantas páginas foram liberadas
+    for fts in FTS.values():
+        if not _existe(conn, "main", fts):
+            continue
+        # 'merge' em passos curtos até não haver mais o que juntar (doc. do FTS5)
+        while True:
+            mudancas = conn.total_changes
+            conn.execute(f"INSERT INTO main.{fts} ({fts}, rank) VALUES ('merge', ?)", (PASSOS_MERGE_FTS,))
+            conn.commit()
+            if conn.total_changes - mudancas < 2:
+                break
+            time.sleep(pausa)
+
+    antes = conn.execute("PRAGMA main.page_count").fetchone()[0]
+    if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        # Só na primeira vez: mudar o modo exige reescrever o banco inteiro
+        conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM main")
+    while conn.execute("PRAGMA main.freelist_count").fetchone()[0]:
+        # Cada passo é uma transação curta; o fetchall executa o pragma até o fim
+        conn.execute(f"PRAGMA main.incremental_vacuum({int(paginas)})").fetchall()
+        time.sleep(pausa)
+    conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA main.optimize")
+    return antes - conn.execute("PRAGMA main.page_count").fetchone()[0]
+
+
+def executar_retencao(db_path, arquivo=None, dias_dialogos=DIAS_DIALOGOS, dias_consultas=DIAS_CONSULTAS,
+                      compactar_banco=True):
+    # Conexão própria: ATTACH e VACUUM não devem passar pelas conexões do pool
+    conn = conectar(db_path)
+    try:
+        anexar(conn, arquivo or caminho_arquivo(db_path))
+        movidas = arquivar(conn, dias_dialogos, dias_consultas)
+        conn.execute("DETACH DATABASE arquivo")
+        liberadas = compactar(conn) if compactar_banco else 0
+    finally:
+        conn.close()
+    return movidas, liberadas
+
+
+@tarefas.tratador(TIPO)
+def tarefa_retencao(conn, arquivo=None, dias_dialogos=DIAS_DIALOGOS, dias_consultas=DIAS_CONSULTAS,
+                    intervalo_horas=INTERVALO_HORAS):
+    # Roda a retenção e agenda a próxima execução
+    movidas, liberadas = executar_retencao(_caminho_principal(conn), arquivo, dias_dialogos, dias_consultas)
+    agendar(conn, arquivo, dias_dialogos, dias_consultas, intervalo_horas, atraso=intervalo_horas * 3600)
+    conn.commit()
+    return f"{movidas}, {liberadas} página(s) liberada(s)"
+
+
+def agendar(conn, arquivo=None, dias_dialogos=DIAS_DIALOGOS, dias_consultas=DIAS_CONSULTAS,
+            intervalo_horas=INTERVALO_HORAS, atraso=0):
+    # Sem commit. A chave muda a cada execução (a tarefa em andamento ainda está
+    # ativa com a chave anterior); só uma execução fica pendente por vez.
+    if conn.execute(
+        "SELECT 1 FROM tarefas WHERE tipo = ? AND estado = ?", (TIPO, tarefas.PENDENTE)
+    ).fetchone():
+        return None
+    argumentos = {"arquivo": arquivo, "dias_dialogos": dias_dialogos, "dias_consultas": dias_consultas,
+                  "intervalo_horas": intervalo_horas}
+    chave = (datetime.now() + timedelta(seconds=atraso)).strftime(FORMATO)
+    return tarefas.enfileirar(conn, TIPO, argumentos, chave=chave, atraso=atraso)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquivamento de dialogos e consultas antigas.")
+    parser.add_argument("banco", nargs="?", default=DB_PATH)
+    parser.add_argument("--arquivo", help="banco de arquivo (padrão: <banco>_arquivo.db)")
+    parser.add_argument("--dias-dialogos", type=int, default=DIAS_DIALOGOS)
+    parser.add_argument("--dias-consultas", type=int, default=DIAS_CONSULTAS)
+    parser.add_argument("--sem-compactar", action="store_true")
+    parser.add_argument("--restaurar", choices=sorted(ARQUIVAVEIS))
+    parser.add_argument("--sessao")
+    parser.add_argument("--paciente", type=int)
+    parser.add_argument("--de", help="data inicial (AAAA-MM-DD)")
+    parser.add_argument("--ate", help="data final, exclusiva (AAAA-MM-DD)")
+    parser.add_argument("--agendar", action="store_true", help="enfileira a retenção periódica na fila de tarefas")
+    parser.add_argument("--intervalo-horas", type=float, default=INTERVALO_HORAS)
+    args = parser.parse_args()
+    arquivo = args.arquivo or caminho_arquivo(args.banco)
+
+    if args.agendar:
+        conn = conectar(args.banco)
+        tarefas.criar_esquema(conn)
+        id_tarefa = agendar(conn, args.arquivo, args.dias_dialogos, args.dias_consultas, args.intervalo_horas)
+        conn.commit()
+        conn.close()
+        print(f"✅ Retenção agendada (tarefa {id_tarefa})." if id_tarefa else "ℹ️ Já havia uma retenção pendente.")
+    elif args.restaurar:
+        conn = conectar(args.banco)
+        try:
+            anexar(conn, arquivo)
+            n = restaurar(conn, args.restaurar, args.sessao, args.paciente, args.de, args.ate)
+        finally:
+            conn.close()
+        print(f"✅ {n} linha(s) de {args.restaurar} restaurada(s) de {arquivo}.")
+    else:
+        movidas, liberadas = executar_retencao(
+            args.banco, arquivo, args.dias_dialogos, args.dias_consultas, not args.sem_compactar
+        )
+        for tabela, n in movidas.items():
+            print(f"✅ {n} linha(s) de {tabela} arquivada(s) em {arquivo}.")
+        print(f"🧹 {liberadas} página(s) devolvida(s) ao sistema.")
+
+
+if __name__ == "__main__":
+    main()
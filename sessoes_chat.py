@@ -0,0 +1,104 @@
+# Uma sessão de chat com o modelo por conversa, em vez de um chat global.
+# As sessões ficam num LRU com expiração por inatividade (TTL), limite de
+# quantidade e limite de memória (caracteres do contexto que cada conversa mantém,
+# medidos depois de cada turno; ver ConversaLimitada.tamanho).
+# Mensagens da mesma conversa são serializadas por um lock da sessão; conversas
+# diferentes chamam o modelo em paralelo, até o limite de chamadas simultâneas.
+import threading
+import time
+from collections import OrderedDict
+
+MAX_SESSOES = 1000
+TTL_SESSAO = 30 * 60  # segundos sem uso até a sessão expirar
+MAX_CARACTERES = 20_000_000  # soma dos contextos mantidos em memória
+MAX_CHAMADAS_SIMULTANEAS = 16
+
+
+class Sessao:
+    def __init__(self, chat):
+        self.chat = chat
+        self.lock = threading.Lock()
+        self.ultimo_uso = time.monotonic()
+        self.caracteres = 0
+
+
+class GerenciadorSessoes:
+    def __init__(self, fabrica_chat, max_sessoes=MAX_SESSOES, ttl=TTL_SESSAO,
+                 max_caracteres=MAX_CARACTERES, max_chamadas=MAX_CHAMADAS_SIMULTANEAS):
+        # fabrica_chat() cria o objeto de chat (send_message, fixar, tamanho) de uma nova conversa
+        self.fabrica_chat = fabrica_chat
+        self.max_sessoes = max_sessoes
+        self.ttl = ttl
+        self.max_caracteres = max_caracteres
+        self._sessoes = OrderedDict()
+        self._lock = threading.Lock()
+        self._chamadas = threading.BoundedSemaphore(max_chamadas)
+        self.caracteres = 0
+
+    def __len__(self):
+        return len(self._sessoes)
+
+    def _remover(self, sessao_id):
+        sessao = self._sessoes.pop(sessao_id)
+        self.caracteres -= sessao.caracteres
+
+    def _despejar(self):
+        # Chamado com self._lock: expiradas primeiro, depois as menos usadas
+        agora = time.monotonic()
+        for sessao_id in [s for s, v in self._sessoes.items() if agora - v.ultimo_uso > self.ttl]:
+            self._remover(sessao_id)
+        while self._sessoes and (len(self._sessoes) > self.max_sessoes
+                                 or self.caracteres > self.max_caracteres):
+            self._remover(next(iter(self._sessoes)))
+
+    def obter(self, sessao_id):
+        with self._lock:
+            sessao = self._sessoes.get(sessao_id)
+            if sessao is None:
+                sessao = Sessao(self.fabrica_chat())
+                self._sessoes[sessao_id] = sessao
+            else:
+                self._sessoes.move_to_end(sessao_id)
+            sessao.ultimo_uso = time.monotonic()
+            self._despejar()
+            return sessao
+
+    def _contabilizar(self, sessao_id, sessao):
+        # Remede o contexto que a conversa mantém (o histórico antigo já virou resumo)
+        caracteres = sessao.chat.tamanho()
+        with self._lock:
+            diferenca = caracteres - sessao.caracteres
+            sessao.caracteres = caracteres
+            if self._sessoes.get(sessao_id) is sessao:
+                self.caracteres += diferenca
+                self._despejar()
+
+    def fixar(self, sessao_id, campo, valor):
+        # Guarda um dado já coletado como estado fixo da conversa (ver contexto_chat.py)
+        sessao = self.obter(sessao_id)
+        with sessao.lock:
+            sessao.chat.fixar(campo, valor)
+        self._contabilizar(sessao_id, sessao)
+
+    def campos_fixados(self, sessao_id):
+        # Dados já fixados na conversa; vazio se a sessão não existe (nova ou despejada)
+        with self._lock:
+            sessao = self._sessoes.get(sessao_id)
+        return set(sessao.chat.campos) if sessao is not None else set()
+
+    def enviar(self, sessao_id, mensagem):
+        # Resposta completa do modelo (texto)
+        sessao = self.obter(sessao_id)
+        with sessao.lock, self._chamadas:
+            resposta = sessao.chat.send_message(mensagem)
+            texto = resposta if isinstance(resposta, str) else getattr(resposta, "text", str(resposta))
+        self._contabilizar(sessao_id, sessao)
+        return texto
+
+    def enviar_stream(self, sessao_id, mensagem):
+        # Gera os trechos da resposta conforme o modelo os produz
+        sessao = self.obter(sessao_id)
+        with sessao.lock, self._chamadas:
+            for trecho in sessao.chat.send_message(mensagem, stream=True):
+                yield getattr(trecho, "text", "") or ""
+        self._contabilizar(sessao_id, sessao)
@@ -0,0 +1,74 @@
+// Camada de UBS carregada sob demanda em /api/ubs conforme o mapa se move.
+// A janela pedida é alinhada à mesma grade do servidor (mapa_ubs.py), então
+// janelas próximas repetem a URL e o navegador reaproveita a resposta (ETag).
+var CELULAS_POR_TILE = 4;  // igual a mapa_ubs.CELULAS_POR_TILE
+
+function janelaAlinhada(map) {
+    // Mesma regra de mapa_ubs.alinhar_janela
+    var celula = 360 / Math.pow(2, map.getZoom()) / CELULAS_POR_TILE;
+    var b = map.getBounds();
+    var j0 = Math.floor((b.getWest() + 180) / celula), i0 = Math.floor((b.getSouth() + 90) / celula);
+    var j1 = Math.max(j0 + 1, Math.ceil((b.getEast() + 180) / celula));
+    var i1 = Math.max(i0 + 1, Math.ceil((b.getNorth() + 90) / celula));
+    return [j0 * celula - 180, i0 * celula - 90, j1 * celula - 180, i1 * celula - 90]
+        .map(function(v) { return v.toFixed(6); }).join(',');
+}
+
+function textoPopup(p) {
+    // Nome e endereço como texto (nunca como HTML)
+    var div = document.createElement('div');
+    var nome = document.createElement('strong');
+    nome.textContent = p.nome;
+    div.appendChild(nome);
+    if (p.endereco) {
+        div.appendChild(document.createElement('br'));
+        div.appendChild(document.createTextNode(p.endereco));
+    }
+    return div;
+}
+
+function camadaUbs(map, opcoes) {
+    // opcoes: icone (L.icon das unidades), ignorar (ids já desenhados pela página),
+    // aoCarregar(marcadores) chamado a cada carga com {id: marcador}
+    opcoes = opcoes || {};
+    var camada = L.layerGroup().addTo(map);
+    var marcadores = {};
+    var pedido = 0;
+
+    function carregar() {
+        var atual = ++pedido;
+        var url = '/api/ubs?bbox=' + janelaAlinhada(map) + '&zoom=' + map.getZoom();
+        fetch(url, {credentials: 'same-origin'})
+            .then(function(r) { return r.ok ? r.json() : null; })
+            .then(function(dados) {
+                if (!dados || atual !== pedido) return;  // resposta de uma janela antiga
+                camada.clearLayers();
+                marcadores = {};
+                dados.features.forEach(function(f) {
+                    var latlng = [f.geometry.coordinates[1], f.geometry.coordinates[0]];
+                    var p = f.properties;
+                    if (p.grupo) {
+                        var grupo = L.marker(latlng, {icon: L.divIcon({
+                            className: '',
+                            html: '<div style="background:#2E7D32;color:#fff;border-radius:50%;width:36px;height:36px;' +
+                                  'line-height:36px;text-align:center;font-weight:bold;">' + p.quantidade + '</div>',
+                            iconSize: [36, 36]
+                        })});
+                        grupo.on('click', function() { map.setView(latlng, map.getZoom() + 2); });
+                        camada.addLayer(grupo);
+                    } else if (!(opcoes.ignorar || []).includes(p.id)) {
+                        var m = L.marker(latlng, opcoes.icone ? {icon: opcoes.icone} : {}).bindPopup(textoPopup(p));
+                        marcadores[p.id] = m;
+                        camada.addLayer(m);
+                    }
+                });
+                if (opcoes.aoCarregar) opcoes.aoCarregar(marcadores);
+            });
+    }
+
+    map.on('moveend', carregar);
+    carregar();
+    return {
+        marcador: function(id) { return marcadores[id]; }
+    };
+}
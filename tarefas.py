@@ -0,0 +1,277 @@
+# Fila persistente de tarefas em segundo plano (tabela tarefas no próprio banco).
+# Quem grava um registro enfileira a tarefa na mesma transação; um trabalhador
+# (threads no processo do site, ou `python tarefas.py` avulso) reserva as
+# pendentes com BEGIN IMMEDIATE, então vários processos podem consumir a mesma
+# fila sem executar uma tarefa duas vezes. Falhas voltam para a fila com espera
+# exponencial até MAX_TENTATIVAS; tarefas presas em "executando" (processo
+# encerrado no meio) voltam para a fila depois de TEMPO_LIMITE.
+# Uso: python tarefas.py [banco] [--uma-vez]
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from conexao import conexao
+from metricas import TAREFAS, registrar
+
+DB_PATH = "clinica.db"
+PENDENTE, EXECUTANDO, CONCLUIDA, FALHOU = "pendente", "executando", "concluida", "falhou"
+MAX_TENTATIVAS = 5
+ESPERA_BASE = 2  # segundos antes da 2ª tentativa; dobra a cada falha
+ESPERA_MAXIMA = 300
+TEMPO_LIMITE = 600  # segundos em "executando" até a tarefa ser considerada abandonada
+INTERVALO_CONSULTA = 2.0  # segundos entre consultas à fila quando ela está vazia
+TRABALHADORES = 2
+FORMATO = "%Y-%m-%d %H:%M:%S"
+MAX_CARACTERES_ERRO = 2000
+
+# tipo -> função(conn, **argumentos) que devolve um resultado opcional (texto)
+TRATADORES = {}
+
+
+def tratador(tipo):
+    def registrar_tratador(funcao):
+        TRATADORES[tipo] = funcao
+        return funcao
+    return registrar_tratador
+
+
+def _agora(deslocamento=0):
+    return (datetime.now() + timedelta(seconds=deslocamento)).strftime(FORMATO)
+
+
+def criar_esquema(conn):
+    # Sem commit: roda dentro da transação da migração
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tarefas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            chave TEXT,
+            argumentos TEXT NOT NULL DEFAULT '{}',
+            estado TEXT NOT NULL DEFAULT 'pendente',
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            max_tentativas INTEGER NOT NULL DEFAULT 5,
+            executar_em TEXT NOT NULL,
+            criada_em TEXT NOT NULL,
+            iniciada_em TEXT,
+            concluida_em TEXT,
+            resultado TEXT,
+            erro TEXT
+        )
+    """)
+    # Próxima tarefa: pendentes pela ordem de execução
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_fila ON tarefas (estado, executar_em)")
+    # No máximo uma tarefa ativa por (tipo, chave): enfileirar de novo não duplica
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_tarefas_ativas ON tarefas (tipo, chave)
+        WHERE chave IS NOT NULL AND estado IN ('pendente', 'executando')
+    """)
+
+
+def enfileirar(conn, tipo, argumentos=None, chave=None, atraso=0, max_tentativas=MAX_TENTATIVAS):
+    # Sem commit: entra na transação de quem chamou. Devolve o id da tarefa ou
+    # None se já havia uma tarefa ativa com o mesmo tipo e chave.
+    agora = _agora()
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO tarefas (tipo, chave, argumentos, max_tentativas, executar_em, criada_em) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (tipo, chave, json.dumps(argumentos or {}, ensure_ascii=False), max_tentativas, _agora(atraso), agora)
+    )
+    return cursor.lastrowid if cursor.rowcount else None
+
+
+def _espera(tentativas):
+    return min(ESPERA_MAXIMA, ESPERA_BASE * 2 ** (tentativas - 1))
+
+
+def reservar(conn, tipos):
+    # Marca a próxima tarefa pendente de um dos tipos como "executando" e a devolve
+    if not tipos:
+        return None
+    marcadores = ",".join("?" * len(tipos))
+    agora = _agora()
+    limite = _agora(-TEMPO_LIMITE)
+    # Leitura antes do lock de escrita: fila vazia não disputa o banco com o app
+    if conn.execute(f"""
+        SELECT EXISTS (SELECT 1 FROM tarefas WHERE estado = ? AND executar_em <= ? AND tipo IN ({marcadores}))
+            OR EXISTS (SELECT 1 FROM tarefas WHERE estado = ? AND iniciada_em < ?)
+    """, (PENDENTE, agora, *tipos, EXECUTANDO, limite)).fetchone()[0] == 0:
+        return None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Abandonadas voltam para a fila, ou falham se já gastaram as tentativas
+        conn.execute(
+            "UPDATE tarefas SET estado = ?, concluida_em = ?, erro = ? "
+            "WHERE estado = ? AND iniciada_em < ? AND tentativas >= max_tentativas",
+            (FALHOU, agora, "abandonada após a última tentativa", EXECUTANDO, limite)
+        )
+        conn.execute(
+            "UPDATE tarefas SET estado = ? WHERE estado = ? AND iniciada_em < ?",
+            (PENDENTE, EXECUTANDO, limite)
+        )
+        tarefa = conn.execute(f"""
+            SELECT id, tipo, argumentos, tentativas, max_tentativas FROM tarefas
+            WHERE estado = ? AND executar_em <= ? AND tipo IN ({marcadores})
+            ORDER BY executar_em, id LIMIT 1
+        """, (PENDENTE, agora, *tipos)).fetchone()
+        if tarefa is not None:
+            conn.execute(
+                "UPDATE tarefas SET estado = ?, tentativas = tentativas + 1, iniciada_em = ? WHERE id = ?",
+                (EXECUTANDO, agora, tarefa["id"])
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return tarefa
+
+
+def executar(conn, tarefa):
+    # Roda o tratador e grava o desfecho: concluída, de volta à fila ou falhou
+    inicio = time.perf_counter()
+    tentativas = tarefa["tentativas"] + 1
+    try:
+        resultado = TRATADORES[tarefa["tipo"]](conn, **json.loads(tarefa["argumentos"]))
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        erro = "".join(traceback.format_exception_only(type(e), e)).strip()[:MAX_CARACTERES_ERRO]
+        if tentativas >= tarefa["max_tentativas"]:
+            conn.execute("UPDATE tarefas SET estado = ?, concluida_em = ?, erro = ? WHERE id = ?",
+                         (FALHOU, _agora(), erro, tarefa["id"]))
+            desfecho = FALHOU
+        else:
+            conn.execute("UPDATE tarefas SET estado = ?, executar_em = ?, erro = ? WHERE id = ?",
+                         (PENDENTE, _agora(_espera(tentativas)), erro, tarefa["id"]))
+            desfecho = "repetir"
+    else:
+        conn.execute("UPDATE tarefas SET estado = ?, concluida_em = ?, resultado = ?, erro = NULL WHERE id = ?",
+                     (CONCLUIDA, _agora(), None if resultado is None else str(resultado), tarefa["id"]))
+        desfecho = CONCLUIDA
+    conn.commit()
+    registrar(TAREFAS, time.perf_counter() - inicio, tarefa["tipo"], desfecho)
+    return desfecho
+
+
+def processar_pendentes(conn, limite=None):
+    # Executa as tarefas prontas até a fila esvaziar (ou até `limite`); devolve quantas
+    feitas = 0
+    while limite is None or feitas < limite:
+        tarefa = reservar(conn, list(TRATADORES))
+        if tarefa is None:
+            break
+        executar(conn, tarefa)
+        feitas += 1
+    return feitas
+
+
+class Trabalhador:
+    # Threads que consomem a fila do banco; despertar() encurta a espera
+    # quando uma tarefa acabou de ser enfileirada neste processo
+    def __init__(self, db_path, threads=TRABALHADORES, intervalo=INTERVALO_CONSULTA):
+        self.db_path = db_path
+        self.intervalo = intervalo
+        self._evento = threading.Event()
+        self._parar = False
+        self._threads = [
+            threading.Thread(target=self._laco, name=f"tarefas-{i}", daemon=True) for i in range(threads)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def despertar(self):
+        self._evento.set()
+
+    def _laco(self):
+        while not self._parar:
+            try:
+                with conexao(self.db_path) as conn:
+                    feitas = processar_pendentes(conn, limite=1)
+            except Exception as e:
+                print(f"⚠️ Erro na fila de tarefas: {e}")
+                feitas = 0
+            if not feitas:
+                self._evento.wait(self.intervalo)
+                self._evento.clear()
+
+    def parar(self, timeout=5):
+        self._parar = True
+        self._evento.set()
+        for t in self._threads:
+            t.join(timeout)
+
+
+def resumo(conn, limite=20):
+    # Contagem por tipo e estado, idade da pendente mais antiga e últimas falhas
+    contagem = {}
+    for linha in conn.execute("SELECT tipo, estado, count(*) AS n FROM tarefas GROUP BY tipo, estado"):
+        contagem.setdefault(linha["tipo"], {})[linha["estado"]] = linha["n"]
+    mais_antiga = conn.execute(
+        "SELECT min(criada_em) FROM tarefas WHERE estado = ?", (PENDENTE,)
+    ).fetchone()[0]
+    recentes = conn.execute("""
+        SELECT id, tipo, chave, estado, tentativas, max_tentativas, executar_em, criada_em,
+               iniciada_em, concluida_em, resultado, erro
+        FROM tarefas ORDER BY id DESC LIMIT ?
+    """, (limite,)).fetchall()
+    falhas = conn.execute("""
+        SELECT id, tipo, chave, tentativas, concluida_em, erro FROM tarefas
+        WHERE estado = ? ORDER BY id DESC LIMIT ?
+    """, (FALHOU, limite)).fetchall()
+    return {
+        "por_tipo": contagem,
+        "pendente_mais_antiga": mais_antiga,
+        "recentes": [dict(t) for t in recentes],
+        "falhas": [dict(t) for t in falhas],
+    }
+
+
+_trabalhadores = {}
+_trabalhadores_lock = threading.Lock()
+
+
+def iniciar_trabalhador(db_path, threads=TRABALHADORES):
+    # Um trabalhador por banco (caminho absoluto) e por processo
+    chave = os.path.abspath(db_path)
+    with _trabalhadores_lock:
+        if chave not in _trabalhadores:
+            _trabalhadores[chave] = Trabalhador(db_path, threads)
+        return _trabalhadores[chave]
+
+
+def despertar(db_path):
+    # Chamado depois do commit que enfileirou: o trabalhador não espera o intervalo
+    trabalhador = _trabalhadores.get(os.path.abspath(db_path))
+    if trabalhador is not None:
+        trabalhador.despertar()
+
+
+@atexit.register
+def parar_trabalhadores():
+    with _trabalhadores_lock:
+        for trabalhador in _trabalhadores.values():
+            trabalhador.parar()
+        _trabalhadores.clear()
+
+
+if __name__ == "__main__":
+    import enriquecimento  # registra o tratador de enriquecimento de pacientes
+    import retencao  # e o da retenção periódica
+
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    caminho = args[0] if args else DB_PATH
+    if "--uma-vez" in sys.argv:
+        with conexao(caminho) as conn:
+            print(f"✅ {processar_pendentes(conn)} tarefa(s) executada(s)")
+    else:
+        print(f"🔄 Processando a fila de tarefas de {caminho} (Ctrl+C para sair)")
+        iniciar_trabalhador(caminho)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass